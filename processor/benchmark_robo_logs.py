@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for parsing the robocopy log files and writing them to the database.
+
+Synthetic log files (see make_robo_logs.py) are written to a temporary folder,
+then process_park(), the database writers, and a full main() run are timed.
+The results are saved in the results database (see the Config object), and
+compared with the previous run with the same options and python version, so a
+change that makes the processor slower is easy to see.
+
+Edit the Config object below as needed for each execution.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import make_robo_logs
+import process_robo_logs
+
+# pylint: disable=broad-except
+# pylint: disable=too-many-locals
+
+
+class Config(object):
+    """Namespace for configuration parameters."""
+
+    # pylint: disable=useless-object-inheritance,too-few-public-methods
+
+    # The database where the results of each run are saved.
+    results_path = "benchmark_results.db"
+
+    # The fixtures: the number of nights (one log file per park per night), and
+    # the number of files listed, and the error rate in each log file.
+    # The other options are in the make_robo_logs.Config object.
+    nights = 2
+    listed_files = 20000
+    error_rate = 0.02
+
+    # Each benchmark is run this many times, and the fastest time is kept.
+    repeat = 3
+
+    # A benchmark is reported as slower if its rate is less than the previous
+    # rate by more than this fraction.
+    slower_threshold = 0.2
+
+    # The log level of the messages from the processor that are shown.
+    log_level = logging.ERROR
+
+
+BENCHMARKS = ["process_park", "process_park_gzip", "write_park", "db_write_errors"]
+BENCHMARKS += ["main"]
+
+
+def make_fixtures(folder):
+    """Write the log files for the benchmarks in folder; see make_logs()."""
+
+    return make_robo_logs.make_logs(
+        folder,
+        nights=Config.nights,
+        listed_files=Config.listed_files,
+        error_rate=Config.error_rate,
+    )
+
+
+def best_time(func, args=(), setup=None):
+    """Return the fewest seconds to run func(*args) in Config.repeat tries.
+
+    setup() is called (and not timed) before each try.
+    """
+
+    times = []
+    for _ in range(Config.repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        func(*args)
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def parse_logs(fixtures):
+    """Parse each fixture with process_park(); return the logs."""
+
+    return [process_robo_logs.process_park(fixture["filename"]) for fixture in fixtures]
+
+
+def check_logs(fixtures, logs):
+    """Print the log files where process_park() did not find what was written."""
+
+    for fixture, log in zip(fixtures, logs):
+        errors = log["errors"]
+        found = (
+            len(errors),
+            sum(1 for error in errors if error["failed"]),
+            log["finished"],
+            log.get("stats", {}).get("files"),
+        )
+        expected = (
+            fixture["errors"],
+            fixture["failed"],
+            fixture["finished"],
+            fixture["files"],
+        )
+        if found != expected:
+            print(
+                "process_park() found {0}, expected {1} in {2}".format(
+                    found, expected, fixture["filename"]
+                )
+            )
+
+
+def bench_process_park(fixtures, _):
+    """Time process_park() for each fixture; return (count, unit, seconds)."""
+
+    check_logs(fixtures, parse_logs(fixtures))
+    lines = sum(fixture["lines"] for fixture in fixtures)
+    return lines, "lines", best_time(parse_logs, (fixtures,))
+
+
+def bench_process_park_gzip(fixtures, folder):
+    """Time process_park() for the compressed (archived) fixtures."""
+
+    gzip_folder = make_folder(folder, "gzip")
+    compressed = []
+    for fixture in fixtures:
+        fixture = dict(fixture)
+        filename = os.path.join(gzip_folder, os.path.basename(fixture["filename"]))
+        shutil.copy2(fixture["filename"], filename)
+        process_robo_logs.index_log(filename, True)
+        fixture["filename"] = filename + ".gz"
+        compressed.append(fixture)
+    return bench_process_park(compressed, folder)
+
+
+def write_logs(db_name, logs):
+    """Write the logs to the database in one transaction, like main()."""
+
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        for log in logs:
+            conn.execute("SAVEPOINT log_file")
+            process_robo_logs.write_park(conn, log["filename"], log)
+            conn.execute("RELEASE log_file")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def bench_write_park(fixtures, folder):
+    """Time write_park() for all the fixtures; return (count, unit, seconds)."""
+
+    logs = parse_logs(fixtures)
+    rows = sum(1 + len(log.get("stats", {})) + len(log["errors"]) for log in logs)
+    db_name = os.path.join(folder, "write_park.db")
+    seconds = best_time(
+        write_logs, (db_name, logs), lambda: process_robo_logs.clean_db(db_name)
+    )
+    return rows, "rows", seconds
+
+
+def write_errors(db_name, errors):
+    """Write the errors to the database in one transaction, and roll it back."""
+
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        process_robo_logs.db_write_errors(conn, errors, commit=False)
+        conn.execute("ROLLBACK")
+    finally:
+        conn.close()
+
+
+def bench_db_write_errors(fixtures, folder):
+    """Time db_write_errors() for the errors in all fixtures (all new messages)."""
+
+    errors = []
+    for log_id, log in enumerate(parse_logs(fixtures)):
+        for error in log["errors"]:
+            error["log"] = log_id + 1
+            errors.append(error)
+    db_name = os.path.join(folder, "write_errors.db")
+    process_robo_logs.clean_db(db_name)
+    return len(errors), "rows", best_time(write_errors, (db_name, errors))
+
+
+def make_folder(folder, name):
+    """Return the path to a new empty folder name in folder."""
+
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.mkdir(path)
+    return path
+
+
+def bench_main(fixtures, folder):
+    """Time main() (parse, write, archive, and compress) for all fixtures."""
+
+    log_folder = os.path.join(folder, "main")
+    db_name = os.path.join(folder, "main.db")
+
+    def setup():
+        make_folder(folder, "main")
+        for fixture in fixtures:
+            shutil.copy2(fixture["filename"], log_folder)
+        process_robo_logs.clean_db(db_name)
+
+    # Use the change log that was written with the fixtures.
+    change_log_path = process_robo_logs.Config.change_log_path
+    process_robo_logs.Config.change_log_path = os.path.join(
+        folder, "fixtures", make_robo_logs.Config.change_log_name
+    )
+    try:
+        seconds = best_time(process_robo_logs.main, (db_name, log_folder), setup)
+    finally:
+        process_robo_logs.Config.change_log_path = change_log_path
+    return sum(fixture["lines"] for fixture in fixtures), "lines", seconds
+
+
+def quiet_logging():
+    """Replace the log handlers (file, database, email) with the console."""
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setLevel(Config.log_level)
+    handler.setFormatter(logging.Formatter("%(name)-12s: %(levelname)-8s %(message)s"))
+    root.addHandler(handler)
+
+
+def git_commit():
+    """Return the id of the current git commit (None if it is not available)."""
+
+    try:
+        folder = os.path.dirname(os.path.abspath(__file__))
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=folder,
+            stderr=subprocess.STDOUT,
+        )
+        return output.decode("ascii").strip()
+    except Exception:
+        return None
+
+
+def db_create(database):
+    """Create the results tables in the database (if they do not exist)."""
+
+    database.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY,
+            started TEXT NOT NULL,
+            python TEXT NOT NULL,
+            platform TEXT,
+            git_commit TEXT,
+            options TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS results (
+            run_id INTEGER NOT NULL REFERENCES runs(run_id),
+            benchmark TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            unit TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            rate REAL NOT NULL
+        );
+        """
+    )
+
+
+def db_previous_rates(database, python, options):
+    """Return {benchmark: rate} for the last run with the same python and options."""
+
+    rows = database.execute(
+        """
+        SELECT benchmark, rate FROM results WHERE run_id = (
+            SELECT MAX(run_id) FROM runs WHERE python = ? AND options = ?
+        )
+        """,
+        (python, options),
+    ).fetchall()
+    return dict(rows)
+
+
+def db_write_run(database, started, python, options, results):
+    """Write a run and its results (a list of benchmark, count, unit, seconds)."""
+
+    cursor = database.cursor()
+    cursor.execute(
+        "INSERT INTO runs (started, python, platform, git_commit, options) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (started, python, platform.platform(), git_commit(), options),
+    )
+    run_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO results (run_id, benchmark, count, unit, seconds, rate) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (run_id, name, count, unit, seconds, count / seconds)
+            for name, count, unit, seconds in results
+        ],
+    )
+    database.commit()
+
+
+def run_options():
+    """Return the options that change the results (as JSON text)."""
+
+    options = {
+        "nights": Config.nights,
+        "parks": make_robo_logs.Config.parks,
+        "listed_files": Config.listed_files,
+        "error_rate": Config.error_rate,
+        "retry_rate": make_robo_logs.Config.retry_rate,
+        "encoding": make_robo_logs.Config.encoding,
+        "seed": make_robo_logs.Config.seed,
+        "repeat": Config.repeat,
+        "parse_processes": process_robo_logs.Config.parse_processes,
+        "error_batch_size": process_robo_logs.Config.error_batch_size,
+    }
+    return json.dumps(options, sort_keys=True)
+
+
+def benchmark(results_path, names=None, keep_folder=None):
+    """Run the benchmarks in names (default is all), and save the results.
+
+    The fixtures are written to a temporary folder, which is deleted, unless
+    keep_folder is given.  Returns the number of benchmarks that were slower
+    than the previous run.
+    """
+
+    started = datetime.datetime.now().isoformat()[:19]
+    python = "{0}.{1}.{2}".format(*sys.version_info[:3])
+    options = run_options()
+    folder = keep_folder or tempfile.mkdtemp(prefix="robo-benchmark-")
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    results = []
+    try:
+        fixtures = make_fixtures(os.path.join(folder, "fixtures"))
+        print(
+            "{0} log files, {1} lines, {2:.1f} MB".format(
+                len(fixtures),
+                sum(fixture["lines"] for fixture in fixtures),
+                sum(fixture["bytes"] for fixture in fixtures) / 1e6,
+            )
+        )
+        for name in names or BENCHMARKS:
+            func = globals()["bench_" + name]
+            count, unit, seconds = func(fixtures, folder)
+            results.append((name, count, unit, seconds))
+    finally:
+        if not keep_folder:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    with sqlite3.connect(results_path) as conn:
+        db_create(conn)
+        previous = db_previous_rates(conn, python, options)
+        db_write_run(conn, started, python, options, results)
+    slower = 0
+    print(
+        "{0:18} {1:>9} {2:5} {3:>8} {4:>11} {5:>8}".format(
+            "benchmark", "count", "unit", "seconds", "rate/sec", "change"
+        )
+    )
+    for name, count, unit, seconds in results:
+        rate = count / seconds
+        change = ""
+        if name in previous:
+            ratio = rate / previous[name] - 1
+            change = "{0:+.0%}".format(ratio)
+            if ratio < -Config.slower_threshold:
+                change += " SLOWER"
+                slower += 1
+        print(
+            "{0:18} {1:9d} {2:5} {3:8.3f} {4:11.0f} {5:>8}".format(
+                name, count, unit, seconds, rate, change
+            )
+        )
+    return slower
+
+
+if __name__ == "__main__":
+    ARG_PARSER = argparse.ArgumentParser(
+        description="Time the log processor with synthetic log files."
+    )
+    ARG_PARSER.add_argument(
+        "benchmarks",
+        nargs="*",
+        help="The benchmarks to run (default is all): " + ", ".join(BENCHMARKS),
+    )
+    ARG_PARSER.add_argument("--results", default=Config.results_path)
+    ARG_PARSER.add_argument("--nights", type=int, default=Config.nights)
+    ARG_PARSER.add_argument("--files", type=int, default=Config.listed_files)
+    ARG_PARSER.add_argument("--error-rate", type=float, default=Config.error_rate)
+    ARG_PARSER.add_argument("--repeat", type=int, default=Config.repeat)
+    ARG_PARSER.add_argument(
+        "--keep", metavar="FOLDER", help="Write the fixtures to FOLDER and keep them."
+    )
+    ARGS = ARG_PARSER.parse_args()
+    for NAME in ARGS.benchmarks:
+        if NAME not in BENCHMARKS:
+            ARG_PARSER.error("unknown benchmark: {0}".format(NAME))
+    Config.nights = ARGS.nights
+    Config.listed_files = ARGS.files
+    Config.error_rate = ARGS.error_rate
+    Config.repeat = ARGS.repeat
+    quiet_logging()
+    sys.exit(1 if benchmark(ARGS.results, ARGS.benchmarks, ARGS.keep) else 0)
@@ -26,42 +26,202 @@ http://www.red-dove.com/python_logging.html
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import atexit
+from email.mime.text import MIMEText
+from email.utils import formatdate
 import logging
 import logging.handlers
+import os
 import smtplib
+import threading
 
-# pylint: disable=too-many-arguments,bare-except
+try:
+    # Python 2
+    import Queue as queue
+except ImportError:
+    # Python 3
+    import queue
+
+# pylint: disable=too-many-arguments,too-many-instance-attributes,broad-except
 
 
 class BufferingSMTPHandler(logging.handlers.BufferingHandler):
-    """A logging handler that buffers (aggregates) SMTP messages."""
+    """A logging handler that buffers (aggregates) SMTP messages.
+
+    The emails are sent by a background thread, so logging does not wait for the
+    mail server.  In digest mode, the records with the same logger, level, and
+    message (before the arguments are merged) are one item in the email, with a
+    count and the first and last examples, and an email is sent when there are
+    `capacity` different items.  Otherwise an email is sent for every `capacity`
+    records.  The rest are sent when the handler is closed (i.e. when the
+    process exits).  No more than max_emails are sent (None is no limit).
+    """
 
-    def __init__(self, mailhost, fromaddr, toaddrs, subject, capacity=100):
+    def __init__(
+        self,
+        mailhost,
+        fromaddr,
+        toaddrs,
+        subject,
+        capacity=100,
+        mailport=None,
+        digest=True,
+        max_emails=10,
+        timeout=30.0,
+    ):
         logging.handlers.BufferingHandler.__init__(self, capacity)
         self.mailhost = mailhost
-        self.mailport = None
+        self.mailport = mailport
         self.fromaddr = fromaddr
         self.toaddrs = toaddrs
         self.subject = subject
+        self.digest = digest
+        self.max_emails = max_emails
+        self.timeout = timeout
+        # In digest mode, buffer has the keys to groups (in order), and groups has
+        # [count, first record, last record] for each key.
+        self.groups = {}
+        self.emails = 0
+        self.queue = queue.Queue()
+        self.sender = None
+        # The sender thread only runs in this process (see send_later())
+        self.pid = os.getpid()
+        self.buffer_pid = self.pid
         self.setFormatter(logging.Formatter("%(asctime)s %(levelname)-5s %(message)s"))
+        atexit.register(self.close)
+
+    def check_process(self):
+        """Forget the records buffered by the parent of a forked process."""
+
+        if self.buffer_pid != os.getpid():
+            self.buffer_pid = os.getpid()
+            self.buffer = []
+            self.groups = {}
+            self.emails = 0
+
+    def emit(self, record):
+        """Add a record to the buffer, and flush the buffer if it is full."""
+
+        self.check_process()
+        if not self.digest:
+            logging.handlers.BufferingHandler.emit(self, record)
+            return
+        # A record from a parse worker has its arguments merged (see RecordCollector)
+        template = getattr(record, "template", record.msg)
+        key = (record.name, record.levelno, "{0}".format(template))
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = [0, record, record]
+            self.buffer.append(key)
+        group[0] += 1
+        group[2] = record
+        if self.shouldFlush(record):
+            self.flush()
 
     def flush(self):
-        """Flush the aggregated messages to the SMTP server."""
-        if len(self.buffer) > 0:
-            try:
-                port = self.mailport
-                if not port:
-                    port = smtplib.SMTP_PORT
-                smtp = smtplib.SMTP(self.mailhost, port)
-                msg = "From: %s\r\nTo: %s\r\nSubject: %s\r\n\r\n" % (
-                    self.fromaddr,
-                    self.toaddrs.join(","),
-                    self.subject,
-                )
-                for record in self.buffer:
-                    msg += self.format(record) + "\r\n"
-                smtp.sendmail(self.fromaddr, self.toaddrs, msg)
-                smtp.quit()
-            except:
-                self.handleError(None)  # no particular record
+        """Queue an email with the buffered messages for the sender thread."""
+
+        self.acquire()
+        try:
+            self.check_process()
+            if not self.buffer:
+                return
+            if self.digest:
+                text = self.digest_text()
+            else:
+                text = "\r\n".join(self.format(record) for record in self.buffer)
             self.buffer = []
+            self.groups = {}
+            if self.max_emails is not None and self.emails >= self.max_emails:
+                return
+            self.emails += 1
+            if self.emails == self.max_emails:
+                text += (
+                    "\r\n\r\nThis is the last email that will be sent; "
+                    "see the log file for any other messages.\r\n"
+                )
+            self.send_later(text)
+        finally:
+            self.release()
+
+    def digest_text(self):
+        """Return the text of a digest email for the buffered groups of records."""
+
+        lines = []
+        for key in self.buffer:
+            count, first, last = self.groups[key]
+            if count == 1:
+                lines.append(self.format(first))
+                continue
+            lines.append(
+                "{0} {1} messages from {2} like: {3}".format(
+                    count, first.levelname, first.name, key[2]
+                )
+            )
+            lines.append("    First: " + self.format(first))
+            lines.append("    Last:  " + self.format(last))
+        return "\r\n".join(lines)
+
+    def send_later(self, text):
+        """Queue the email text for the sender thread (start it if needed)."""
+
+        if os.getpid() != self.pid:
+            # A forked (multiprocessing) process does not have the sender thread,
+            # and it may exit without closing the handler, so send it now.
+            self.send(text)
+            return
+        if self.sender is None or not self.sender.is_alive():
+            self.sender = threading.Thread(
+                target=self.send_queue, name="BufferingSMTPHandler"
+            )
+            self.sender.daemon = True
+            self.sender.start()
+        self.queue.put(text)
+
+    def send_queue(self):
+        """Send the queued emails (runs in the sender thread); None stops the thread."""
+
+        while True:
+            text = self.queue.get()
+            if text is None:
+                return
+            self.send(text)
+
+    def send(self, text):
+        """Send an email with text to the SMTP server."""
+
+        try:
+            toaddrs = self.toaddrs
+            if not isinstance(toaddrs, (list, tuple)):
+                toaddrs = [toaddrs]
+            msg = MIMEText(text, "plain", "utf-8")
+            msg["From"] = self.fromaddr
+            msg["To"] = ", ".join(toaddrs)
+            msg["Subject"] = self.subject
+            msg["Date"] = formatdate(localtime=True)
+            port = self.mailport
+            if not port:
+                port = smtplib.SMTP_PORT
+            smtp = smtplib.SMTP(self.mailhost, port, timeout=self.timeout)
+            smtp.sendmail(self.fromaddr, toaddrs, msg.as_string())
+            smtp.quit()
+        except Exception:
+            self.handleError(None)  # no particular record
+
+    def close(self):
+        """Send the buffered messages, wait for the sender thread, and close."""
+
+        self.acquire()
+        try:
+            self.flush()
+            if (
+                os.getpid() == self.pid
+                and self.sender is not None
+                and self.sender.is_alive()
+            ):
+                # Each SMTP command times out, so this will not wait forever
+                self.queue.put(None)
+                self.sender.join()
+        finally:
+            self.release()
+        logging.Handler.close(self)
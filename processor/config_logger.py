@@ -37,7 +37,7 @@ config = {
             "filename": "E:/XDrive/Logs/LogProcessor.log",
         },
         "email": {
-            # Bundle 100 messages into a single email
+            # Bundle messages into digest emails sent by a background thread
             "class": "buffering_smtp_handler.BufferingSMTPHandler",
             # Separate email for each message
             # 'class':    'logging.handlers.SMTPHandler',
@@ -47,6 +47,13 @@ config = {
             "fromaddr": "akro_gis_helpdesk@nps.gov",
             "toaddrs": ["akro_gis_helpdesk@nps.gov"],
             "subject": "Error running Robocopy Log Processor",
+            "mailport": 25,
+            # Group similar messages with a count and the first and last examples
+            "digest": True,
+            # Email when there are this many different messages (or at exit)
+            "capacity": 100,
+            # No more than this many emails per run
+            "max_emails": 10,
         },
         "sqlite": {
             "class": "sqlite_handler.SQLiteHandler",
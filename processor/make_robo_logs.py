@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+"""
+Writes synthetic robocopy log files for testing and benchmarking the processor.
+
+The log files look like the nightly `YYYY-MM-DD_HH-MM-SS-PARK-update-x-drive.log`
+files written by robocopy (see the notes on the log format in
+process_robo_logs_tests.py).  The size of the log, the number of files listed,
+the error and retry rates, how the log ends (finished, paused or killed), and
+the format of the summary can be set in the Config object, as arguments to
+make_log(), or on the command line.  The same seed always makes the same files.
+
+Edit the Config object below as needed for each execution.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import datetime
+from io import open
+import os
+import random
+import zlib
+
+# pylint: disable=too-many-arguments,too-many-locals,too-many-branches,too-many-statements
+
+
+class Config(object):
+    """Namespace for default configuration parameters."""
+
+    # pylint: disable=useless-object-inheritance,too-few-public-methods
+
+    # The folder where the log files are written.
+    log_folder = "fixtures"
+
+    # The parks; each night there is one log file for each park.
+    parks = ["DENA", "GLBA", "KATM", "KEFJ", "KENN", "KLGO", "KOTZ", "LACL"]
+
+    # The number of nights of log files to write (ending with last_date).
+    nights = 1
+    last_date = datetime.date(2018, 5, 15)
+
+    # The number of (new or changed) files listed in each log file.
+    # If size (in bytes) is set, files are listed until the log is at least that big.
+    listed_files = 2000
+    size = None
+
+    # The number of files that are not changed (not listed) for each listed file.
+    skipped_per_listed = 100
+
+    # The number of files listed in each folder.
+    files_per_folder = 40
+
+    # The fraction of the listed files that have an error.
+    error_rate = 0.01
+
+    # The fraction of errors that are retried, and the number of retries
+    # (robocopy's /R option) before RETRY LIMIT EXCEEDED.
+    retry_rate = 0.5
+    retries = 5
+
+    # The fraction of retried errors that succeed before the retry limit.
+    retry_success_rate = 0.5
+
+    # The fraction of log files that are paused at 6am (the robocopy /RH option)
+    # and killed (no end at all; robocopy was copying a very large file when
+    # it was asked to pause).  The other log files are finished with a summary.
+    paused_rate = 0.1
+    killed_rate = 0.05
+
+    # Write the "Bytes :" summary line with units (i.e. "557.141 g"), or as
+    # plain numbers (the robocopy /BYTES option).
+    byte_units = True
+
+    # The encoding of the log files ("utf-8", "cp1252", or "utf-16" for /UNILOG).
+    encoding = "utf-8"
+
+    # The seed for the random numbers.
+    seed = 1
+
+    # The name of the PDS change log written with the log files (there is a
+    # change on each night).
+    change_log_name = "PDS_ChangeLog.txt"
+
+
+# The errors in the log files: code, name, action, and if the path is the
+# destination (True) or the source (False).
+ERRORS = [
+    (
+        32,
+        "The process cannot access the file because it is being used by another process.",
+        "Deleting Extra File",
+        True,
+    ),
+    (5, "Access is denied.", "Copying File", False),
+    (2, "The system cannot find the file specified.", "Copying File", False),
+    (121, "The semaphore timeout period has expired.", "Copying File", False),
+]
+
+SOURCE = "\\\\inpakrovmdist\\gisdata\\"
+DESTINATION = "E:\\XDrive\\RemoteServers\\XDrive-{0}\\"
+HEADER_RULE = "-" * 79
+BODY_RULE = "-" * 78
+# The number of directories (not listed) for each listed folder
+DIRS_PER_FOLDER = 20
+# The unit suffix for a number in the "Bytes :" summary line.
+BYTE_UNITS = [(10 ** 12, "t"), (10 ** 9, "g"), (10 ** 6, "m"), (10 ** 3, "k")]
+
+
+def log_name(park, start):
+    """Return the name of the log file for park started at start (a datetime)."""
+
+    return "{0}-{1}-update-x-drive.log".format(
+        start.strftime("%Y-%m-%d_%H-%M-%S"), park
+    )
+
+
+def format_bytes(count, units=True):
+    """Return count in the format of the "Bytes :" summary line, i.e. "557.141 g"."""
+
+    if units:
+        for size, unit in BYTE_UNITS:
+            if count >= size:
+                text = "{0:.3f}".format(count / size).rstrip("0").rstrip(".")
+                return "{0} {1}".format(text, unit)
+    return "{0}".format(count)
+
+
+def format_time(seconds):
+    """Return seconds in the format of the "Times :" summary line (H:MM:SS)."""
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{0}:{1:02d}:{2:02d}".format(hours, minutes, seconds)
+
+
+def format_robo_time(when):
+    """Return a datetime as robocopy writes it.
+
+    i.e. "Tuesday, May 15, 2018 10:00:03 PM"
+    """
+
+    hour = when.hour % 12 or 12
+    return "{0}, {1} {2}, {3} {4}:{5} {6}".format(
+        when.strftime("%A"),
+        when.strftime("%B"),
+        when.day,
+        when.year,
+        hour,
+        when.strftime("%M:%S"),
+        when.strftime("%p"),
+    )
+
+
+def summary_line(label, items):
+    """Return a line in the summary with the label and 6 columns."""
+
+    return "{0:>8} :{1}".format(label, "".join("{0:>10}".format(i) for i in items))
+
+
+def make_log(
+    folder,
+    park,
+    start,
+    ending="finished",
+    listed_files=None,
+    size=None,
+    error_rate=None,
+    retry_rate=None,
+    retries=None,
+    retry_success_rate=None,
+    byte_units=None,
+    encoding=None,
+    seed=None,
+):
+    """Write a robocopy log file for park in folder, and return what it contains.
+
+    start is the datetime when robocopy started (it is also in the name of the
+    log file).  ending is "finished", "paused", or "killed".  The other options
+    default to the values in the Config object.
+
+    The returned dict has the file name, the number of lines and bytes, and
+    what process_park() should find: the number of errors (and failed errors),
+    finished (True, False or None), and the "Files :" counts (None if the log
+    is not finished).
+    """
+
+    if listed_files is None:
+        listed_files = Config.listed_files
+    if size is None:
+        size = Config.size
+    if error_rate is None:
+        error_rate = Config.error_rate
+    if retry_rate is None:
+        retry_rate = Config.retry_rate
+    if retries is None:
+        retries = Config.retries
+    if retry_success_rate is None:
+        retry_success_rate = Config.retry_success_rate
+    if byte_units is None:
+        byte_units = Config.byte_units
+    if encoding is None:
+        encoding = Config.encoding
+    if seed is None:
+        seed = Config.seed
+    # Only random() is used (and an int seed), so python 2 and 3 write the same file
+    key = "{0}|{1}|{2}".format(seed, park, start).encode()
+    rand = random.Random(zlib.crc32(key) & 0xFFFFFFFF)
+    destination = DESTINATION.format(park)
+    options = "*.* /S /E /COPY:DAT /PURGE /MIR /R:{0} /W:5 /RH:2200-0600".format(
+        retries
+    )
+    lines = [
+        "",
+        HEADER_RULE,
+        "   ROBOCOPY     ::     Robust File Copy for Windows",
+        HEADER_RULE,
+        "",
+        "  Started : {0}".format(format_robo_time(start)),
+        "   Source : {0}".format(SOURCE),
+        "     Dest : {0}".format(destination),
+        "",
+        "    Files : *.*",
+        "",
+        "  Options : {0}".format(options),
+        "",
+        BODY_RULE,
+        "",
+    ]
+    now = start
+    byte_count = sum(len(line) + 2 for line in lines)
+    listed = 0
+    folders = 0
+    errors = 0
+    failed = 0
+    copied_bytes = 0
+    while listed < listed_files if size is None else byte_count < size:
+        first = len(lines)
+        if listed % Config.files_per_folder == 0:
+            folders += 1
+            lines.append(
+                "\t                  {0:3d}\t{1}dir{2}\\".format(
+                    Config.files_per_folder, SOURCE, folders
+                )
+            )
+        listed += 1
+        file_size = int(rand.expovariate(1 / 500000)) + 1
+        name = "file{0}.txt".format(listed)
+        if rand.random() < 0.02:
+            # Some file names are not ascii (but all are in cp1252)
+            name = "file{0} – caf\xe9.txt".format(listed)
+        kind = "New File  " if rand.random() < 0.2 else "Newer     "
+        listing = "\t    {0}\t\t{1:>7}\t{2}".format(
+            kind, format_bytes(file_size), name
+        )
+        lines.append(listing)
+        copied = True
+        if rand.random() < error_rate:
+            errors += 1
+            code, error_name, action, in_destination = ERRORS[
+                int(rand.random() * len(ERRORS))
+            ]
+            root = destination if in_destination else SOURCE
+            error = "ERROR {0} (0x{0:08X}) {1} {2}dir{3}\\{4}".format(
+                code, action, root, folders, name
+            )
+            # The name of the error ends with \r\r\n (see NOTE 1 in the tests)
+            error_lines = ["", error_name + "\r"]
+            retried = rand.random() < retry_rate
+            success = retried and rand.random() < retry_success_rate
+            if success:
+                tries = 1 + int(rand.random() * retries)
+            else:
+                tries = retries if retried else 0
+            # Robocopy lists the file again before each retry
+            for _ in range(tries):
+                now += datetime.timedelta(seconds=5)
+                error_lines[0] = now.strftime("%Y/%m/%d %H:%M:%S ") + error
+                lines.extend(error_lines)
+                lines.extend(["Waiting 5 seconds... Retrying...", listing])
+            if not success:
+                error_lines[0] = now.strftime("%Y/%m/%d %H:%M:%S ") + error
+                lines.extend(error_lines)
+                lines.append("")
+                if retried:
+                    lines.extend(["ERROR: RETRY LIMIT EXCEEDED.", ""])
+                failed += 1
+                copied = False
+        if copied:
+            copied_bytes += file_size
+        byte_count += sum(len(line) + 2 for line in lines[first:])
+        now += datetime.timedelta(seconds=int(rand.random() * 3))
+
+    finished = None
+    files = None
+    if ending == "paused":
+        lines.append("    Hours : Paused at 06:00")
+        finished = False
+    elif ending == "finished":
+        finished = True
+        skipped = listed * Config.skipped_per_listed
+        files = {
+            "total": listed + skipped,
+            "copied": listed - failed,
+            "skipped": skipped,
+            "mismatch": 0,
+            "failed": failed,
+            "extra": 0,
+        }
+        dirs = folders * DIRS_PER_FOLDER
+        skipped_bytes = skipped * 500000
+        seconds = int((now - start).total_seconds()) + 1
+        lines.extend(
+            [
+                "",
+                BODY_RULE,
+                "",
+                "               Total    Copied   Skipped  Mismatch    FAILED    Extras",
+                summary_line("Dirs", [dirs, folders, dirs - folders, 0, 0, 0]),
+                summary_line(
+                    "Files",
+                    [
+                        files[key]
+                        for key in ["total", "copied", "skipped", "mismatch"]
+                        + ["failed", "extra"]
+                    ],
+                ),
+                summary_line(
+                    "Bytes",
+                    [
+                        format_bytes(count, byte_units)
+                        for count in [copied_bytes + skipped_bytes, copied_bytes]
+                        + [skipped_bytes, 0, 0, 0]
+                    ],
+                ),
+                summary_line(
+                    "Times",
+                    [format_time(seconds), format_time(seconds - 1), "", ""]
+                    + [format_time(0), format_time(1)],
+                ),
+                "",
+                "   Ended : {0}".format(format_robo_time(now)),
+                "",
+            ]
+        )
+    text = "\r\n".join(lines) + "\r\n"
+    if ending == "killed":
+        # Robocopy was killed while it was writing a file name
+        text += "\t    Newer     \t\t  "
+    file_name = os.path.join(folder, log_name(park, start))
+    with open(file_name, "w", encoding=encoding, newline="") as file_handle:
+        file_handle.write(text)
+    return {
+        "filename": file_name,
+        "lines": len(text.splitlines()),
+        "bytes": os.path.getsize(file_name),
+        "errors": errors,
+        "failed": failed,
+        "finished": finished,
+        "files": files,
+    }
+
+
+def make_change_log(file_name, dates):
+    """Write a PDS change log with a change on each date (a datetime.date)."""
+
+    with open(file_name, "w", encoding="utf-8") as file_handle:
+        for date in sorted(dates, reverse=True):
+            file_handle.write("{0}\n----------\n".format(date.isoformat()))
+            file_handle.write("  * Updated the synthetic data.\n\n")
+
+
+def make_logs(folder, nights=None, parks=None, last_date=None, **options):
+    """Write one log file for each park for each night in folder.
+
+    The log files for the nights before last_date are written; nights, parks,
+    and last_date default to the values in the Config object.  The end of each
+    log file is chosen at random with Config.paused_rate and Config.killed_rate.
+    options are passed to make_log().  A PDS change log (Config.change_log_name)
+    is also written in folder.  Returns a list of the make_log() results.
+    """
+
+    if nights is None:
+        nights = Config.nights
+    if parks is None:
+        parks = Config.parks
+    if last_date is None:
+        last_date = Config.last_date
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    seed = options.get("seed")
+    rand = random.Random(Config.seed if seed is None else seed)
+    logs = []
+    dates = [last_date - datetime.timedelta(days=night) for night in range(nights)]
+    make_change_log(os.path.join(folder, Config.change_log_name), dates)
+    for date in reversed(dates):
+        for index, park in enumerate(parks):
+            start = datetime.datetime(date.year, date.month, date.day, 22, 0, index)
+            ending = rand.random()
+            if ending < Config.killed_rate:
+                ending = "killed"
+            elif ending < Config.killed_rate + Config.paused_rate:
+                ending = "paused"
+            else:
+                ending = "finished"
+            logs.append(make_log(folder, park, start, ending, **options))
+    return logs
+
+
+if __name__ == "__main__":
+    ARG_PARSER = argparse.ArgumentParser(
+        description="Write synthetic robocopy log files (see the Config object)."
+    )
+    ARG_PARSER.add_argument(
+        "folder", nargs="?", default=Config.log_folder, help="The output folder."
+    )
+    ARG_PARSER.add_argument("--nights", type=int, default=Config.nights)
+    ARG_PARSER.add_argument(
+        "--parks", help="A comma separated list of park codes, i.e. DENA,KATM"
+    )
+    ARG_PARSER.add_argument(
+        "--files", type=int, help="The number of files listed in each log file."
+    )
+    ARG_PARSER.add_argument(
+        "--size", type=float, help="The minimum size of each log file in MB."
+    )
+    ARG_PARSER.add_argument("--error-rate", type=float)
+    ARG_PARSER.add_argument("--retry-rate", type=float)
+    ARG_PARSER.add_argument(
+        "--paused-rate",
+        type=float,
+        default=Config.paused_rate,
+        help="The fraction of log files that end when robocopy is paused.",
+    )
+    ARG_PARSER.add_argument(
+        "--killed-rate",
+        type=float,
+        default=Config.killed_rate,
+        help="The fraction of log files that end without a summary.",
+    )
+    ARG_PARSER.add_argument(
+        "--plain-bytes",
+        action="store_true",
+        help='Write the "Bytes :" summary without units (robocopy /BYTES).',
+    )
+    ARG_PARSER.add_argument("--encoding", help="i.e. utf-8, cp1252 or utf-16")
+    ARG_PARSER.add_argument("--seed", type=int)
+    ARGS = ARG_PARSER.parse_args()
+    Config.paused_rate = ARGS.paused_rate
+    Config.killed_rate = ARGS.killed_rate
+    LOGS = make_logs(
+        ARGS.folder,
+        nights=ARGS.nights,
+        parks=ARGS.parks.split(",") if ARGS.parks else None,
+        listed_files=ARGS.files,
+        size=int(ARGS.size * 1e6) if ARGS.size else None,
+        error_rate=ARGS.error_rate,
+        retry_rate=ARGS.retry_rate,
+        byte_units=False if ARGS.plain_bytes else None,
+        encoding=ARGS.encoding,
+        seed=ARGS.seed,
+    )
+    print(
+        "Wrote {0} log files ({1} lines, {2:.1f} MB) to {3}".format(
+            len(LOGS),
+            sum(log["lines"] for log in LOGS),
+            sum(log["bytes"] for log in LOGS) / 1e6,
+            ARGS.folder,
+        )
+    )
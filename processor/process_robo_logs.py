@@ -8,14 +8,31 @@ Edit the Config object below as needed for each execution.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import argparse
+import codecs
+import ctypes
 import datetime
 from io import open
 import glob
+import gzip
+import hashlib
+import io
+import json
 import logging
 import logging.config
+import mmap
+import multiprocessing
 import os
 import sqlite3
+import sys
 import time
+import zlib
+
+try:
+    import resource
+except ImportError:
+    # Windows; see peak_memory()
+    resource = None
 
 import config_logger
 
@@ -34,6 +51,49 @@ class Config(object):
     # Path to the "PDS Change Log" - describes changes robocopy is propagating
     change_log_path = r"\\inpakrovmdist\gisdata2\GIS\ThemeMgr\PDS_ChangeLog.txt"
 
+    # Number of worker processes for parsing the log files in parallel.
+    # Use 1 to parse the log files one at a time in the main process.
+    parse_processes = multiprocessing.cpu_count()
+
+    # Error messages with a path in this folder are stored relative to the park's
+    # folder (the text after this prefix, up to the next backslash, is the park).
+    remote_root = r"E:\XDrive\RemoteServers\XDrive-"
+
+    # Compress (gzip) the log files when they are moved to the archive folder.
+    # The processor and the server read compressed and uncompressed log files.
+    compress_archives = True
+
+    # Number of lines in each block of the line index (*.log.idx) that is written
+    # for each archived log file.  In a compressed log file, each block is a
+    # separate gzip member, so the server can decompress just one block.
+    index_lines = 1000
+
+    # Number of worker processes for indexing and compressing the archived logs.
+    archive_processes = 2
+
+    # Folder for the staging databases written by a backfill (--backfill).  Each
+    # parse worker writes to its own staging database, and they are merged into
+    # the log database at the end.  An interrupted backfill resumes from them.
+    backfill_folder = os.path.join(log_folder, "backfill")
+
+    # Seconds between the progress reports of a backfill.
+    backfill_report_seconds = 10
+
+    # Only log records at or above this level are logged during a backfill
+    # (the nightly warnings for each log file are not useful for old logs).
+    backfill_log_level = logging.ERROR
+
+    # Maximum number of error rows to send to the database in one executemany()
+    error_batch_size = 10000
+
+    # In follow mode (--follow), the number of seconds to wait between checks for
+    # new lines in the log files.
+    follow_poll_seconds = 30
+
+    # In follow mode, a log file that has not grown in this many seconds is
+    # assumed to be complete (for example, robocopy was killed).
+    follow_idle_seconds = 2 * 60 * 60
+
 
 # Configure and start the logger
 logging.config.dictConfig(config_logger.config)
@@ -49,36 +109,6 @@ logger.info("Logging Started")
 # I know this code is a little complicated, but I'm not going to risk refactoring.
 
 
-def process_summary(file_handle, filename, line_num):
-    """Return a records of stats for the summary section of the log file."""
-
-    results = {}
-    for key, text in [
-        ("dirs", "Dirs :"),
-        ("files", "Files :"),
-        ("bytes", "Bytes :"),
-        ("times", "Times :"),
-    ]:
-        try:
-            line = file_handle.next()
-            line_num += 1
-            results[key] = process_summary_line(line, text, filename, line_num)
-        except Exception as ex:
-            logger.error(
-                (
-                    "Unexpected exception processing summary, "
-                    "file: %s, line#: %d, key: %s, text: %s, line: %s, exception: %s"
-                ),
-                filename,
-                line_num,
-                key,
-                text,
-                line,
-                ex,
-            )
-    return results, line_num
-
-
 def process_summary_line(line, sentinel, filename, line_num):
     """Return a records of stats for a line in the summary section of the log file."""
 
@@ -103,18 +133,10 @@ def process_summary_line(line, sentinel, filename, line_num):
     try:
         clean_line = line.replace(sentinel, "")
         if sentinel == "Bytes :":
-            counts = [
-                int(float(item))
-                for item in clean_line.replace(" t", "e12")
-                .replace(" g", "e9")
-                .replace(" m", "e6")
-                .replace(" k", "e3")
-                .split()
-            ]
+            counts = parse_bytes(clean_line)
         elif sentinel == "Times :":
             clean_line = clean_line.replace("          ", "   0:00:00")
-            times = [time.strptime(item, "%H:%M:%S") for item in clean_line.split()]
-            counts = [t.tm_hour * 3600 + t.tm_min * 60 + t.tm_sec for t in times]
+            counts = [parse_time(item) for item in clean_line.split()]
         else:
             counts = [int(item) for item in clean_line.split()]
 
@@ -137,77 +159,50 @@ def process_summary_line(line, sentinel, filename, line_num):
     return count_obj
 
 
-def process_error(file_handle, filename, line, line_num, error_sentinel):
-    """Return information about a error in the log file."""
+# The exponent for the unit suffix of a number in the "Bytes :" summary line.
+BYTE_UNITS = {"t": "e12", "g": "e9", "m": "e6", "k": "e3"}
 
-    code, message = parse_error_line(line, filename, line_num, error_sentinel)
-    error_line_num = line_num
-    if not code:
-        logger.error(
-            "Unable to get the error code from an error line, file: %s, line#: %d, line: %s",
-            filename,
-            line_num,
-            line,
-        )
-    name = "Name of error not defined"
-    retry = False
-    eof = False
-    try:
-        # next line is the name of the error (always valid in 1 year of log data)
-        # The name line ends with 0x0D0D0A (\r\r\n), which python (win and mac)
-        # interprets as one line. vscode interprets as 2 lines (for line counting),
-        # but notepad and other editors do not. we will not double count this line,
-        # so line numbers will NOT match vscode line numbers.
-        name = file_handle.next().strip()
-        line_num += 1
-        # From known log files: next lines will be one of a) retry, b) blank, or c) error (EOF)
-        #   EOF occurs if robocopy is killed while recovering/waiting for an error
-        #   for example, see 2018-11-07_22-00-02-KLGO-update-x-drive.log
-        # Use try/except to catch StopIteration exception (EOF)
-        try:
-            line = file_handle.next()
-            line_num += 1
-        except StopIteration:
-            eof = True
-            line = ""
-        clean_line = line.strip()
-        if clean_line.endswith("... Retrying..."):
-            retry = True
-        elif clean_line:
-            # Not blank or Retry
-            # log as an error an treat as a blank line (throw this line away)
-            logger.error(
-                "Unexpected data on retry line after error in log file: %s, line#: %d, line: %s",
-                filename,
-                line_num,
-                line,
-            )
-    except Exception as ex:
-        logger.error(
-            (
-                "Unexpected exception processing error lines in log "
-                "file: %s, line#: %d, line: %s, exception: %s"
-            ),
-            filename,
-            line_num,
-            line,
-            ex,
-        )
 
-    # Error has failed unless we get a retry message
-    error = {
-        "code": code,
-        "failed": not retry,
-        "name": name,
-        "line_num": error_line_num,
-        "message": message,
-    }
-    # ignore the last line read (blank or retry), caller can read the next line to continue
-    return (error, eof, retry, line_num)
+def parse_bytes(text):
+    """Return a list of byte counts from the numbers in the "Bytes :" summary line.
+
+    A number may be followed by a unit (k, m, g, or t), i.e. "557.141 g"
+    """
+
+    items = []
+    for item in text.split():
+        exponent = BYTE_UNITS.get(item)
+        if exponent is None:
+            items.append(item)
+        else:
+            # Same as int(float("557.141e9")); float("557.141") * 1e9 may round down
+            items[-1] += exponent
+    return [int(float(item)) for item in items]
+
+
+def parse_time(text):
+    """Return the seconds in text (H:MM:SS).
+
+    This accepts the same text as time.strptime(text, "%H:%M:%S"), but is faster.
+    """
+
+    parts = text.split(":")
+    if len(parts) != 3 or not all(
+        0 < len(part) < 3 and part.isdigit() for part in parts
+    ):
+        raise ValueError("time data {0} does not match format H:MM:SS".format(text))
+    hours, minutes, seconds = [int(part) for part in parts]
+    if hours > 23 or minutes > 59 or seconds > 61:
+        raise ValueError("time data {0} is out of range".format(text))
+    return hours * 3600 + minutes * 60 + seconds
 
 
 def parse_error_line(line, filename, line_num, error_sentinel):
-    """Return information about one line in a error section of the log file."""
+    """Return information about one line in a error section of the log file.
+
+    Returns the error code, the message, and the parts of the message (see
+    split_error_message()).
+    """
 
     code = 0
     message = "Message not defined"
@@ -222,108 +217,506 @@ def parse_error_line(line, filename, line_num, error_sentinel):
             line,
             ex,
         )
-    return code, message
+    return code, message, split_error_message(message)
 
 
-def process_park(file_name):
-    """Return statistics for a single log file (each park is logged separately)."""
+def split_error_message(message):
+    """Return a dictionary with the action, root folder and path in an error message.
+
+    An error message is an action followed by a path, e.g.
+    "Copying File E:\\XDrive\\RemoteServers\\XDrive-GLBA\\dir1\\file1.txt".
+    The root is the park's folder for a path in Config.remote_root, otherwise the
+    UNC share or drive. root_name is the park code or the root, and the path is
+    relative to the root. The root and path are None if there is no path.
+    """
+
+    parts = {"action": message, "root": None, "root_name": None, "path": None}
+    starts = [message.find("\\\\"), message.find(":\\") - 1]
+    starts = [start for start in starts if start >= 0]
+    if not starts:
+        return parts
+    start = min(starts)
+    full_path = message[start:]
+    parts["action"] = message[:start].strip()
+    prefix_len = len(Config.remote_root)
+    if full_path[:prefix_len].lower() == Config.remote_root.lower():
+        park, _, path = full_path[prefix_len:].partition("\\")
+        parts["root"] = full_path[: prefix_len + len(park) + 1]
+        parts["root_name"] = park.upper()
+        parts["path"] = path
+        return parts
+    if full_path.startswith("\\\\"):
+        # \\server\share\path
+        items = full_path[2:].split("\\", 2)
+        root_len = 2 + sum(len(item) + 1 for item in items[:2])
+    else:
+        # X:\path
+        root_len = 3
+    parts["root"] = full_path[:root_len]
+    parts["root_name"] = parts["root"]
+    parts["path"] = full_path[root_len:]
+    return parts
+
+
+class ParkParser(object):
+    """An incremental parser for a robocopy log file (each park is logged separately).
+
+    Call feed() with each line of the log file (in order), then finish() to get
+    the statistics (see process_park()).  The parser state is kept between calls
+    to feed(), so the lines can be fed as they are written to the log file.
+    results has the statistics found so far.
+    """
+
+    # pylint: disable=useless-object-inheritance,too-many-instance-attributes
 
     summary_header = "Total    Copied   Skipped  Mismatch    FAILED    Extras"
     error_sentinel = " ERROR "
     finished_sentinel = "   Ended : "
     paused_sentinel = "    Hours : Paused at 06:"
+    end_sentinels = (finished_sentinel, paused_sentinel)
+    summary_lines = [
+        ("dirs", "Dirs :"),
+        ("files", "Files :"),
+        ("bytes", "Bytes :"),
+        ("times", "Times :"),
+    ]
+
+    # Parser states; what the next line is expected to be.
+    BODY = 0  # File names, errors, summary header, etc.
+    ERROR_NAME = 1  # The name of the error on the previous line
+    ERROR_RETRY = 2  # A retry message or a blank line
+    SUMMARY = 3  # One of the summary_lines
+
+    def __init__(self, file_name):
+        basename = os.path.basename(file_name)
+        self.file_name = file_name
+        self.park = basename[20:24]
+        self.date = basename[:10]
+        self.results = {
+            "park": self.park,
+            "date": self.date,
+            "filename": file_name,
+            "finished": None,
+            "errors": [],
+        }
+        self.state = self.BODY
+        self.line = None  # The previous line
+        self.line_num = 0
+        self.error_line_num = 0
+        self.saved_error = {}  # used when we are retrying an error.
+        self.error = None  # the error being parsed (in the ERROR_* states)
+        self.summary = None  # the summary being parsed (in the SUMMARY state)
+        self.summary_index = 0  # the index of the next line in summary_lines
+        self.done = False
+
+    def feed(self, line):
+        """Process the next line in the log file."""
+
+        if self.done:
+            return
+        self.line_num += 1
+        if self.state == self.ERROR_NAME:
+            self.error_name(line)
+        elif self.state == self.ERROR_RETRY:
+            self.error_retry(line)
+        elif self.state == self.SUMMARY:
+            self.summary_line(line)
+        else:
+            self.body_line(line)
+        self.line = line
 
-    results = {}
-    basename = os.path.basename(file_name)
-    park = basename[20:24]
-    date = basename[:10]
-    results["park"] = park
-    results["date"] = date
-    results["filename"] = file_name
-    results["finished"] = None
-    results["errors"] = []
-    line_num = 0
-    error_line_num = line_num
-    saved_error = {}  # used when we are retrying an error.
-    with open(file_name, "r", encoding="utf-8") as file_handle:
-        for line in file_handle:
-            try:
+    def needs_next_line(self):
+        """Return True if the next line must be fed to the parser.
+
+        Otherwise, only lines with one of the sentinels can change the parser.
+        """
+
+        return self.state != self.BODY or bool(self.saved_error)
+
+    def feed_lines(self, lines):
+        """Process each line in lines (an iterable, like a file handle).
+
+        This is the same as calling feed() for each line, but much faster.  Most
+        lines in a log file are file names, which are skipped with three simple
+        tests (no memory allocations) when the parser is in the BODY state.  Only
+        lines that might change the state are sent to feed().
+        """
+
+        error_sentinel = self.error_sentinel
+        summary_header = self.summary_header
+        end_sentinels = self.end_sentinels
+        feed = self.feed
+        line_num = self.line_num
+        # The line can be skipped if it is in the body, and not after a retry
+        skip = self.state == self.BODY and not self.saved_error and not self.done
+        for line in lines:
+            if (
+                skip
+                and error_sentinel not in line
+                and summary_header not in line
+                and not line.startswith(end_sentinels)
+            ):
                 line_num += 1
-                if error_sentinel in line:
-                    error, eof, retry, line_num = process_error(
-                        file_handle, file_name, line, line_num, error_sentinel
-                    )
-                    if saved_error and saved_error["message"] != error["message"]:
-                        saved_error["failed"] = True
-                        results["errors"].append(saved_error)
-                        saved_error = {}
-                    if eof:
-                        # Nothing comes next
-                        results["errors"].append(error)
-                        break
-                    if not retry:
-                        # We don't care what comes next, we will treat it all the
-                        # same. This includes the failing after the last retry
-                        # (next line will be RETRY LIMIT EXCEEDED)
-                        # this will only be non null when
-                        #   saved_error['message'] == error['message']
-                        saved_error = {}
-                        results["errors"].append(error)
-                    else:  # error is retrying
-                        # if not saved_error then saved_error['message'] == error['message'],
-                        # so assignment is redundant but harmless
-                        saved_error = error
-                        error_line_num = line_num
-                        # Options for what comes next:
-                        #   1) same error repeats as a fail: clear saved_error,
-                        #      log new error, continue
-                        #   2) same error repeats with a new retry: (re)set
-                        #      saved_error, continue
-                        #   3) new error: save saved_error as fail, process new
-                        #      error based on retry status
-                        #   4) retry succeeds: log this error: status should be non-fail
-                    continue
-                if saved_error:
-                    # this line is not an error and the last error we saw was retrying
-                    #   1) this is a repeat of the file name before the error,
-                    #      which means nothing, need to check following line
-                    #   2) this is a new filename
-                    retry_worked = line_num - error_line_num > 1
-                    if retry_worked:
-                        results["errors"].append(
-                            saved_error
-                        )  # logs a non-failing error
-                        saved_error = {}
-                if line.strip() == summary_header:
-                    summary, line_num = process_summary(
-                        file_handle, file_name, line_num
-                    )
-                    results["stats"] = summary
-                elif line.startswith(finished_sentinel):
-                    results["finished"] = True
-                elif line.startswith(paused_sentinel):
-                    logger.warning(
-                        "%s on %s: Robocopy not finished (paused then killed)",
-                        park,
-                        date,
+                continue
+            self.line_num = line_num
+            feed(line)
+            line_num = self.line_num
+            skip = self.state == self.BODY and not self.saved_error and not self.done
+        self.line_num = line_num
+
+    def finish(self):
+        """Process the end of the log file and return the results."""
+
+        if self.state == self.ERROR_NAME:
+            # The log ended after an error line
+            logger.error(
+                (
+                    "Unexpected exception processing error lines in log "
+                    "file: %s, line#: %d, line: %s, exception: %s"
+                ),
+                self.file_name,
+                self.line_num,
+                self.line,
+                "End of file",
+            )
+            self.end_error(retry=False, eof=False)
+        elif self.state == self.ERROR_RETRY:
+            # EOF occurs if robocopy is killed while recovering/waiting for an error
+            #   for example, see 2018-11-07_22-00-02-KLGO-update-x-drive.log
+            self.end_error(retry=False, eof=True)
+        elif self.state == self.SUMMARY:
+            if self.summary_index:
+                for key, text in self.summary_lines[self.summary_index :]:
+                    logger.error(
+                        (
+                            "Unexpected exception processing summary, "
+                            "file: %s, line#: %d, key: %s, text: %s, line: %s, "
+                            "exception: %s"
+                        ),
+                        self.file_name,
+                        self.line_num,
+                        key,
+                        text,
+                        self.line,
+                        "End of file",
                     )
-                    results["finished"] = False
-            except Exception as ex:
+            else:
                 logger.error(
                     (
                         "Unexpected exception processing log, "
                         "file: %s, line#: %d, line: %s, exception: %s"
                     ),
-                    file_name,
-                    line_num,
-                    line,
-                    ex,
+                    self.file_name,
+                    self.line_num,
+                    self.line,
+                    "End of file after the summary header",
                 )
-        if saved_error:
+        self.state = self.BODY
+        self.done = True
+        self.results["lines"] = self.line_num
+        if self.saved_error:
             # could happen if there was a error retrying that was not resolved
             # before the file ended
-            results["errors"].append(saved_error)  # logs a non-failing error
-    return results
+            self.results["errors"].append(self.saved_error)  # logs a non-failing error
+            self.saved_error = {}
+        return self.results
+
+    def body_line(self, line):
+        """Process a line that is not part of an error or the summary."""
+
+        try:
+            if self.error_sentinel in line:
+                self.start_error(line)
+                return
+            if self.saved_error:
+                # this line is not an error and the last error we saw was retrying
+                #   1) this is a repeat of the file name before the error,
+                #      which means nothing, need to check following line
+                #   2) this is a new filename
+                retry_worked = self.line_num - self.error_line_num > 1
+                if retry_worked:
+                    self.results["errors"].append(
+                        self.saved_error
+                    )  # logs a non-failing error
+                    self.saved_error = {}
+            if line.strip() == self.summary_header:
+                self.summary = {}
+                self.summary_index = 0
+                self.state = self.SUMMARY
+            elif line.startswith(self.finished_sentinel):
+                self.results["finished"] = True
+            elif line.startswith(self.paused_sentinel):
+                logger.warning(
+                    "%s on %s: Robocopy not finished (paused then killed)",
+                    self.park,
+                    self.date,
+                )
+                self.results["finished"] = False
+        except Exception as ex:
+            logger.error(
+                (
+                    "Unexpected exception processing log, "
+                    "file: %s, line#: %d, line: %s, exception: %s"
+                ),
+                self.file_name,
+                self.line_num,
+                line,
+                ex,
+            )
+
+    def start_error(self, line):
+        """Process the first line of an error."""
+
+        code, message, parts = parse_error_line(
+            line, self.file_name, self.line_num, self.error_sentinel
+        )
+        if not code:
+            logger.error(
+                "Unable to get the error code from an error line, file: %s, line#: %d, line: %s",
+                self.file_name,
+                self.line_num,
+                line,
+            )
+        self.error = {
+            "code": code,
+            "failed": True,
+            "name": "Name of error not defined",
+            "line_num": self.line_num,
+            "message": message,
+        }
+        self.error.update(parts)
+        self.state = self.ERROR_NAME
+
+    def error_name(self, line):
+        """Process the line after an error line; the name of the error."""
+
+        # The name line is always valid in 1 year of log data.
+        # The name line ends with 0x0D0D0A (\r\r\n), which python (win and mac)
+        # interprets as one line. vscode interprets as 2 lines (for line counting),
+        # but notepad and other editors do not. we will not double count this line,
+        # so line numbers will NOT match vscode line numbers.
+        self.error["name"] = line.strip()
+        self.state = self.ERROR_RETRY
+
+    def error_retry(self, line):
+        """Process the line after the error name; one of retry, blank, or an error."""
+
+        retry = False
+        clean_line = line.strip()
+        if clean_line.endswith("... Retrying..."):
+            retry = True
+        elif clean_line:
+            # Not blank or Retry
+            # log as an error an treat as a blank line (throw this line away)
+            logger.error(
+                "Unexpected data on retry line after error in log file: %s, line#: %d, line: %s",
+                self.file_name,
+                self.line_num,
+                line,
+            )
+        self.end_error(retry, eof=False)
+
+    def end_error(self, retry, eof):
+        """Save the error being parsed based on the retry status."""
+
+        # Error has failed unless we get a retry message
+        error = self.error
+        error["failed"] = not retry
+        self.error = None
+        self.state = self.BODY
+        saved_error = self.saved_error
+        if saved_error and saved_error["message"] != error["message"]:
+            saved_error["failed"] = True
+            self.results["errors"].append(saved_error)
+            self.saved_error = {}
+        if eof:
+            # Nothing comes next
+            self.results["errors"].append(error)
+            self.done = True
+            return
+        if not retry:
+            # We don't care what comes next, we will treat it all the
+            # same. This includes the failing after the last retry
+            # (next line will be RETRY LIMIT EXCEEDED)
+            # this will only be non null when
+            #   saved_error['message'] == error['message']
+            self.saved_error = {}
+            self.results["errors"].append(error)
+        else:  # error is retrying
+            # if not saved_error then saved_error['message'] == error['message'],
+            # so assignment is redundant but harmless
+            self.saved_error = error
+            self.error_line_num = self.line_num
+            # Options for what comes next:
+            #   1) same error repeats as a fail: clear saved_error,
+            #      log new error, continue
+            #   2) same error repeats with a new retry: (re)set
+            #      saved_error, continue
+            #   3) new error: save saved_error as fail, process new
+            #      error based on retry status
+            #   4) retry succeeds: log this error: status should be non-fail
+
+    def summary_line(self, line):
+        """Process one of the lines after the summary header."""
+
+        key, text = self.summary_lines[self.summary_index]
+        self.summary_index += 1
+        try:
+            self.summary[key] = process_summary_line(
+                line, text, self.file_name, self.line_num
+            )
+        except Exception as ex:
+            logger.error(
+                (
+                    "Unexpected exception processing summary, "
+                    "file: %s, line#: %d, key: %s, text: %s, line: %s, exception: %s"
+                ),
+                self.file_name,
+                self.line_num,
+                key,
+                text,
+                line,
+                ex,
+            )
+        self.results["stats"] = self.summary
+        if self.summary_index == len(self.summary_lines):
+            self.state = self.BODY
+
+
+def process_park(file_name):
+    """Return statistics for a single log file (each park is logged separately)."""
+
+    parser = ParkParser(file_name)
+    encoding = detect_encoding(file_name)
+    if encoding in ("utf-8", "utf-8-sig", "cp1252") and not is_compressed(file_name):
+        feed_mapped_file(parser, file_name, encoding)
+    else:
+        with open_log(file_name) as binary_file:
+            # Split lines on \n only; the error name line ends with \r\r\n
+            file_handle = io.TextIOWrapper(
+                binary_file, encoding=encoding, errors="replace", newline="\n"
+            )
+            parser.feed_lines(line.rstrip("\r\n") + "\n" for line in file_handle)
+    return parser.finish()
+
+
+def is_compressed(file_name):
+    """Return True if file_name is a compressed (gzip) log file."""
+
+    return file_name.lower().endswith(".gz")
+
+
+def open_log(file_name):
+    """Return a binary file object for reading the (possibly compressed) log file.
+
+    A compressed file is decompressed as it is read.
+    """
+
+    if is_compressed(file_name):
+        # BufferedReader adds the read1() that TextIOWrapper needs in Python 2
+        return io.BufferedReader(gzip.open(file_name, "rb"))
+    return open(file_name, "rb")
+
+
+def detect_encoding(file_name):
+    """Return the encoding of the log file file_name.
+
+    Robocopy writes ANSI (cp1252) log files, unless it is given the /UNILOG
+    option (UTF-16). Log files that have been edited may be UTF-8.
+    """
+
+    with open_log(file_name) as file_handle:
+        head = file_handle.read(64 * 1024)
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if head.count(b"\x00") > len(head) // 4:
+        # UTF-16 without a BOM; the high byte of ASCII characters is zero
+        if head[1::2].count(b"\x00") > head[::2].count(b"\x00"):
+            return "utf-16-le"
+        return "utf-16-be"
+    try:
+        # An incremental decoder allows a partial character at the end of head
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+    except UnicodeDecodeError:
+        return "cp1252"
+    return "utf-8"
+
+
+def feed_mapped_file(parser, file_name, encoding):
+    """Feed the lines in file_name that might change the parser to parser.
+
+    encoding must be ASCII compatible (i.e. utf-8 or cp1252).  The file is memory
+    mapped and the sentinels are found in the raw bytes, so only the lines that
+    are fed to the parser are copied and decoded.  Lines end with \n (any \r
+    before the \n is removed).
+    """
+
+    sentinels = [
+        sentinel.encode("ascii")
+        for sentinel in (
+            parser.error_sentinel,
+            parser.summary_header,
+            parser.finished_sentinel,
+            parser.paused_sentinel,
+        )
+    ]
+    with open(file_name, "rb") as file_handle:
+        size = os.fstat(file_handle.fileno()).st_size
+        if not size:
+            # An empty file cannot be mapped
+            return
+        buffer = mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = len(codecs.BOM_UTF8) if encoding == "utf-8-sig" else 0
+            # The position of the next occurrence of each sentinel (-1 is none)
+            hits = [buffer.find(sentinel, pos) for sentinel in sentinels]
+            line_num = parser.line_num
+            while pos < size and not parser.done:
+                if not parser.needs_next_line():
+                    # Skip to the start of the line with the next sentinel
+                    start = -1
+                    for i, sentinel in enumerate(sentinels):
+                        if -1 < hits[i] < pos:
+                            hits[i] = buffer.find(sentinel, pos)
+                        if hits[i] != -1 and (start == -1 or hits[i] < start):
+                            start = hits[i]
+                    if start == -1:
+                        # Count the remaining lines; the last may not end with \n
+                        line_num += count_lines(buffer, pos, size)
+                        if buffer[size - 1 : size] != b"\n":
+                            line_num += 1
+                        break
+                    newline = buffer.rfind(b"\n", pos, start)
+                    if newline != -1:
+                        start = newline + 1
+                    else:
+                        start = pos
+                    line_num += count_lines(buffer, pos, start)
+                    pos = start
+                end = buffer.find(b"\n", pos)
+                if end == -1:
+                    end = size
+                line = buffer[pos:end].rstrip(b"\r").decode(encoding, "replace")
+                parser.line_num = line_num
+                parser.feed(line + "\n")
+                line_num = parser.line_num
+                pos = end + 1
+            parser.line_num = line_num
+        finally:
+            buffer.close()
+
+
+def count_lines(buffer, start, end):
+    """Return the number of newlines in buffer[start:end] (without a large copy)."""
+
+    count = 0
+    while start < end:
+        stop = min(start + 1024 * 1024, end)
+        count += buffer[start:stop].count(b"\n")
+        start = stop
+    return count
 
 
 def clean_db(db_name):
@@ -342,54 +735,110 @@ def db_clear(database, drop=True):
         if drop:
             cursor.execute("DROP INDEX IF EXISTS changes_date_ix")
             cursor.execute("DROP INDEX IF EXISTS logs_date_ix")
+            cursor.execute("DROP INDEX IF EXISTS messages_hash_ix")
+            cursor.execute("DROP INDEX IF EXISTS messages_path_ix")
+            cursor.execute("DROP INDEX IF EXISTS logs_day_ix")
+            cursor.execute("DROP INDEX IF EXISTS errors_log_id_ix")
+            cursor.execute("DROP INDEX IF EXISTS logs_has_errors_ix")
+            cursor.execute("DROP INDEX IF EXISTS logs_park_id_ix")
+            cursor.execute("DROP INDEX IF EXISTS runs_started_ix")
+            cursor.execute("DROP INDEX IF EXISTS run_files_run_id_ix")
             cursor.execute("DROP TABLE IF EXISTS logs")
             cursor.execute("DROP TABLE IF EXISTS stats")
             cursor.execute("DROP TABLE IF EXISTS errors")
+            cursor.execute("DROP TABLE IF EXISTS messages")
             cursor.execute("DROP TABLE IF EXISTS changes")
+            cursor.execute("DROP TABLE IF EXISTS manifest")
+            cursor.execute("DROP TABLE IF EXISTS roots")
+            cursor.execute("DROP TABLE IF EXISTS runs")
+            cursor.execute("DROP TABLE IF EXISTS run_files")
+            cursor.execute("DROP TABLE IF EXISTS log_daily")
+            cursor.execute("DROP TABLE IF EXISTS parks")
+            cursor.execute("PRAGMA user_version = 0")
         else:
             cursor.execute("DELETE FROM logs")
             cursor.execute("DELETE FROM stats")
             cursor.execute("DELETE FROM errors")
             cursor.execute("DELETE FROM changes")
+            cursor.execute("DELETE FROM manifest")
+            cursor.execute("DELETE FROM messages")
+            cursor.execute("DELETE FROM roots")
+            cursor.execute("DELETE FROM runs")
+            cursor.execute("DELETE FROM run_files")
+            cursor.execute("DELETE FROM log_daily")
+            cursor.execute("DELETE FROM parks")
         database.commit()
     except sqlite3.OperationalError:
         pass
 
 
+# Days are stored as the number of days since 1970-01-01 (see date_to_day()).
+# In SQL, the date of a day is DATE(2440587.5 + day), and the day of a date is
+# CAST(JULIANDAY(date) - 2440587.5 AS INTEGER); 2440587.5 is the Julian day of
+# 1970-01-01.  count_errors is the number of failed errors, and has_errors is
+# 1 if there are any errors (failed or not).
+LOGS_TABLE_SQL = """
+    CREATE TABLE {0}(
+        log_id INTEGER PRIMARY KEY,
+        park_id INTEGER,
+        day INTEGER,
+        filename TEXT,
+        finished INTEGER,
+        count_errors INTEGER,
+        has_errors INTEGER,
+        FOREIGN KEY(park_id) REFERENCES parks(park_id));
+"""
+
+# The stats table has one row per log; the columns are named for the summary line
+# and the column in the summary of the log file, i.e. files_copied.
+STATS_COLUMNS = [
+    "{0}_{1}".format(line, column)
+    for line in ["dirs", "files", "bytes", "times"]
+    for column in ["total", "copied", "skipped", "mismatch", "failed", "extra"]
+]
+STATS_TABLE_SQL = """
+    CREATE TABLE {{0}}(
+        log_id INTEGER PRIMARY KEY,
+        {0},
+        FOREIGN KEY(log_id) REFERENCES logs(log_id));
+""".format(
+    ",\n        ".join(column + " INTEGER" for column in STATS_COLUMNS)
+)
+
+LOG_DAILY_TABLE_SQL = """
+    CREATE TABLE {0}(
+        day INTEGER PRIMARY KEY,
+        count_start INTEGER,
+        count_unfinished INTEGER,
+        count_with_errors INTEGER);
+"""
+
+
+# The indexes for the server's queries, as recommended by query_plans.py
+SERVER_INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS errors_log_id_ix "
+    "ON errors(log_id, error_code, failed, message_id)",
+    "CREATE INDEX IF NOT EXISTS logs_has_errors_ix ON logs(has_errors, day, park_id)",
+    "CREATE INDEX IF NOT EXISTS logs_park_id_ix ON logs(park_id, has_errors, day)",
+    "CREATE INDEX IF NOT EXISTS runs_started_ix ON runs(started)",
+    "CREATE INDEX IF NOT EXISTS run_files_run_id_ix ON run_files(run_id)",
+]
+
+
 def db_create(database):
     """Build any missing tables and indexes in the log file database."""
 
     cursor = database.cursor()
+    cursor.execute(LOGS_TABLE_SQL.format("IF NOT EXISTS logs"))
     cursor.execute(
         """
-        CREATE TABLE IF NOT EXISTS logs(
-            log_id INTEGER PRIMARY KEY,
-            park TEXT,
-            date TEXT,
-            filename TEXT,
-            finished INTEGER);
-    """
-    )
-    cursor.execute(
-        """
-        CREATE INDEX IF NOT EXISTS logs_date_ix ON logs(date);
-    """
-    )
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS stats(
-            stat_id INTEGER PRIMARY KEY,
-            log_id INTEGER NOT NULL,
-            stat TEXT,
-            copied INTEGER,
-            extra INTEGER,
-            failed INTEGER,
-            mismatch INTEGER,
-            skipped INTEGER,
-            total INTEGER,
-            FOREIGN KEY(log_id) REFERENCES logs(log_id));
+        CREATE TABLE IF NOT EXISTS parks(
+            park_id INTEGER PRIMARY KEY,
+            park TEXT NOT NULL,
+            UNIQUE(park));
     """
     )
+    cursor.execute(STATS_TABLE_SQL.format("IF NOT EXISTS stats"))
     cursor.execute(
         """
         CREATE TABLE IF NOT EXISTS error_codes(
@@ -406,9 +855,36 @@ def db_create(database):
             log_id INTEGER NOT NULL,
             line_num INTEGER,
             failed INTEGER,
-            message TEXT,
+            message_id INTEGER,
             FOREIGN KEY(error_code) REFERENCES error_codes(error_code),
-            FOREIGN KEY(log_id) REFERENCES logs(log_id));
+            FOREIGN KEY(log_id) REFERENCES logs(log_id),
+            FOREIGN KEY(message_id) REFERENCES messages(message_id));
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS messages(
+            message_id INTEGER PRIMARY KEY,
+            hash INTEGER NOT NULL,
+            message TEXT,
+            action TEXT,
+            root_id INTEGER,
+            path TEXT COLLATE NOCASE,
+            FOREIGN KEY(root_id) REFERENCES roots(root_id));
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS roots(
+            root_id INTEGER PRIMARY KEY,
+            root TEXT NOT NULL COLLATE NOCASE,
+            root_name TEXT,
+            UNIQUE(root));
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS messages_hash_ix ON messages(hash);
     """
     )
     cursor.execute(
@@ -418,61 +894,666 @@ def db_create(database):
             UNIQUE(date));
     """
     )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS manifest(
+            basename TEXT NOT NULL,
+            path TEXT,
+            size INTEGER,
+            mtime REAL,
+            hash TEXT,
+            log_id INTEGER,
+            UNIQUE(basename),
+            FOREIGN KEY(log_id) REFERENCES logs(log_id));
+    """
+    )
     cursor.execute(
         """
         CREATE INDEX IF NOT EXISTS changes_date_ix ON changes(date);
     """
     )
-    database.commit()
-
-
-def db_write_log(database, log):
-    """Write a log file summary to the log file database."""
-
-    cursor = database.cursor()
     cursor.execute(
         """
-        INSERT INTO logs (park, date, filename, finished)
-        VALUES (:park, :date, :filename, :finished)
-    """,
-        log,
+        CREATE TABLE IF NOT EXISTS runs(
+            run_id INTEGER PRIMARY KEY,
+            started TEXT,
+            processes INTEGER,
+            files INTEGER,
+            lines INTEGER,
+            bytes INTEGER,
+            seconds REAL,
+            cpu_seconds REAL,
+            glob_seconds REAL,
+            glob_cpu_seconds REAL,
+            parse_seconds REAL,
+            parse_cpu_seconds REAL,
+            write_seconds REAL,
+            write_cpu_seconds REAL,
+            clean_seconds REAL,
+            clean_cpu_seconds REAL,
+            changes_seconds REAL,
+            changes_cpu_seconds REAL,
+            peak_memory_kb INTEGER);
+    """
     )
-    log_id = cursor.lastrowid
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS run_files(
+            run_id INTEGER NOT NULL,
+            basename TEXT,
+            log_id INTEGER,
+            lines INTEGER,
+            bytes INTEGER,
+            parse_seconds REAL,
+            parse_cpu_seconds REAL,
+            write_seconds REAL,
+            FOREIGN KEY(run_id) REFERENCES runs(run_id));
+    """
+    )
+    # log_daily summarizes the logs for each day for the server; it is updated
+    # when the logs are written.
+    cursor.execute(LOG_DAILY_TABLE_SQL.format("IF NOT EXISTS log_daily"))
     database.commit()
-    return log_id
+    db_upgrade(database)
 
 
-def db_write_stats(database, stats):
-    """Write log file statistics to the log file database."""
+def db_upgrade(database):
+    """Upgrade the tables in an older log file database to the current schema.
+
+    The schema version is kept in the database's user_version pragma.
+    Version 1 moves the error messages into the messages table.
+    Version 2 splits the messages into an action, root and path.
+    Version 3 fills the log_facts and log_daily tables.
+    Version 4 uses park ids, day numbers and one stats row per log (see
+    db_upgrade_compact()); log_facts is merged into logs.
+    Version 5 adds the indexes for the server's queries (SERVER_INDEXES_SQL).
+    """
 
     cursor = database.cursor()
-    cursor.executemany(
-        """
-        INSERT INTO stats (log_id, stat, copied, extra, failed, mismatch, skipped, total)
-        VALUES (:log, :stat, :copied, :extra, :failed, :mismatch, :skipped, :total)
-    """,
-        stats,
-    )
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version >= 5:
+        return
+    moved_messages = False
+    compacted = False
+    # Manage the transaction here; the python 2 sqlite3 module commits before DDL.
+    isolation_level = database.isolation_level
     database.commit()
-
-
-def db_write_errors(database, errors):
-    """Write log file errors to the log file database."""
+    database.isolation_level = None
+    try:
+        cursor.execute("BEGIN")
+        if version < 1:
+            moved_messages = db_upgrade_messages(database)
+        if version < 2:
+            db_upgrade_message_paths(database)
+        if version < 4:
+            compacted = db_upgrade_compact(database)
+        if version < 5:
+            db_upgrade_indexes(database)
+        cursor.execute("PRAGMA user_version = 5")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        database.isolation_level = isolation_level
+    if moved_messages or compacted:
+        # Return the space used by the old errors table to the file system.
+        database.execute("VACUUM")
+
+
+def db_upgrade_messages(database):
+    """Move the message text in the errors table to the messages table.
+
+    Return True if the errors table was rebuilt. Does not commit.
+    """
 
     cursor = database.cursor()
-    cursor.executemany(
-        """
-        INSERT OR IGNORE INTO error_codes(error_code, error_name)
-        VALUES(:code, :name)
-    """,
-        errors,
-    )
-    cursor.executemany(
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(errors)")]
+    if "message" not in columns:
+        return False
+    logger.info("Moving the error messages into the messages table")
+    database.create_function("message_hash", 1, message_hash)
+    cursor.execute("ALTER TABLE errors RENAME TO errors_v0")
+    cursor.execute(
         """
-        INSERT INTO errors (error_code, log_id, line_num, failed, message)
-        VALUES (:code, :log, :line_num, :failed, :message)
+        CREATE TABLE errors(
+            error_id INTEGER PRIMARY KEY,
+            error_code INTEGER NOT NULL,
+            log_id INTEGER NOT NULL,
+            line_num INTEGER,
+            failed INTEGER,
+            message_id INTEGER,
+            FOREIGN KEY(error_code) REFERENCES error_codes(error_code),
+            FOREIGN KEY(log_id) REFERENCES logs(log_id),
+            FOREIGN KEY(message_id) REFERENCES messages(message_id));
+    """
+    )
+    cursor.execute(
+        """
+        INSERT INTO messages (hash, message)
+            SELECT message_hash(message), message FROM errors_v0
+            WHERE message IS NOT NULL GROUP BY message;
+    """
+    )
+    cursor.execute("CREATE INDEX messages_message_ix ON messages(message)")
+    cursor.execute(
+        """
+        INSERT INTO errors
+            (error_id, error_code, log_id, line_num, failed, message_id)
+            SELECT e.error_id, e.error_code, e.log_id, e.line_num, e.failed,
+                m.message_id
+            FROM errors_v0 AS e LEFT JOIN messages AS m
+            ON e.message = m.message;
+    """
+    )
+    cursor.execute("DROP INDEX messages_message_ix")
+    cursor.execute("DROP TABLE errors_v0")
+    return True
+
+
+def db_upgrade_message_paths(database):
+    """Split the messages in the messages table into an action, root and path.
+
+    Does not commit.
+    """
+
+    cursor = database.cursor()
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(messages)")]
+    if "action" not in columns:
+        cursor.execute("ALTER TABLE messages ADD COLUMN action TEXT")
+        cursor.execute(
+            "ALTER TABLE messages ADD COLUMN root_id INTEGER REFERENCES roots(root_id)"
+        )
+        cursor.execute("ALTER TABLE messages ADD COLUMN path TEXT COLLATE NOCASE")
+    rows = cursor.execute(
+        "SELECT message_id, message FROM messages WHERE action IS NULL"
+    ).fetchall()
+    if rows:
+        logger.info("Splitting the paths in %d error messages", len(rows))
+    messages = []
+    for message_id, message in rows:
+        parts = split_error_message(message or "")
+        parts["message_id"] = message_id
+        messages.append(parts)
+    root_ids = db_write_roots(database, messages)
+    for parts in messages:
+        parts["root_id"] = root_ids.get(parts["root"])
+    cursor.executemany(
+        """
+        UPDATE messages SET action = :action, root_id = :root_id, path = :path
+        WHERE message_id = :message_id
+    """,
+        messages,
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS messages_path_ix ON messages(root_id, path)"
+    )
+
+
+def db_upgrade_compact(database):
+    """Move the logs, stats and log_daily tables to the compact (version 4) layout.
+
+    The park and date in logs are replaced by a park_id (see the parks table) and
+    a day number, the error counts in the log_facts table are moved to logs, and
+    the rows for each summary line in stats are combined into one row per log.
+    Return True if the tables were rebuilt. Does not commit.
+    """
+
+    cursor = database.cursor()
+    compacted = False
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(logs)")]
+    if "date" in columns:
+        logger.info("Moving the logs to the compact layout")
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO parks (park)
+                SELECT DISTINCT park FROM logs WHERE park IS NOT NULL ORDER BY park
+        """
+        )
+        # Build a new table and rename it, so references to logs are kept
+        cursor.execute(LOGS_TABLE_SQL.format("logs_v4"))
+        cursor.execute(
+            """
+            INSERT INTO logs_v4 (log_id, park_id, day, filename, finished)
+                SELECT l.log_id, p.park_id,
+                    CAST(JULIANDAY(l.date) - 2440587.5 AS INTEGER),
+                    l.filename, l.finished
+                FROM logs AS l LEFT JOIN parks AS p ON l.park = p.park
+        """
+        )
+        cursor.execute("DROP TABLE logs")
+        cursor.execute("ALTER TABLE logs_v4 RENAME TO logs")
+        compacted = True
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(stats)")]
+    if "stat" in columns:
+        logger.info("Moving the stats to the compact layout")
+        cursor.execute(STATS_TABLE_SQL.format("stats_v4"))
+        pivot = [
+            "MAX(CASE WHEN stat = '{0}' THEN {1} END)".format(*column.split("_"))
+            for column in STATS_COLUMNS
+        ]
+        cursor.execute(
+            """
+            INSERT INTO stats_v4 (log_id, {0})
+                SELECT log_id, {1} FROM stats GROUP BY log_id
+        """.format(
+                ", ".join(STATS_COLUMNS), ", ".join(pivot)
+            )
+        )
+        cursor.execute("DROP TABLE stats")
+        cursor.execute("ALTER TABLE stats_v4 RENAME TO stats")
+        compacted = True
+    cursor.execute("DROP TABLE IF EXISTS log_facts")
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(log_daily)")]
+    if "date" in columns:
+        cursor.execute("DROP TABLE log_daily")
+        cursor.execute(LOG_DAILY_TABLE_SQL.format("log_daily"))
+    cursor.execute("CREATE INDEX IF NOT EXISTS logs_day_ix ON logs(day, park_id)")
+    if compacted:
+        db_rebuild_facts(database)
+    return compacted
+
+
+def db_upgrade_indexes(database):
+    """Create the indexes for the server's queries. Does not commit."""
+
+    logger.info("Adding the indexes for the server's queries")
+    cursor = database.cursor()
+    for sql in SERVER_INDEXES_SQL:
+        cursor.execute(sql)
+
+
+def db_rebuild_facts(database):
+    """Rebuild the error counts in logs, and the log_daily table from logs and errors.
+
+    Does not commit.
+    """
+
+    cursor = database.cursor()
+    cursor.execute(
+        """
+        CREATE TEMP TABLE error_counts(
+            log_id INTEGER PRIMARY KEY,
+            count_errors INTEGER);
+    """
+    )
+    cursor.execute(
+        """
+        INSERT INTO error_counts (log_id, count_errors)
+            SELECT log_id, SUM(CASE WHEN failed THEN 1 ELSE 0 END)
+            FROM errors GROUP BY log_id
+    """
+    )
+    cursor.execute(
+        """
+        UPDATE logs SET
+            count_errors = COALESCE(
+                (SELECT count_errors FROM error_counts AS e
+                WHERE e.log_id = logs.log_id), 0),
+            has_errors = EXISTS (
+                SELECT 1 FROM error_counts AS e WHERE e.log_id = logs.log_id)
+    """
+    )
+    cursor.execute("DROP TABLE temp.error_counts")
+    cursor.execute("DELETE FROM log_daily")
+    cursor.execute(
+        """
+        INSERT INTO log_daily (day, count_start, count_unfinished, count_with_errors)
+            SELECT day, COUNT(*),
+                SUM(CASE WHEN finished THEN 0 ELSE 1 END),
+                SUM(CASE WHEN count_errors > 0 THEN 1 ELSE 0 END)
+            FROM logs WHERE day IS NOT NULL GROUP BY day
+    """
+    )
+    days = cursor.execute("SELECT COUNT(*) FROM log_daily").fetchone()[0]
+    logger.info("Rebuilt the error counts and the daily summary for %d days", days)
+
+
+def rebuild_facts(db_name):
+    """Rebuild the error counts and the log_daily table in the database db_name."""
+
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        db_create(conn)
+        conn.execute("BEGIN")
+        db_rebuild_facts(conn)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def date_to_day(text):
+    """Return the day number (days since 1970-01-01) for a YYYY-MM-DD date.
+
+    Returns None if text is not a valid date.
+    """
+
+    try:
+        date = datetime.datetime.strptime(text, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+    return (date - datetime.date(1970, 1, 1)).days
+
+
+def error_counts(log):
+    """Return the count_errors and has_errors of a log (see process_park())."""
+
+    errors = log.get("errors") or []
+    return {
+        "count_errors": sum(1 for error in errors if error.get("failed")),
+        "has_errors": 1 if errors else 0,
+    }
+
+
+def db_update_daily(database, days):
+    """Recalculate the log_daily records for the days from the logs table.
+
+    Does not commit.
+    """
+
+    params = [(day,) for day in set(days)]
+    cursor = database.cursor()
+    cursor.executemany("DELETE FROM log_daily WHERE day = ?", params)
+    cursor.executemany(
+        """
+        INSERT INTO log_daily (day, count_start, count_unfinished, count_with_errors)
+        SELECT day, COUNT(*),
+            SUM(CASE WHEN finished THEN 0 ELSE 1 END),
+            SUM(CASE WHEN count_errors > 0 THEN 1 ELSE 0 END)
+        FROM logs WHERE day = ? GROUP BY day
     """,
-        errors,
+        params,
+    )
+
+
+def db_write_log(database, log, commit=True):
+    """Write a log file summary to the log file database.
+
+    Use commit=False when the caller is managing the transaction (see main()).
+    """
+
+    record = {
+        "park": log["park"],
+        "day": date_to_day(log["date"]),
+        "filename": log["filename"],
+        "finished": log["finished"],
+    }
+    record.update(error_counts(log))
+    cursor = database.cursor()
+    cursor.execute("INSERT OR IGNORE INTO parks (park) VALUES (:park)", record)
+    cursor.execute(
+        """
+        INSERT INTO logs (park_id, day, filename, finished, count_errors, has_errors)
+        VALUES ((SELECT park_id FROM parks WHERE park = :park), :day, :filename,
+            :finished, :count_errors, :has_errors)
+    """,
+        record,
+    )
+    log_id = cursor.lastrowid
+    db_update_daily(database, [record["day"]])
+    if commit:
+        database.commit()
+    return log_id
+
+
+def db_update_log(database, log_id, log):
+    """Update the finished status and error counts of a log in the database.
+
+    Does not commit.
+    """
+
+    record = {"log_id": log_id, "finished": log["finished"]}
+    record.update(error_counts(log))
+    cursor = database.cursor()
+    cursor.execute(
+        """
+        UPDATE logs SET finished = :finished, count_errors = :count_errors,
+            has_errors = :has_errors
+        WHERE log_id = :log_id
+    """,
+        record,
+    )
+    db_update_daily(database, [date_to_day(log["date"])])
+
+
+def db_write_stats(database, stats, commit=True):
+    """Write log file statistics to the log file database.
+
+    stats is a list of the summary lines (with the log and stat names); the
+    lines for a log are written as one row.
+    """
+
+    rows = {}
+    for obj in stats:
+        row = rows.get(obj["log"])
+        if row is None:
+            row = rows[obj["log"]] = dict.fromkeys(STATS_COLUMNS)
+            row["log_id"] = obj["log"]
+        for column in ["total", "copied", "skipped", "mismatch", "failed", "extra"]:
+            row["{0}_{1}".format(obj["stat"], column)] = obj[column]
+    cursor = database.cursor()
+    cursor.executemany(
+        "INSERT INTO stats (log_id, {0}) VALUES (:log_id, {1})".format(
+            ", ".join(STATS_COLUMNS),
+            ", ".join(":" + column for column in STATS_COLUMNS),
+        ),
+        list(rows.values()),
+    )
+    if commit:
+        database.commit()
+
+
+def db_write_errors(database, errors, commit=True):
+    """Write log file errors to the log file database."""
+
+    cursor = database.cursor()
+    # Most errors in a log file share a handful of error codes.
+    codes = {}
+    for error in errors:
+        codes[error["code"]] = error
+    cursor.executemany(
+        """
+        INSERT OR IGNORE INTO error_codes(error_code, error_name)
+        VALUES(:code, :name)
+    """,
+        list(codes.values()),
+    )
+    message_ids = db_write_messages(database, errors)
+    for error in errors:
+        error["message_id"] = message_ids[error["message"]]
+    batch_size = Config.error_batch_size
+    for start in range(0, len(errors), batch_size):
+        cursor.executemany(
+            """
+            INSERT INTO errors (error_code, log_id, line_num, failed, message_id)
+            VALUES (:code, :log, :line_num, :failed, :message_id)
+        """,
+            errors[start : start + batch_size],
+        )
+    if commit:
+        database.commit()
+
+
+def db_write_messages(database, errors):
+    """Return a dictionary of message_ids keyed by the message of each error in errors.
+
+    Messages that are not in the messages table are added; Does not commit.
+    The same messages (file paths) repeat for many nights, so each message is
+    stored once, and found by its hash.
+    """
+
+    cursor = database.cursor()
+    keys = {}
+    for error in errors:
+        if error["message"] not in keys:
+            keys[error["message"]] = (message_hash(error["message"]), error)
+    # Look up the known messages in batches; sqlite allows 999 parameters per query.
+    known = {}
+    hashes = list(set(key for key, _ in keys.values()))
+    for start in range(0, len(hashes), 500):
+        batch = hashes[start : start + 500]
+        rows = cursor.execute(
+            "SELECT message_id, message FROM messages WHERE hash IN ({0})".format(
+                ",".join("?" * len(batch))
+            ),
+            batch,
+        )
+        for message_id, message in rows:
+            known[message] = message_id
+    new_errors = [error for message, (_, error) in keys.items() if message not in known]
+    root_ids = db_write_roots(database, new_errors)
+    message_ids = {}
+    for message, (key, error) in keys.items():
+        if message in known:
+            message_ids[message] = known[message]
+        else:
+            cursor.execute(
+                """
+                INSERT INTO messages (hash, message, action, root_id, path)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                [
+                    key,
+                    message,
+                    error.get("action"),
+                    root_ids.get(error.get("root")),
+                    error.get("path"),
+                ],
+            )
+            message_ids[message] = cursor.lastrowid
+    return message_ids
+
+
+def db_write_roots(database, messages):
+    """Return a dictionary of root_ids keyed by the root of each message in messages.
+
+    messages is a list of dictionaries from split_error_message().
+    Roots that are not in the roots table are added; Does not commit.
+    """
+
+    cursor = database.cursor()
+    root_ids = {}
+    for parts in messages:
+        root = parts.get("root")
+        if root is None or root in root_ids:
+            continue
+        cursor.execute(
+            "INSERT OR IGNORE INTO roots (root, root_name) VALUES (?, ?)",
+            [root, parts["root_name"]],
+        )
+        row = cursor.execute(
+            "SELECT root_id FROM roots WHERE root = ?", [root]
+        ).fetchone()
+        root_ids[root] = row[0]
+    return root_ids
+
+
+def message_hash(message):
+    """Return a 60 bit integer hash of the message text (None for no message)."""
+
+    if message is None:
+        return None
+    return int(hashlib.sha1(message.encode("utf-8")).hexdigest()[:15], 16)
+
+
+def db_read_manifest(database):
+    """Return a dictionary of the manifest records keyed by the file's basename."""
+
+    cursor = database.cursor()
+    rows = cursor.execute(
+        "SELECT basename, size, mtime, hash, log_id FROM manifest"
+    ).fetchall()
+    manifest = {}
+    for basename, size, mtime, file_hash, log_id in rows:
+        manifest[basename] = {
+            "size": size,
+            "mtime": mtime,
+            "hash": file_hash,
+            "log_id": log_id,
+        }
+    return manifest
+
+
+def db_write_manifest(database, info, log_id):
+    """Add or replace the manifest record for a log file; Does not commit.
+
+    info is the file information from file_info().
+    """
+
+    record = dict(info)
+    record["log"] = log_id
+    cursor = database.cursor()
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO manifest (basename, path, size, mtime, hash, log_id)
+        VALUES (:basename, :path, :size, :mtime, :hash, :log)
+    """,
+        record,
+    )
+
+
+def db_find_logs(database, filename):
+    """Return a list of the log_ids for the log file filename."""
+
+    cursor = database.cursor()
+    rows = cursor.execute(
+        "SELECT log_id FROM logs WHERE filename = ?", [filename]
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def db_delete_logs(database, log_ids):
+    """Delete the logs, with their errors and stats, in the list log_ids.
+
+    Does not commit.
+    """
+
+    params = [(log_id,) for log_id in log_ids]
+    cursor = database.cursor()
+    days = set()
+    for param in params:
+        rows = cursor.execute("SELECT day FROM logs WHERE log_id = ?", param)
+        days.update(row[0] for row in rows)
+    cursor.executemany("DELETE FROM errors WHERE log_id = ?", params)
+    cursor.executemany("DELETE FROM stats WHERE log_id = ?", params)
+    cursor.executemany("DELETE FROM manifest WHERE log_id = ?", params)
+    cursor.executemany("DELETE FROM logs WHERE log_id = ?", params)
+    db_update_daily(database, days)
+
+
+def db_write_run(database, run):
+    """Write the statistics for a processor run (a RunStats) to the database.
+
+    Writes a record in the runs table, and a record in the run_files table for
+    each log file.
+    """
+
+    record = run.record()
+    cursor = database.cursor()
+    cursor.execute(
+        """
+        INSERT INTO runs (started, processes, files, lines, bytes, seconds,
+            cpu_seconds, glob_seconds, glob_cpu_seconds, parse_seconds,
+            parse_cpu_seconds, write_seconds, write_cpu_seconds, clean_seconds,
+            clean_cpu_seconds, changes_seconds, changes_cpu_seconds, peak_memory_kb)
+        VALUES (:started, :processes, :files, :lines, :bytes, :seconds,
+            :cpu_seconds, :glob_seconds, :glob_cpu_seconds, :parse_seconds,
+            :parse_cpu_seconds, :write_seconds, :write_cpu_seconds, :clean_seconds,
+            :clean_cpu_seconds, :changes_seconds, :changes_cpu_seconds,
+            :peak_memory_kb)
+    """,
+        record,
+    )
+    run_id = cursor.lastrowid
+    files = [dict(item, run=run_id) for item in run.files]
+    cursor.executemany(
+        """
+        INSERT INTO run_files (run_id, basename, log_id, lines, bytes,
+            parse_seconds, parse_cpu_seconds, write_seconds)
+        VALUES (:run, :basename, :log_id, :lines, :bytes,
+            :parse_seconds, :parse_cpu_seconds, :write_seconds)
+    """,
+        files,
     )
     database.commit()
 
@@ -492,122 +1573,973 @@ def db_write_change(database, dates):
 
 
 def main(db_name, log_folder):
-    """Find all new log files and summarize in log file database."""
+    """Find all new log files and summarize in log file database.
 
-    filelist = glob.glob(os.path.join(log_folder, "*-update-x-drive.log"))
+    Log files that are in the manifest table (i.e. have been processed before)
+    are skipped if they have not changed, and replaced if they have changed.
+    The time for each phase of the run is written to the runs table.
+    """
+
+    run = RunStats()
+    run.start("glob")
+    # Sort the files so the log_ids are assigned in a repeatable order.
+    filelist = sorted(glob.glob(os.path.join(log_folder, "*-update-x-drive.log")))
+    run.stop("glob")
     if not filelist:
         logger.error("No robocopy log files were found")
-    with sqlite3.connect(db_name) as conn:
+    # All the log files are written in a single transaction (one commit).  Each
+    # log file is written in a savepoint, so a failure only rolls back that file.
+    # isolation_level=None stops the sqlite3 module from managing transactions.
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        db_create(conn)
+        run.start("glob")
+        manifest = db_read_manifest(conn)
+        todo = []
         for filename in filelist:
-            try:
-                no_errors = True
-                no_fails = True
-                no_mismatch = True
-                logger.info("Processing %s", filename)
-                log = process_park(filename)
-                if not log:
-                    logger.error("The log object for %s is empty", filename)
-                    continue
-                for item in ["park", "date", "filename", "finished"]:
-                    if item not in log:
-                        logger.error(
-                            'The log object for %s is bad; "%s" is missing',
-                            filename,
-                            item,
-                        )
-                        continue
-                if log["finished"] is None:
-                    logger.warning(
-                        (
-                            "%s on %s: Robocopy had to be killed "
-                            "(it was copying a very large file when asked to pause)"
-                        ),
-                        log["park"],
-                        log["date"],
-                    )
+            known = manifest.get(os.path.basename(filename))
+            if known:
                 try:
-                    log_id = db_write_log(conn, log)
-                except sqlite3.Error as ex:
-                    logger.error("Writing log %s to DB; %s", filename, ex)
-                if not log_id:
-                    logger.error("No Log ID returned from DB for log file %s", filename)
+                    stat = os.stat(filename)
+                except OSError as ex:
+                    # The file was moved or deleted since the glob
+                    logger.error(
+                        "Unable to read log file: %s, exception: %s", filename, ex
+                    )
                     continue
-                if "errors" in log:
-                    for error in log["errors"]:
-                        error["log"] = log_id
-                        for attrib in ["code", "failed", "name", "line_num", "message"]:
-                            if attrib not in error:
-                                logger.error(
-                                    "Bad errors object in log file %s, missing: %s in %s",
-                                    filename,
-                                    attrib,
-                                    error,
-                                )
-                                continue
-                        no_errors = False
-                    try:
-                        db_write_errors(conn, log["errors"])
-                    except sqlite3.Error as ex:
-                        logger.error(
-                            "Writing errors for log %s to DB; %s", filename, ex
-                        )
-                if "stats" in log:
-                    stats = []
-                    for stat in ["dirs", "files", "bytes", "times"]:
-                        if stat not in log["stats"]:
-                            logger.error(
-                                "Bad stats object in log file %s, missing: %s",
-                                filename,
-                                stat,
-                            )
-                            continue
-                        obj = log["stats"][stat]
-                        for item in [
-                            "copied",
-                            "extra",
-                            "failed",
-                            "mismatch",
-                            "skipped",
-                            "total",
-                        ]:
-                            if item not in obj:
-                                logger.error(
-                                    "Bad stats object in log file %s, missing: %s/%s",
-                                    filename,
-                                    stat,
-                                    item,
-                                )
-                                continue
-                        obj["log"] = log_id
-                        obj["stat"] = stat
-                        stats.append(obj)
-                        if obj["failed"]:
-                            no_fails = False
-                        if obj["mismatch"]:
-                            no_mismatch = False
-                    try:
-                        db_write_stats(conn, stats)
-                    except sqlite3.Error as ex:
-                        logger.error("Writing stats for log %s to DB; %s", filename, ex)
-                else:
-                    # We do not expect to get stats when robocopy didn't finish
-                    # (finished == False or None)
-                    if log["finished"]:
-                        logger.error("No stats for log %s", filename)
-
-                # In daily processing, I want an error email when there are
-                #  issues in a log file currently even recovered errors send an error
-                if not no_errors or not no_fails or not no_mismatch:
-                    logger.warning("The log file %s has errors", filename)
-
+                if known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                    logger.info("Skipping %s; it was already processed", filename)
+                    continue
+                todo.append((filename, known["hash"]))
+            else:
+                todo.append((filename, None))
+        run.stop("glob")
+        conn.execute("BEGIN")
+        for filename, info, log in run.timed("parse", parse_parks(todo)):
+            run.start("write")
+            conn.execute("SAVEPOINT log_file")
+            log_id = None
+            try:
+                log_id = write_manifest_park(conn, filename, info, log, manifest)
+            except sqlite3.Error as ex:
+                conn.execute("ROLLBACK TO log_file")
+                logger.error("Writing log %s to DB (rolled back); %s", filename, ex)
             except Exception as ex:
+                conn.execute("ROLLBACK TO log_file")
                 logger.error(
                     "Unexpected exception processing log file: %s, exception: %s",
                     filename,
                     ex,
                 )
+            conn.execute("RELEASE log_file")
+            run.add_file(info, log, log_id, run.stop("write"))
+        run.start("write")
+        conn.execute("COMMIT")
+        run.stop("write")
+    finally:
+        conn.close()
+    run.start("clean")
     clean_folder(log_folder)
+    run.stop("clean")
+    run.start("changes")
     get_changes(db_name)
+    run.stop("changes")
+    try:
+        with sqlite3.connect(db_name) as conn:
+            db_write_run(conn, run)
+    except sqlite3.Error as ex:
+        logger.error("Writing the run statistics to the DB; %s", ex)
+
+
+def write_manifest_park(conn, filename, info, log, manifest):
+    """Write the log for filename to the database, and record it in the manifest.
+
+    info is the file information from parse_park(). manifest is the result of
+    db_read_manifest(). If the file has been processed before, the old records
+    are replaced. Does not commit. Returns the log_id of the log (or None).
+    """
+
+    if info is None:
+        # parse_park() could not read the file (error was logged)
+        return None
+    known = manifest.get(info["basename"])
+    if known and known["hash"] == info["hash"]:
+        logger.info("Skipping %s; the contents were already processed", filename)
+        db_write_manifest(conn, info, known["log_id"])
+        return known["log_id"]
+    if known:
+        old_log_ids = [known["log_id"]]
+    else:
+        # Logs processed before the manifest existed are only known by filename
+        old_log_ids = db_find_logs(conn, filename)
+    if old_log_ids:
+        logger.info("Replacing the previously processed log file %s", filename)
+        db_delete_logs(conn, old_log_ids)
+    log_id = write_park(conn, filename, log)
+    if log_id:
+        db_write_manifest(conn, info, log_id)
+    return log_id
+
+
+class RunStats(object):
+    """The wall and CPU time of each phase of a processor run (see db_write_run()).
+
+    The CPU time is for this process. The time to parse each file (which may be
+    in a parse worker process) is in files.
+    """
+
+    # pylint: disable=useless-object-inheritance
+
+    phases = ["glob", "parse", "write", "clean", "changes"]
+
+    def __init__(self):
+        self.started = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.start_time = time.time()
+        self.start_cpu = cpu_time()
+        self.seconds = dict((phase, 0.0) for phase in self.phases)
+        self.cpu_seconds = dict((phase, 0.0) for phase in self.phases)
+        self.phase_start = {}
+        self.files = []
+
+    def start(self, phase):
+        """Start timing phase."""
+
+        self.phase_start[phase] = (time.time(), cpu_time())
+
+    def stop(self, phase):
+        """Stop timing phase, and return the seconds since start(phase)."""
+
+        start, start_cpu = self.phase_start.pop(phase)
+        seconds = time.time() - start
+        self.seconds[phase] += seconds
+        self.cpu_seconds[phase] += cpu_time() - start_cpu
+        return seconds
+
+    def timed(self, phase, items):
+        """Yield each item in the iterator items; the time to get an item is in phase."""
+
+        while True:
+            self.start(phase)
+            try:
+                item = next(items)
+            except StopIteration:
+                self.stop(phase)
+                return
+            self.stop(phase)
+            yield item
+
+    def add_file(self, info, log, log_id, write_seconds):
+        """Add the statistics for a log file; info and log are from parse_park()."""
+
+        if info is None:
+            return
+        self.files.append(
+            {
+                "basename": info["basename"],
+                "log_id": log_id,
+                "lines": log.get("lines") if log else None,
+                "bytes": info["size"],
+                "parse_seconds": info.get("parse_seconds"),
+                "parse_cpu_seconds": info.get("parse_cpu_seconds"),
+                "write_seconds": write_seconds,
+            }
+        )
+
+    def record(self):
+        """Return the record for the runs table (the run is done)."""
+
+        record = {
+            "started": self.started,
+            "processes": Config.parse_processes,
+            "files": len(self.files),
+            "lines": sum(item["lines"] or 0 for item in self.files),
+            "bytes": sum(item["bytes"] for item in self.files),
+            "seconds": time.time() - self.start_time,
+            "cpu_seconds": cpu_time() - self.start_cpu,
+            "peak_memory_kb": peak_memory(),
+        }
+        for phase in self.phases:
+            record[phase + "_seconds"] = self.seconds[phase]
+            record[phase + "_cpu_seconds"] = self.cpu_seconds[phase]
+        return record
+
+
+def cpu_time():
+    """Return the user and system CPU seconds used by this process."""
+
+    times = os.times()
+    return times[0] + times[1]
+
+
+class ProcessMemoryCounters(ctypes.Structure):
+    """The PROCESS_MEMORY_COUNTERS structure for GetProcessMemoryInfo() on Windows."""
+
+    # pylint: disable=too-few-public-methods
+
+    # The field names must be str in python 2
+    _fields_ = [(str("cb"), ctypes.c_ulong), (str("PageFaultCount"), ctypes.c_ulong)]
+    _fields_ += [
+        (str(name), ctypes.c_size_t)
+        for name in [
+            "PeakWorkingSetSize",
+            "WorkingSetSize",
+            "QuotaPeakPagedPoolUsage",
+            "QuotaPagedPoolUsage",
+            "QuotaPeakNonPagedPoolUsage",
+            "QuotaNonPagedPoolUsage",
+            "PagefileUsage",
+            "PeakPagefileUsage",
+        ]
+    ]
+
+
+def peak_memory():
+    """Return the peak memory (resident set size) of this process in KB, or None."""
+
+    try:
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform == "darwin":
+                # ru_maxrss is in bytes on a mac, and KB on linux
+                peak //= 1024
+            return peak
+        get_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_process.restype = ctypes.c_void_p
+        get_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_info.argtypes = [
+            ctypes.c_void_p,
+            ctypes.POINTER(ProcessMemoryCounters),
+            ctypes.c_ulong,
+        ]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if get_info(get_process(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize // 1024
+    except Exception as ex:
+        logger.info("Unable to get the peak memory of the process; %s", ex)
+    return None
+
+
+def parse_parks(items, processes=None):
+    """Parse log files and yield (filename, file info, log) in the order of items.
+
+    items is a list of (filename, known hash) tuples; see parse_park().
+    The files are parsed in a pool of `processes` worker processes (default is
+    Config.parse_processes).  The log records created by a worker are returned
+    with the results, and sent to the logger in this process, so the log file,
+    database, and email handlers are only used by this process.
+    """
+
+    if processes is None:
+        processes = Config.parse_processes
+    if processes < 2 or len(items) < 2:
+        for item in items:
+            filename, info, log, _ = parse_park(*item)
+            yield filename, info, log
+        return
+    pool = multiprocessing.Pool(min(processes, len(items)), init_parse_worker)
+    try:
+        for filename, info, log, records in pool.imap(parse_park_item, items):
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            yield filename, info, log
+    finally:
+        pool.close()
+        pool.join()
+
+
+class RecordCollector(logging.Handler):
+    """A logging handler that saves records so a worker can return them to main()."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        """Save a picklable copy of record."""
+
+        # Merge the args and exception text into the message; they may not be picklable
+        # (this is what logging.handlers.QueueHandler.prepare() does in Python 3).
+        # Keep the unmerged message, so an email digest can still group the records.
+        record.template = "{0}".format(record.msg)
+        record.msg = self.format(record)
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        self.records.append(record)
+
+
+# Set by init_parse_worker() in each worker process, None in the main process.
+_collector = None
+
+
+def init_parse_worker():
+    """Replace the log handlers in a parse worker with a RecordCollector."""
+
+    # pylint: disable=global-statement
+    global _collector
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    _collector = RecordCollector()
+    root.addHandler(_collector)
+
+
+def parse_park_item(item):
+    """Return parse_park(*item); for use with Pool.imap()."""
+
+    return parse_park(*item)
+
+
+def parse_park(filename, known_hash=None):
+    """Return (filename, file info, log, log records) for the log file filename.
+
+    file info is a dictionary with the basename, path, size, mtime and hash of the
+    file, and the wall and CPU seconds to read and parse it, or None if the file
+    could not be read.  log is None if the file could
+    not be processed, or if the hash of the file matches known_hash.  log records
+    is the list of log records created while processing filename in a parse
+    worker process.
+    """
+
+    logger.info("Processing %s", filename)
+    start = time.time()
+    start_cpu = cpu_time()
+    log = None
+    try:
+        info = file_info(filename)
+    except (IOError, OSError) as ex:
+        logger.error("Unable to read log file: %s, exception: %s", filename, ex)
+        info = None
+    if info is not None and info["hash"] != known_hash:
+        try:
+            log = process_park(filename)
+        except Exception as ex:
+            logger.error(
+                "Unexpected exception processing log file: %s, exception: %s",
+                filename,
+                ex,
+            )
+    if info is not None:
+        info["parse_seconds"] = time.time() - start
+        info["parse_cpu_seconds"] = cpu_time() - start_cpu
+    records = []
+    if _collector is not None:
+        records = _collector.records
+        _collector.records = []
+    return filename, info, log, records
+
+
+def file_info(filename):
+    """Return the manifest information (name, size, mtime and hash) for filename.
+
+    The hash of a compressed file is the hash of the uncompressed contents.
+    """
+
+    stat = os.stat(filename)
+    sha1 = hashlib.sha1()
+    with open_log(filename) as file_handle:
+        for chunk in iter(lambda: file_handle.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    return {
+        "basename": log_basename(filename),
+        "path": filename,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "hash": sha1.hexdigest(),
+    }
+
+
+def log_basename(filename):
+    """Return the name of the log file filename without the folder or .gz suffix.
+
+    filename may be a Windows path from the database.
+    """
+
+    name = os.path.basename(filename.replace("\\", "/"))
+    if is_compressed(name):
+        name = name[:-3]
+    return name
+
+
+def write_park(conn, filename, log):
+    """Write the log (results of process_park(filename)) to the database conn.
+
+    Return the log_id of the new log record, or None if the log was not written.
+    Does not commit. Database errors are raised so the caller can roll back the
+    partially written log file.
+    """
+
+    no_errors = True
+    no_fails = True
+    no_mismatch = True
+    if not log:
+        logger.error("The log object for %s is empty", filename)
+        return
+    for item in ["park", "date", "filename", "finished"]:
+        if item not in log:
+            logger.error(
+                'The log object for %s is bad; "%s" is missing',
+                filename,
+                item,
+            )
+            continue
+    if log["finished"] is None:
+        logger.warning(
+            (
+                "%s on %s: Robocopy had to be killed "
+                "(it was copying a very large file when asked to pause)"
+            ),
+            log["park"],
+            log["date"],
+        )
+    log_id = db_write_log(conn, log, commit=False)
+    if not log_id:
+        logger.error("No Log ID returned from DB for log file %s", filename)
+        return
+    if "errors" in log:
+        for error in log["errors"]:
+            error["log"] = log_id
+            for attrib in ["code", "failed", "name", "line_num", "message"]:
+                if attrib not in error:
+                    logger.error(
+                        "Bad errors object in log file %s, missing: %s in %s",
+                        filename,
+                        attrib,
+                        error,
+                    )
+                    continue
+            no_errors = False
+        db_write_errors(conn, log["errors"], commit=False)
+    if "stats" in log:
+        stats = []
+        for stat in ["dirs", "files", "bytes", "times"]:
+            if stat not in log["stats"]:
+                logger.error(
+                    "Bad stats object in log file %s, missing: %s",
+                    filename,
+                    stat,
+                )
+                continue
+            obj = log["stats"][stat]
+            for item in [
+                "copied",
+                "extra",
+                "failed",
+                "mismatch",
+                "skipped",
+                "total",
+            ]:
+                if item not in obj:
+                    logger.error(
+                        "Bad stats object in log file %s, missing: %s/%s",
+                        filename,
+                        stat,
+                        item,
+                    )
+                    continue
+            obj["log"] = log_id
+            obj["stat"] = stat
+            stats.append(obj)
+            if obj["failed"]:
+                no_fails = False
+            if obj["mismatch"]:
+                no_mismatch = False
+        db_write_stats(conn, stats, commit=False)
+    else:
+        # We do not expect to get stats when robocopy didn't finish
+        # (finished == False or None)
+        if log["finished"]:
+            logger.error("No stats for log %s", filename)
+
+    # In daily processing, I want an error email when there are
+    #  issues in a log file currently even recovered errors send an error
+    if not no_errors or not no_fails or not no_mismatch:
+        logger.warning("The log file %s has errors", filename)
+    return log_id
+
+
+class LogFollower(object):
+    """Reads a log file while it is being written by robocopy.
+
+    Each call to read() feeds the complete lines added since the last read to a
+    ParkParser, so the parser state (e.g. an error that is retrying) is kept
+    between reads, and the file is never read from the start again.
+    """
+
+    # pylint: disable=useless-object-inheritance
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.parser = ParkParser(filename)
+        self.offset = 0  # bytes in filename that have been fed to the parser
+        self.sha1 = hashlib.sha1()  # hash of the bytes that have been read
+        self.log_id = None  # log_id of the partial results in the database
+        self.errors_written = 0  # number of parser.results errors in the database
+        self.last_growth = time.time()
+        self.encoding = None  # set by the first read (see set_encoding())
+        self.newline = b"\n"  # a newline in the encoding
+
+    def set_encoding(self):
+        """Detect the encoding of the log file, as process_park() does.
+
+        Return False if the file is empty (the encoding is not known yet).
+        """
+
+        if not os.path.getsize(self.filename):
+            return False
+        encoding = detect_encoding(self.filename)
+        if encoding == "utf-16":
+            # Each block is decoded separately, so it needs the byte order
+            with open(self.filename, "rb") as file_handle:
+                bom = file_handle.read(2)
+            encoding = "utf-16-le" if bom == codecs.BOM_UTF16_LE else "utf-16-be"
+        if encoding.startswith("utf-16"):
+            self.newline = "\n".encode(encoding)
+        self.encoding = encoding
+        return True
+
+    def read(self, final=False):
+        """Feed the new lines in the log file to the parser.
+
+        Return True if there were new lines. An incomplete last line is not read
+        unless final is True.
+        """
+
+        if self.encoding is None and not self.set_encoding():
+            return False
+        newline = self.newline
+        pending = b""
+        start = self.offset
+        with open(self.filename, "rb") as file_handle:
+            file_handle.seek(start)
+            for chunk in iter(lambda: file_handle.read(1024 * 1024), b""):
+                data = pending + chunk
+                end = data.rfind(newline)
+                while end > 0 and end % len(newline):
+                    # A two byte (UTF-16) newline must start at an even position
+                    end = data.rfind(newline, 0, end + len(newline) - 1)
+                end = end + len(newline) if end != -1 else 0
+                pending = data[end:]
+                self.sha1.update(data[:end])
+                self.feed(data[:end])
+                # Kept up to date, so a read error is retried after the fed lines
+                self.offset += end
+        if final and pending:
+            self.sha1.update(pending)
+            self.feed(pending)
+            self.offset += len(pending)
+        grew = self.offset > start
+        if grew:
+            self.last_growth = time.time()
+        return grew
+
+    def feed(self, data):
+        """Send the lines in data (bytes ending with a newline, or the end of the
+        file) to the parser.
+        """
+
+        if not data:
+            return
+        text = data.decode(self.encoding, "replace")
+        if not self.offset:
+            # The byte order mark is not part of the first line
+            text = text.lstrip("\ufeff")
+        lines = text.split("\n")
+        if not lines[-1]:
+            lines.pop()
+        # Match the lines from process_park() (split on \n only, \r removed).
+        self.parser.feed_lines(line.rstrip("\r") + "\n" for line in lines)
+
+    def is_complete(self, grew):
+        """Return True if robocopy is done writing the log file."""
+
+        if self.parser.results["finished"] is not None and not grew:
+            return True
+        return time.time() - self.last_growth > Config.follow_idle_seconds
+
+
+def follow(db_name, log_folder):
+    """Ingest the log files in log_folder while robocopy is writing them.
+
+    Runs until interrupted. The results so far (the errors found, with finished
+    = NULL) are written to the database after each poll, so the server can show
+    the progress of the nightly copy. When a log file is complete, the partial
+    results are replaced with the full results and the file is added to the
+    manifest, so main() will skip it. A log file that stops growing without the
+    end of run summary (e.g. robocopy was killed) is left for main() to parse.
+    """
+
+    followers = {}
+    completed = set()
+    while True:
+        filelist = sorted(glob.glob(os.path.join(log_folder, "*-update-x-drive.log")))
+        conn = sqlite3.connect(db_name, isolation_level=None)
+        try:
+            db_create(conn)
+            manifest = db_read_manifest(conn)
+            conn.execute("BEGIN")
+            for filename in filelist:
+                if filename in completed:
+                    continue
+                if filename not in followers:
+                    if os.path.basename(filename) in manifest:
+                        completed.add(filename)
+                        continue
+                    logger.info("Following %s", filename)
+                    followers[filename] = LogFollower(filename)
+                conn.execute("SAVEPOINT log_file")
+                try:
+                    if follow_park(conn, followers[filename]):
+                        completed.add(filename)
+                        del followers[filename]
+                except sqlite3.Error as ex:
+                    conn.execute("ROLLBACK TO log_file")
+                    logger.error("Writing log %s to DB (rolled back); %s", filename, ex)
+                except (IOError, OSError) as ex:
+                    # Keep the follower; the next poll reads from where it stopped
+                    conn.execute("ROLLBACK TO log_file")
+                    logger.info("Unable to read %s; %s", filename, ex)
+                except Exception as ex:
+                    conn.execute("ROLLBACK TO log_file")
+                    logger.error(
+                        "Unexpected exception following log file: %s, exception: %s",
+                        filename,
+                        ex,
+                    )
+                conn.execute("RELEASE log_file")
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        # Forget the files that were moved to the archive (by main())
+        for filename in list(followers):
+            if filename not in filelist:
+                del followers[filename]
+        completed.intersection_update(filelist)
+        time.sleep(Config.follow_poll_seconds)
+
+
+def follow_park(conn, follower):
+    """Write the results so far for follower's log file to the database conn.
+
+    Return True if the log file is complete (robocopy stopped writing it). The
+    full results are written only if robocopy wrote the end of run summary;
+    otherwise the partial results are kept and the file is parsed by main().
+    Does not commit.
+    """
+
+    grew = follower.read()
+    complete = follower.is_complete(grew)
+    if complete:
+        mtime = os.stat(follower.filename).st_mtime
+        grew = follower.read(final=True) or grew
+        if follower.parser.results["finished"] is not None:
+            log = follower.parser.finish()
+            info = {
+                "basename": os.path.basename(follower.filename),
+                "path": follower.filename,
+                "size": follower.offset,
+                "mtime": mtime,
+                "hash": follower.sha1.hexdigest(),
+            }
+            # An empty manifest will replace the partial results found by filename
+            write_manifest_park(conn, follower.filename, info, log, {})
+            return True
+        logger.info(
+            "No end of run summary in %s; leaving it for the next run",
+            follower.filename,
+        )
+    if not grew and follower.log_id is not None:
+        return complete
+    results = follower.parser.results
+    log_id = follower.log_id
+    if log_id is None:
+        # Take over the partial results of an earlier follower (e.g. before --follow
+        # was restarted); this follower has read the file from the start.
+        log_ids = db_find_logs(conn, follower.filename)
+        if log_ids:
+            log_id = log_ids[0]
+            db_delete_logs(conn, log_ids[1:])
+            conn.execute("DELETE FROM errors WHERE log_id = ?", [log_id])
+    if log_id is None:
+        log_id = db_write_log(conn, results, commit=False)
+    else:
+        db_update_log(conn, log_id, results)
+    errors = results["errors"][follower.errors_written :]
+    for error in errors:
+        error["log"] = log_id
+    db_write_errors(conn, errors, commit=False)
+    follower.log_id = log_id
+    follower.errors_written += len(errors)
+    return complete
+
+
+def backfill(db_name, log_folder, processes=None):
+    """Parse all the log files in the archive folders and merge them into db_name.
+
+    The files are parsed by a pool of `processes` worker processes (default is
+    Config.parse_processes), each writing to its own staging database in
+    Config.backfill_folder, then the staging databases are merged into the
+    log database.  Logs in the database from the same log files are replaced.
+    If the backfill is interrupted, run it again to resume; files in the staging
+    databases are not parsed again.
+    """
+
+    if processes is None:
+        processes = Config.parse_processes
+    staging_folder = Config.backfill_folder
+    if not os.path.exists(staging_folder):
+        os.mkdir(staging_folder)
+    done = set()
+    for staging_name in glob.glob(os.path.join(staging_folder, "*.db")):
+        with sqlite3.connect(staging_name) as conn:
+            db_create(conn)
+            done.update(row[0] for row in conn.execute("SELECT basename FROM manifest"))
+    if done:
+        logger.info("Resuming backfill; %d log files were already parsed", len(done))
+    files = {}
+    for pattern in ["*-update-x-drive.log.gz", "*-update-x-drive.log"]:
+        # An uncompressed file replaces a compressed file that may be incomplete
+        for filename in glob.glob(os.path.join(log_folder, "*archive", pattern)):
+            files[log_basename(filename)] = filename
+    todo = [files[name] for name in sorted(files) if name not in done]
+    total_bytes = sum(os.path.getsize(filename) for filename in todo)
+    logger.info(
+        "Backfill: %d log files (%.1f MB) to parse", len(todo), total_bytes / 1e6
+    )
+    if todo:
+        pool = multiprocessing.Pool(
+            max(1, min(processes, len(todo))), init_backfill_worker, (staging_folder,)
+        )
+        try:
+            start = time.time()
+            report_time = start
+            done_bytes = 0
+            results = pool.imap_unordered(backfill_park, todo)
+            for count, (_, size, records) in enumerate(results, 1):
+                for record in records:
+                    if record.levelno >= Config.backfill_log_level:
+                        logging.getLogger(record.name).handle(record)
+                done_bytes += size
+                now = time.time()
+                if now - report_time > Config.backfill_report_seconds:
+                    report_time = now
+                    logger.info(
+                        backfill_progress(
+                            count, len(todo), done_bytes, total_bytes, now - start
+                        )
+                    )
+            logger.info(
+                backfill_progress(
+                    len(todo), len(todo), done_bytes, total_bytes, time.time() - start
+                )
+            )
+        finally:
+            pool.close()
+            pool.join()
+    staging_names = sorted(glob.glob(os.path.join(staging_folder, "*.db")))
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        db_create(conn)
+        for staging_name in staging_names:
+            count = db_merge_staging(conn, staging_name)
+            logger.info("Backfill: merged %d logs from %s", count, staging_name)
+            os.remove(staging_name)
+            # A worker that was killed may leave a (rolled back) journal file
+            if os.path.exists(staging_name + "-journal"):
+                os.remove(staging_name + "-journal")
+    finally:
+        conn.close()
+    os.rmdir(staging_folder)
+
+
+def backfill_progress(count, total, done_bytes, total_bytes, seconds):
+    """Return a progress report (with throughput and ETA) for backfill()."""
+
+    rate = done_bytes / seconds if seconds else 0
+    eta = (total_bytes - done_bytes) / rate if rate else 0
+    return (
+        "Backfill: {0}/{1} log files, {2:.1f} files/sec, {3:.1f} MB/sec, "
+        "ETA {4}".format(
+            count,
+            total,
+            count / seconds if seconds else 0,
+            rate / 1e6,
+            datetime.timedelta(seconds=int(eta)),
+        )
+    )
+
+
+# Set by init_backfill_worker() in each backfill worker process.
+_staging = None
+
+
+def init_backfill_worker(staging_folder):
+    """Open a new staging database in staging_folder for this worker process."""
+
+    # pylint: disable=global-statement
+    global _staging
+    init_parse_worker()
+    staging_name = os.path.join(
+        staging_folder, "staging-{0}-{1}.db".format(os.getpid(), int(time.time()))
+    )
+    _staging = sqlite3.connect(staging_name, isolation_level=None)
+    db_create(_staging)
+
+
+def backfill_park(filename):
+    """Parse filename into the worker's staging database.
+
+    Return (filename, size, log records); see parse_park().  Each log file is
+    committed, so an interrupted backfill only parses the unfinished files again.
+    """
+
+    filename, info, log, records = parse_park(filename)
+    if log is not None:
+        _staging.execute("BEGIN")
+        try:
+            log_id = write_park(_staging, filename, log)
+            if log_id:
+                db_write_manifest(_staging, info, log_id)
+            _staging.execute("COMMIT")
+        except Exception as ex:
+            _staging.execute("ROLLBACK")
+            logger.error(
+                "Unexpected exception writing log file: %s to staging, exception: %s",
+                filename,
+                ex,
+            )
+        records += _collector.records
+        _collector.records = []
+    size = info["size"] if info else 0
+    return filename, size, records
+
+
+def db_merge_staging(database, staging_name):
+    """Merge the logs in the staging database staging_name into database.
+
+    Logs in database from the same log files are replaced.  Return the number of
+    logs merged.  database must have isolation_level=None; the merge is one
+    transaction.
+    """
+
+    database.execute("ATTACH DATABASE ? AS staging", [staging_name])
+    try:
+        database.execute("BEGIN")
+        try:
+            rows = database.execute("SELECT basename FROM staging.manifest")
+            staged = set(row[0] for row in rows)
+            rows = database.execute("SELECT log_id, filename FROM main.logs").fetchall()
+            old_log_ids = [
+                log_id for log_id, filename in rows if log_basename(filename) in staged
+            ]
+            db_delete_logs(database, old_log_ids)
+            offset = database.execute(
+                "SELECT COALESCE(MAX(log_id), 0) FROM main.logs"
+            ).fetchone()[0]
+            db_merge_staging_rows(database, offset)
+            database.execute("COMMIT")
+        except Exception:
+            database.execute("ROLLBACK")
+            raise
+    finally:
+        database.execute("DETACH DATABASE staging")
+    return len(staged)
+
+
+def db_merge_staging_rows(database, offset):
+    """Copy the rows in the attached staging database to the main database.
+
+    The staging log_ids are increased by offset, and the staging roots and
+    messages are matched to (or added to) the main roots and messages.
+    Does not commit.
+    """
+
+    cursor = database.cursor()
+    params = {"offset": offset}
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO main.parks (park)
+        SELECT park FROM staging.parks ORDER BY park
+    """
+    )
+    cursor.execute(
+        """
+        INSERT INTO main.logs
+            (log_id, park_id, day, filename, finished, count_errors, has_errors)
+        SELECT l.log_id + :offset, p.park_id, l.day, l.filename, l.finished,
+            l.count_errors, l.has_errors
+        FROM staging.logs AS l
+        LEFT JOIN staging.parks AS sp ON l.park_id = sp.park_id
+        LEFT JOIN main.parks AS p ON sp.park = p.park
+    """,
+        params,
+    )
+    cursor.execute(
+        """
+        INSERT INTO main.stats (log_id, {0})
+        SELECT log_id + :offset, {0}
+        FROM staging.stats
+    """.format(
+            ", ".join(STATS_COLUMNS)
+        ),
+        params,
+    )
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO main.error_codes (error_code, error_name)
+        SELECT error_code, error_name FROM staging.error_codes
+    """
+    )
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO main.roots (root, root_name)
+        SELECT root, root_name FROM staging.roots
+    """
+    )
+    cursor.execute(
+        """
+        INSERT INTO main.messages (hash, message, action, root_id, path)
+        SELECT sm.hash, sm.message, sm.action, r.root_id, sm.path
+        FROM staging.messages AS sm
+        LEFT JOIN staging.roots AS sr ON sm.root_id = sr.root_id
+        LEFT JOIN main.roots AS r ON sr.root = r.root
+        WHERE NOT EXISTS (
+            SELECT 1 FROM main.messages AS m
+            WHERE m.hash = sm.hash AND m.message = sm.message)
+    """
+    )
+    cursor.execute(
+        """
+        INSERT INTO main.errors (error_code, log_id, line_num, failed, message_id)
+        SELECT e.error_code, e.log_id + :offset, e.line_num, e.failed, m.message_id
+        FROM staging.errors AS e
+        LEFT JOIN staging.messages AS sm ON e.message_id = sm.message_id
+        LEFT JOIN main.messages AS m ON m.hash = sm.hash AND m.message = sm.message
+        ORDER BY e.error_id
+    """,
+        params,
+    )
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO main.manifest (basename, path, size, mtime, hash, log_id)
+        SELECT basename, path, size, mtime, hash, log_id + :offset
+        FROM staging.manifest
+    """,
+        params,
+    )
+    rows = cursor.execute("SELECT DISTINCT day FROM staging.logs").fetchall()
+    db_update_daily(database, [row[0] for row in rows])
+
+
+# The dated log files that clean_folder() moves to an archive folder and indexes.
+# The *-cmd.log files are not dated; the archived copy is replaced each time.
+ARCHIVED_LOGS = [
+    "*-update-x-drive.log",
+    "*-update-x-drive-output.log",
+    "*-robo-morning-kill.log",
+]
 
 
 def clean_folder(folder):
@@ -618,13 +2550,15 @@ def clean_folder(folder):
     archive_path = os.path.join(folder, archive)
     if not os.path.exists(archive_path):
         os.mkdir(archive_path)
-    filelist = glob.glob(os.path.join(folder, "*-update-x-drive.log"))
-    filelist += glob.glob(os.path.join(folder, "*-update-x-drive-output.log"))
-    filelist += glob.glob(os.path.join(folder, "*-robo-morning-kill.log"))
+    filelist = []
+    for pattern in ARCHIVED_LOGS:
+        filelist += glob.glob(os.path.join(folder, pattern))
+    archived = []
     for filename in filelist:
         try:
             new_name = os.path.join(archive_path, os.path.basename(filename))
             os.rename(filename, new_name)
+            archived.append(new_name)
         except Exception as ex:
             logger.error(
                 "Unexpected exception moving log file: %s to archive %s, exception: %s",
@@ -632,13 +2566,16 @@ def clean_folder(folder):
                 new_name,
                 ex,
             )
+    archive_logs(archived)
     # These log files do not have a date stamp, so be sure to remove the previous copy
     filelist = glob.glob(os.path.join(folder, "*-cmd.log"))
     for filename in filelist:
         try:
             new_name = os.path.join(archive_path, os.path.basename(filename))
-            if os.path.exists(new_name):
-                os.remove(new_name)
+            # An older copy may have been compressed and indexed (see index_log())
+            for old_name in (new_name, new_name + ".gz", new_name + ".idx"):
+                if os.path.exists(old_name):
+                    os.remove(old_name)
             os.rename(filename, new_name)
         except Exception as ex:
             logger.error(
@@ -649,6 +2586,139 @@ def clean_folder(folder):
             )
 
 
+def archive_logs(filelist, processes=None):
+    """Index, and compress, each archived log file in filelist (see index_log()).
+
+    The files are processed in a pool of `processes` worker processes (default is
+    Config.archive_processes).
+    """
+
+    if processes is None:
+        processes = Config.archive_processes
+    if not filelist:
+        return
+    if processes < 2 or len(filelist) < 2:
+        results = (archive_log_item(filename) for filename in filelist)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(min(processes, len(filelist)), init_parse_worker)
+        results = pool.imap_unordered(archive_log_item, filelist)
+    try:
+        for filename, error in results:
+            if error:
+                logger.error(
+                    "Unexpected exception archiving log file: %s, exception: %s",
+                    filename,
+                    error,
+                )
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def archive_log_item(filename):
+    """Return (filename, None) or (filename, error text) from index_log(filename)."""
+
+    try:
+        index_log(filename, Config.compress_archives)
+    except Exception as ex:
+        return filename, "{0}".format(ex)
+    return filename, None
+
+
+def index_log(filename, compress=False):
+    """Write a sparse line index (filename + ".idx") for the log file filename.
+
+    The index is a JSON object with the byte offset of the first line in each
+    block of Config.index_lines lines, so a line can be read without reading the
+    lines before it (see /logexcerpt in the server).  Lines end with \n, as they
+    do in process_park(). If compress is True, filename is replaced with a gzip
+    copy (filename + ".gz") in which each block is a separate gzip member, and the
+    offsets are to the start of each member.  The uncompressed file is deleted
+    only after the compressed copy and the index are complete, so an interrupted
+    copy is replaced the next time.  The compressed copy has the modification
+    time of the original.
+    """
+
+    stat = os.stat(filename)
+    encoding = detect_encoding(filename)
+    if encoding == "utf-16":
+        # Offsets into the middle of the file need the byte order
+        with open(filename, "rb") as file_handle:
+            bom = file_handle.read(2)
+        encoding = "utf-16-le" if bom == codecs.BOM_UTF16_LE else "utf-16-be"
+    if encoding.startswith("utf-16"):
+        newline = "\n".encode(encoding)
+    else:
+        newline = b"\n"
+    lines_per_block = Config.index_lines
+    offsets = []
+    new_name = filename + ".gz"
+    with open(filename, "rb") as in_file:
+        out_file = open(new_name, "wb") if compress else None
+        buffer = b""
+        if stat.st_size:
+            buffer = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = 0
+            while pos < stat.st_size or not offsets:
+                end = pos
+                for _ in range(lines_per_block):
+                    if end >= stat.st_size:
+                        break
+                    end = find_line_end(buffer, newline, end, stat.st_size)
+                if compress:
+                    offsets.append(out_file.tell())
+                    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                    out_file.write(compressor.compress(buffer[pos:end]))
+                    out_file.write(compressor.flush())
+                else:
+                    offsets.append(pos)
+                pos = end
+        finally:
+            if stat.st_size:
+                buffer.close()
+            if out_file:
+                out_file.close()
+    if compress:
+        os.utime(new_name, (stat.st_atime, stat.st_mtime))
+    index = {
+        "lines_per_block": lines_per_block,
+        "encoding": encoding,
+        "compressed": compress,
+        "offsets": offsets,
+    }
+    with open(filename + ".idx", "wb") as index_file:
+        index_file.write(json.dumps(index).encode("utf-8"))
+    if compress:
+        os.remove(filename)
+
+
+def find_line_end(buffer, newline, start, end):
+    """Return the position after the next newline in buffer[start:end], or end.
+
+    A two byte (UTF-16) newline must start at an even position.
+    """
+
+    pos = buffer.find(newline, start, end)
+    while pos != -1 and pos % len(newline):
+        pos = buffer.find(newline, pos + 1, end)
+    if pos == -1:
+        return end
+    return pos + len(newline)
+
+
+def compress_archives(folder):
+    """Compress and index the uncompressed log files in the archive folders."""
+
+    filelist = []
+    for pattern in ARCHIVED_LOGS:
+        filelist += glob.glob(os.path.join(folder, "*archive", pattern))
+    logger.info("Compressing %d archived log files", len(filelist))
+    archive_logs(filelist)
+
+
 def get_dates_from(change_log, since):
     """Open `change_log` and return a list of all dates greater than `since`.
 
@@ -752,9 +2822,57 @@ def get_changes(db_name):
 
 
 if __name__ == "__main__":
+    ARG_PARSER = argparse.ArgumentParser(
+        description="Summarize the robocopy log files in a database."
+    )
+    ARG_PARSER.add_argument(
+        "--follow",
+        action="store_true",
+        help=(
+            "Keep running and ingest the log files while they are being written "
+            "(see Config.follow_poll_seconds)."
+        ),
+    )
+    ARG_PARSER.add_argument(
+        "--backfill",
+        action="store_true",
+        help=(
+            "Parse all the log files in the archive folders and replace their logs "
+            "in the database (see Config.backfill_folder)."
+        ),
+    )
+    ARG_PARSER.add_argument(
+        "--rebuild-facts",
+        action="store_true",
+        help=(
+            "Rebuild the error counts in the logs table and the log_daily table "
+            "(used by the server) from the logs and errors tables and exit."
+        ),
+    )
+    ARG_PARSER.add_argument(
+        "--compress-archives",
+        action="store_true",
+        help="Compress the uncompressed log files in the archive folders and exit.",
+    )
+    ARGS = ARG_PARSER.parse_args()
     try:
         # Warning: clean_db() will erase all records in the database.
         # clean_db(Config.database_path)
-        main(Config.database_path, Config.log_folder)
+        if ARGS.compress_archives:
+            compress_archives(Config.log_folder)
+        elif ARGS.rebuild_facts:
+            rebuild_facts(Config.database_path)
+        elif ARGS.backfill:
+            # Show the progress on the console as well as in the log file
+            for HANDLER in logging.getLogger().handlers:
+                if HANDLER.get_name() == "console":
+                    HANDLER.setLevel(logging.INFO)
+            backfill(Config.database_path, Config.log_folder)
+        elif ARGS.follow:
+            follow(Config.database_path, Config.log_folder)
+        else:
+            main(Config.database_path, Config.log_folder)
+    except KeyboardInterrupt:
+        logger.info("Interrupted by user")
     except Exception as ex:
         logger.error("Unexpected exception: %s", ex)
@@ -6,12 +6,28 @@ See the end of the file configuration parameters and potential tests.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import datetime
+from email import message_from_string
 from io import open
 import glob
+import logging
 import os
+import shutil
 import sqlite3
+import threading
+import time
 
+try:
+    # Python 2
+    import SocketServer as socketserver
+except ImportError:
+    # Python 3
+    import socketserver
+
+from buffering_smtp_handler import BufferingSMTPHandler
+import make_robo_logs
 import process_robo_logs
+import query_plans
 
 # pylint: disable=line-too-long,pointless-string-statement
 # pylint: disable=broad-except
@@ -429,6 +445,126 @@ def db_testing(db_name):
         print(db_get_rows(conn, sql))
 
 
+def make_test_log(index, error_count):
+    """Return a log object like process_robo_logs.process_park() with error_count errors."""
+
+    log = {
+        "park": "DENA",
+        "date": "2018-02-12",
+        "filename": "C:/tmp/test{0}.log".format(index),
+        "finished": True,
+        "errors": [],
+        "stats": {},
+    }
+    for i in range(error_count):
+        log["errors"].append(
+            {
+                "code": 32,
+                "failed": i % 3 == 0,
+                "name": "The process cannot access the file because it is being used by another process.",
+                "line_num": 20 + i * 3,
+                "message": "Copying File E:\\XDrive\\RemoteServers\\XDrive-DENA\\file{0}.txt".format(
+                    i
+                ),
+            }
+        )
+    for stat in ["dirs", "files", "bytes", "times"]:
+        log["stats"][stat] = {
+            "copied": 1,
+            "extra": 2,
+            "failed": 0,
+            "mismatch": 0,
+            "skipped": 3,
+            "total": 6,
+        }
+    return log
+
+
+def test_ingest_speed(db_name, log_count=100, error_count=1000):
+    """Compare rows/second for per-write commits and a single bulk transaction.
+
+    db_name should be a file (not :memory:) so the cost of each commit is measured.
+    All records in db_name will be deleted.
+    """
+
+    rows = log_count * (1 + 4 + error_count)
+    process_robo_logs.clean_db(db_name)
+    with sqlite3.connect(db_name) as conn:
+        start = time.time()
+        for i in range(log_count):
+            log = make_test_log(i, error_count)
+            log_id = process_robo_logs.db_write_log(conn, log)
+            for error in log["errors"]:
+                error["log"] = log_id
+            process_robo_logs.db_write_errors(conn, log["errors"])
+            stats = []
+            for stat, obj in log["stats"].items():
+                obj["log"] = log_id
+                obj["stat"] = stat
+                stats.append(obj)
+            process_robo_logs.db_write_stats(conn, stats)
+        seconds = time.time() - start
+    print(
+        "Commit per write: {0} rows in {1:.2f} sec; {2:.0f} rows/sec".format(
+            rows, seconds, rows / seconds
+        )
+    )
+
+    process_robo_logs.clean_db(db_name)
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    start = time.time()
+    conn.execute("BEGIN")
+    for i in range(log_count):
+        conn.execute("SAVEPOINT log_file")
+        process_robo_logs.write_park(conn, "test.log", make_test_log(i, error_count))
+        conn.execute("RELEASE log_file")
+    conn.execute("COMMIT")
+    seconds = time.time() - start
+    conn.close()
+    print(
+        "Single transaction: {0} rows in {1:.2f} sec; {2:.0f} rows/sec".format(
+            rows, seconds, rows / seconds
+        )
+    )
+    process_robo_logs.clean_db(db_name)
+
+
+def test_parser_speed(log_folder):
+    """Print the lines/second for parsing the log files in log_folder."""
+
+    filelist = sorted(glob.glob(os.path.join(log_folder, "*-update-x-drive.log")))
+    lines = 0
+    for filename in filelist:
+        with open(filename, "r", encoding="utf-8") as file_handle:
+            lines += sum(1 for _ in file_handle)
+    start = time.time()
+    for filename in filelist:
+        process_robo_logs.process_park(filename)
+    seconds = time.time() - start
+    print(
+        "process_park(): {0} lines in {1:.2f} sec; {2:.0f} lines/sec".format(
+            lines, seconds, lines / seconds
+        )
+    )
+
+    summary = [
+        ("Bytes :", "   Bytes : 557.141 g   1.234 m 557.141 g         0     2.5 k         0"),
+        ("Times :", "   Times :   0:03:32   0:00:10                       0:00:00   0:03:22"),
+    ]
+    count = 20000
+    start = time.time()
+    for _ in range(count):
+        for sentinel, line in summary:
+            process_robo_logs.process_summary_line(line, sentinel, "test.log", 1)
+    seconds = time.time() - start
+    lines = count * len(summary)
+    print(
+        "process_summary_line(): {0} lines in {1:.2f} sec; {2:.0f} lines/sec".format(
+            lines, seconds, lines / seconds
+        )
+    )
+
+
 def db_get_rows(database, sql, header=True):
     """Execute the query sql in the database and return the rows."""
 
@@ -439,80 +575,212 @@ def db_get_rows(database, sql, header=True):
     return rows
 
 
+def test_error_name_line(log_folder="test_error_name_line"):
+    """Check that an error name line ending in \\r\\r\\n (see NOTE 1) is one line.
+
+    The line after the name is the retry line, so the first error is retried
+    (not failed), the second error is failed, and the line numbers are the
+    line numbers in the file. Both the memory mapped (cp1252) and the text
+    (UTF-16) readers are checked.
+    """
+
+    lines = [
+        "\t    New File  \t\t     100\tdir1\\file1.txt",
+        "2018/05/15 22:00:51 ERROR 32 (0x00000020) Copying File "
+        "\\\\inpakrovmdist\\gisdata\\dir1\\file1.txt",
+        "The process cannot access the file because it is being used by another process.\r",
+        "Waiting 5 seconds... Retrying...",
+        "\t    New File  \t\t     100\tdir1\\file1.txt",
+        "\t    New File  \t\t     100\tdir1\\file2.txt",
+        "2018/05/15 22:01:00 ERROR 5 (0x00000005) Copying File "
+        "\\\\inpakrovmdist\\gisdata\\dir1\\file3.txt",
+        "Access is denied.\r",
+        "",
+        "\t    New File  \t\t     100\tdir1\\file4.txt",
+    ]
+    text = "\r\n".join(lines) + "\r\n"
+    if not os.path.exists(log_folder):
+        os.mkdir(log_folder)
+    filename = os.path.join(log_folder, "2018-05-15_22-00-02-KATM-update-x-drive.log")
+    for encoding in ["cp1252", "utf-16"]:
+        with open(filename, "wb") as file_handle:
+            file_handle.write(text.encode(encoding))
+        log = process_robo_logs.process_park(filename)
+        errors = [(e["line_num"], e["code"], e["failed"]) for e in log["errors"]]
+        assert log["lines"] == 10, (encoding, log["lines"])
+        assert errors == [(2, 32, False), (7, 5, True)], (encoding, errors)
+        print("{0}: {1}".format(encoding, errors))
+    shutil.rmtree(log_folder)
+
+
+def parsed_results(log):
+    """Return a copy of the results of process_park() without the keys that are
+    added when they are written to the database (e.g. error["log"]).
+    """
+
+    written = ("log", "stat", "message_id")
+    log = dict(log)
+    log["errors"] = [
+        dict((k, v) for k, v in error.items() if k not in written)
+        for error in log["errors"]
+    ]
+    if "stats" in log:
+        log["stats"] = dict(
+            (name, dict((k, v) for k, v in obj.items() if k not in written))
+            for name, obj in log["stats"].items()
+        )
+    return log
+
+
+def test_follow(log_folder="test_follow"):
+    """Follow log files in each encoding while they are written, and check that the
+    results match process_park().
+
+    log_folder is deleted and written with synthetic logs (see make_robo_logs.py).
+    A log that is killed (no end of run summary) must be left for main(), with
+    its partial results in the database and no manifest entry.
+    """
+
+    if os.path.exists(log_folder):
+        shutil.rmtree(log_folder)
+    os.mkdir(log_folder)
+    cases = [
+        ("utf-16", "finished"),
+        ("cp1252", "finished"),
+        ("utf-8", "paused"),
+        ("cp1252", "killed"),
+    ]
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    process_robo_logs.db_create(conn)
+    idle_seconds = process_robo_logs.Config.follow_idle_seconds
+    try:
+        for day, (encoding, ending) in enumerate(cases):
+            made = make_robo_logs.make_log(
+                log_folder,
+                "KATM",
+                datetime.datetime(2018, 5, day + 1, 22, 0, 2),
+                ending=ending,
+                error_rate=0.05,
+                encoding=encoding,
+            )
+            filename = made["filename"]
+            with open(filename, "rb") as file_handle:
+                data = file_handle.read()
+            # Robocopy has written part of the file (an odd number of bytes)
+            with open(filename, "wb") as file_handle:
+                file_handle.write(data[: len(data) // 2 | 1])
+            process_robo_logs.Config.follow_idle_seconds = idle_seconds
+            follower = process_robo_logs.LogFollower(filename)
+            conn.execute("BEGIN")
+            assert not process_robo_logs.follow_park(conn, follower)
+            with open(filename, "wb") as file_handle:
+                file_handle.write(data)
+            assert not process_robo_logs.follow_park(conn, follower)
+            if ending == "killed":
+                process_robo_logs.Config.follow_idle_seconds = -1
+            assert process_robo_logs.follow_park(conn, follower)
+            conn.execute("COMMIT")
+
+            expected = process_robo_logs.process_park(filename)
+            log_ids = process_robo_logs.db_find_logs(conn, filename)
+            manifest = process_robo_logs.db_read_manifest(conn)
+            results = parsed_results(follower.parser.results)
+            assert len(log_ids) == 1, log_ids
+            if ending == "killed":
+                assert os.path.basename(filename) not in manifest
+                assert results["errors"] == expected["errors"][: len(results["errors"])]
+            else:
+                assert manifest[os.path.basename(filename)]["log_id"] == log_ids[0]
+                assert results == expected
+            errors = conn.execute(
+                "SELECT COUNT(*) FROM errors WHERE log_id = ?", log_ids
+            ).fetchone()[0]
+            assert errors == len(results["errors"]), (errors, len(results["errors"]))
+            print(
+                "{0:6} {1:8}: {2} errors, finished {3}; same as process_park()".format(
+                    encoding, ending, len(results["errors"]), results["finished"]
+                )
+            )
+    finally:
+        process_robo_logs.Config.follow_idle_seconds = idle_seconds
+        conn.close()
+    shutil.rmtree(log_folder)
+
+
 def test_queries(db_name):
     """Execute a collection of test queries."""
 
     # Date of last scan
-    query_1 = "select max(date) as last_run from logs;"
+    query_1 = "select date(2440587.5 + max(day)) as last_run from logs;"
     # Summary of last days scan
     #  NOTE: DENA typically differs from all other parks in counts, so it is omitted
     #  NOTE: the error/finished counts may be wrong if more than a single date is considered
     query_2 = """
-        SELECT l.date,
-        max(sf.total) as files_scanned, max(sd.total) as dirs_scanned,
-        max(sf.copied) as files_copied, max(sf.extra) as files_removed,
-        max(sb.copied) as bytes_copied, max(sb.extra) as bytes_removed,
+        SELECT date(2440587.5 + l.day) as date,
+        max(s.files_total) as files_scanned, max(s.dirs_total) as dirs_scanned,
+        max(s.files_copied) as files_copied, max(s.files_extra) as files_removed,
+        max(s.bytes_copied) as bytes_copied, max(s.bytes_extra) as bytes_removed,
         sum(e.count_errors) as total_errors,
-        count(l1.park) as count_complete,
-        count(l2.park) as count_incomplete,
-        count(l3.park) as count_unfinished
+        sum(case when l.finished = 1 then 1 else 0 end) as count_complete,
+        sum(case when l.finished = 0 then 1 else 0 end) as count_incomplete,
+        sum(case when l.finished IS NULL then 1 else 0 end) as count_unfinished
         from logs as l
-        left join stats as sf on l.log_id = sf.log_id and sf.stat = 'files' AND l.park <> 'DENA'
-        left join stats as sd on l.log_id = sd.log_id and sd.stat = 'dirs' AND l.park <> 'DENA'
-        left join stats as st on l.log_id = st.log_id and st.stat = 'times' AND l.park <> 'DENA'
-        left join stats as sb on l.log_id = sb.log_id and sb.stat = 'bytes' AND l.park <> 'DENA'
-        left join logs as l1 on l.log_id = l1.log_id and l1.finished = 1
-        left join logs as l2 on l.log_id = l2.log_id and l2.finished = 0
-        left join logs as l3 on l.log_id = l3.log_id and l3.finished IS NULL
+        join parks as p on l.park_id = p.park_id
+        left join stats as s on l.log_id = s.log_id AND p.park <> 'DENA'
         left join (select log_id, count(*) as count_errors from errors group by log_id) as e on l.log_id = e.log_id
-        where l.date = (SELECT max(date) from logs)
-        GROUP BY l.date;
+        where l.day = (SELECT max(day) from logs)
+        GROUP BY l.day;
     """
     # Park details
     #   Could include some more failure stats, see query_7 below
     query_3 = """
-        select l.park, l.date, l.finished, e.count_errors,
-        sf.copied as files_copied, sf.extra as files_removed, sf.total as files_scanned,
-        st.copied as time_copying, st.extra as time_scanning, sb.copied as bytes_copied
+        select p.park, date(2440587.5 + l.day) as date, l.finished, l.count_errors,
+        s.files_copied, s.files_extra as files_removed, s.files_total as files_scanned,
+        s.times_copied as time_copying, s.times_extra as time_scanning, s.bytes_copied
         from logs as l
-        left join stats as sf on l.log_id = sf.log_id and sf.stat = 'files'
-        left join stats as st on l.log_id = st.log_id and st.stat = 'times'
-        left join stats as sb on l.log_id = sb.log_id and sb.stat = 'bytes'
-        left join (select log_id, count(*) as count_errors from errors group by log_id) as e on l.log_id = e.log_id
-        where date = (SELECT max(date) from logs) ORDER BY Park;
+        join parks as p on l.park_id = p.park_id
+        left join stats as s on l.log_id = s.log_id
+        where l.day = (SELECT max(day) from logs) ORDER BY p.park;
     """
     # Logs that did not finish normally
-    query_4 = "select park, date from logs where finished = 0 or finished IS NULL order by date, park;"
+    query_4 = """
+        select p.park, date(2440587.5 + l.day) as date from logs as l
+        join parks as p on l.park_id = p.park_id
+        where finished = 0 or finished IS NULL order by l.day, p.park;
+    """
     # Number of errors per log file
     query_5 = "select log_id, count(*) as count_errors from errors group by log_id;"
     # Mismatch and Failed Stats per log file
     query_6 = """
-        select l.date, l.park, l.finished, e.count_errors, s.stat, s.failed, s.mismatch
+        select date(2440587.5 + l.day) as date, p.park, l.finished, e.count_errors,
+        s.dirs_failed, s.dirs_mismatch, s.files_failed, s.files_mismatch,
+        s.bytes_failed, s.bytes_mismatch, s.times_failed, s.times_mismatch
         from stats as s
         left join logs as l on l.log_id = s.log_id
+        left join parks as p on l.park_id = p.park_id
         left join (select log_id, count(*) as count_errors from errors group by log_id) as e on l.log_id = e.log_id
-        where (s.failed > 0 OR s.mismatch > 0)
-        order by l.date, l.park, s.stat;
+        where (s.dirs_failed > 0 OR s.dirs_mismatch > 0 OR s.files_failed > 0 OR s.files_mismatch > 0
+        OR s.bytes_failed > 0 OR s.bytes_mismatch > 0 OR s.times_failed > 0 OR s.times_mismatch > 0)
+        order by l.day, p.park;
     """
     # Count of logs per day
-    query_7 = "select date, count(*) from logs group by date order by date;"
+    query_7 = "select date(2440587.5 + day) as date, count_start from log_daily order by day;"
     # When the robocopy fail count does not equal my failed error count
     query_8 = """
-        select l.park, l.date, e.count, s.failed from logs as l
-        left join (select log_id, count(*) as count from errors
-        where failed group by log_id) as e on e.log_id = l.log_id
-        --left join (select log_id, count(*) as count from errors
-        --where failed and error_code <> 32 group by log_id) as e on e.log_id = l.log_id
-        left join stats as s on l.log_id = s.log_id
-        where s.stat = 'files' and s.failed <> e.count
-        order by l.date, l.park;
+        select p.park, date(2440587.5 + l.day) as date, l.count_errors, s.files_failed
+        from logs as l
+        join parks as p on l.park_id = p.park_id
+        join stats as s on l.log_id = s.log_id
+        where s.files_failed <> l.count_errors
+        order by l.day, p.park;
     """
     # for logs without a failure, copied + extra times = total time, mismatch and skipped = 0
     query_9 = """
-        select l.park, count(*), avg(s.copied), avg(s.extra), avg(s.skipped), avg(failed), avg(s.total), avg(s.copied)+avg(s.extra) from stats as s
+        select p.park, count(*), avg(s.times_copied), avg(s.times_extra), avg(s.times_skipped), avg(s.times_failed), avg(s.times_total), avg(s.times_copied)+avg(s.times_extra) from stats as s
         left join logs as l on s.log_id = l.log_id
-        where s.stat = 'times' -- and s.log_id in (select log_id from stats where stat = 'bytes' and failed = 0)
-        group by l.park order by l.park;
+        left join parks as p on l.park_id = p.park_id
+        -- where s.bytes_failed = 0
+        group by p.park order by p.park;
     """
     # Other query ideas:
     #   Last error by Park
@@ -540,6 +808,245 @@ def test_queries(db_name):
                 print(row)
 
 
+def test_compact_schema(db_name, test_db="test_compact.db", repeat=20):
+    """Print the size and query times of an older (version 2 or 3) database before
+    and after the upgrade to the compact (version 4) schema.
+
+    db_name is copied to test_db (which is overwritten); db_name is not changed.
+    The queries are the server's /summary, /parks, /scanavg and /speed queries.
+    """
+
+    before = {
+        "summary": """
+            SELECT l.date AS summary_date, COUNT(*) AS count_start,
+            COUNT(l1.park) AS count_unfinished, COUNT(e1.log_id) AS count_with_errors
+            FROM logs AS l
+            LEFT JOIN logs AS l1 ON l.log_id = l1.log_id and (l1.finished = 0 OR l1.finished IS NULL)
+            LEFT JOIN (SELECT log_id FROM errors WHERE failed GROUP BY log_id) AS e1 ON l.log_id = e1.log_id
+            WHERE l.date = (SELECT MAX(date) FROM logs)
+            GROUP BY l.date;
+        """,
+        "parks": """
+            SELECT l.park, l.date, l.finished, COALESCE(e.count_errors, 0) AS count_errors,
+            sf.copied, sf.extra, sf.total, st.copied, st.extra, sb.copied
+            FROM logs AS l
+            LEFT JOIN stats AS sf ON l.log_id = sf.log_id and sf.stat = 'files'
+            LEFT JOIN stats AS st ON l.log_id = st.log_id and st.stat = 'times'
+            LEFT JOIN stats AS sb ON l.log_id = sb.log_id and sb.stat = 'bytes'
+            LEFT JOIN (select log_id, COUNT(*) AS count_errors FROM errors where failed group by log_id) AS e ON l.log_id = e.log_id
+            WHERE l.date = (SELECT MAX(date) FROM logs)
+            ORDER BY l.park;
+        """,
+        "scanavg": """
+            SELECT l.park, ROUND(AVG(1.0*sf.total/st.extra), 1), COUNT(*)
+            FROM logs AS l
+            LEFT JOIN stats AS sf ON l.log_id = sf.log_id and sf.stat = 'files'
+            LEFT JOIN stats AS st ON l.log_id = st.log_id and st.stat = 'times'
+            LEFT JOIN errors AS e ON l.log_id = e.log_id
+            WHERE e.log_id IS NULL AND st.extra > 0 AND sf.total > 0
+            GROUP BY l.park ORDER BY l.park;
+        """,
+        "speed": """
+            SELECT l.park, l.date, ROUND(1.0*sf.total/st.extra, 1),
+            ROUND(1.0*sb.copied/st.copied/1000.0, 1)
+            FROM logs AS l
+            LEFT JOIN stats AS sf ON l.log_id = sf.log_id and sf.stat = 'files'
+            LEFT JOIN stats AS st ON l.log_id = st.log_id and st.stat = 'times'
+            LEFT JOIN stats AS sb ON l.log_id = sb.log_id and sb.stat = 'bytes'
+            LEFT JOIN errors AS e ON l.log_id = e.log_id
+            WHERE e.log_id IS NULL AND l.date > '2000-01-01' AND l.park = 'KATM'
+            ORDER BY l.park, l.date;
+        """,
+    }
+    after = {
+        "summary": """
+            SELECT DATE(2440587.5 + d.day) AS summary_date,
+            d.count_start, d.count_unfinished, d.count_with_errors
+            FROM log_daily AS d
+            WHERE d.day = (SELECT MAX(day) FROM log_daily);
+        """,
+        "parks": """
+            SELECT p.park, DATE(2440587.5 + l.day), l.finished, l.count_errors,
+            s.files_copied, s.files_extra, s.files_total, s.times_copied,
+            s.times_extra, s.bytes_copied
+            FROM logs AS l
+            JOIN parks AS p ON l.park_id = p.park_id
+            LEFT JOIN stats AS s ON l.log_id = s.log_id
+            WHERE l.day = (SELECT MAX(day) FROM log_daily)
+            ORDER BY p.park;
+        """,
+        "scanavg": """
+            SELECT p.park, ROUND(AVG(1.0*s.files_total/s.times_extra), 1), COUNT(*)
+            FROM logs AS l
+            JOIN parks AS p ON l.park_id = p.park_id
+            JOIN stats AS s ON l.log_id = s.log_id
+            WHERE NOT l.has_errors AND s.times_extra > 0 AND s.files_total > 0
+            GROUP BY p.park ORDER BY p.park;
+        """,
+        "speed": """
+            SELECT p.park, DATE(2440587.5 + l.day), ROUND(1.0*s.files_total/s.times_extra, 1),
+            ROUND(1.0*s.bytes_copied/s.times_copied/1000.0, 1)
+            FROM logs AS l
+            JOIN parks AS p ON l.park_id = p.park_id
+            LEFT JOIN stats AS s ON l.log_id = s.log_id
+            WHERE NOT l.has_errors
+            AND l.day > CAST(JULIANDAY('2000-01-01') - 2440587.5 AS INTEGER)
+            AND p.park = 'KATM'
+            ORDER BY p.park, l.day;
+        """,
+    }
+
+    def measure(queries):
+        """Return the database size and the best time (and row count) of each query."""
+
+        with sqlite3.connect(test_db) as conn:
+            conn.execute("VACUUM")
+            results = {"size": os.path.getsize(test_db)}
+            for name, sql in queries.items():
+                best = None
+                for _ in range(repeat):
+                    start = time.time()
+                    rows = conn.execute(sql).fetchall()
+                    seconds = time.time() - start
+                    if best is None or seconds < best:
+                        best = seconds
+                results[name] = (best, len(rows))
+        return results
+
+    shutil.copyfile(db_name, test_db)
+    old = measure(before)
+    with sqlite3.connect(test_db) as conn:
+        start = time.time()
+        process_robo_logs.db_create(conn)
+        upgrade_seconds = time.time() - start
+    new = measure(after)
+    os.remove(test_db)
+
+    print("Upgrade: {0:.2f} sec".format(upgrade_seconds))
+    print(
+        "Size: {0:.2f} MB before, {1:.2f} MB after".format(
+            old["size"] / 1e6, new["size"] / 1e6
+        )
+    )
+    for name in sorted(before):
+        print(
+            "{0:8}: {1:8.2f} ms ({2} rows) before, {3:8.2f} ms ({4} rows) after".format(
+                name, old[name][0] * 1000, old[name][1], new[name][0] * 1000, new[name][1]
+            )
+        )
+
+
+def test_query_plans(db_name):
+    """Print the query plan check of the server's requests (see query_plans.py).
+
+    Fails if any request scans a table in db_name; a large database, like the
+    synthetic one from query_plans.py, is best.
+    """
+
+    scans = query_plans.check_plans(db_name)
+    if scans:
+        raise AssertionError("{0} requests scan a table".format(scans))
+    print("OK: no request scans a table")
+
+
+class SMTPStandIn(socketserver.StreamRequestHandler):
+    """A minimal SMTP server that saves the messages it receives (for testing)."""
+
+    messages = []
+
+    def reply(self, text):
+        """Send a reply line to the client."""
+
+        self.wfile.write((text + "\r\n").encode("ascii"))
+
+    def handle(self):
+        self.reply("220 localhost SMTP stand-in")
+        data = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            if data is not None:
+                if line.rstrip() == b".":
+                    self.messages.append(b"".join(data).decode("ascii"))
+                    data = None
+                    self.reply("250 OK")
+                else:
+                    data.append(line[1:] if line.startswith(b"..") else line)
+                continue
+            command = line[:4].upper()
+            if command == b"DATA":
+                data = []
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("250 OK")
+
+
+def test_email_digest(record_count=5000, max_emails=3):
+    """Send error records to a BufferingSMTPHandler and a local SMTP stand-in.
+
+    Prints the time logging took (it should not wait for the server), and
+    the emails the stand-in received.
+    """
+
+    server = socketserver.ThreadingTCPServer(("localhost", 0), SMTPStandIn)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    del SMTPStandIn.messages[:]
+
+    handler = BufferingSMTPHandler(
+        "localhost",
+        "from@example.com",
+        ["to@example.com", "cc@example.com"],
+        "Test digest",
+        capacity=10,
+        mailport=server.server_address[1],
+        max_emails=max_emails,
+    )
+    test_logger = logging.getLogger("digest_test")
+    test_logger.propagate = False
+
+    # Records from a parse worker have their arguments merged by RecordCollector
+    # before main() logs them; they should still be one item in the digest.
+    collector = process_robo_logs.RecordCollector()
+    test_logger.addHandler(collector)
+    for i in range(50):
+        test_logger.error("Unexpected line in log file %s, line#: %d", "KATM.log", i)
+    test_logger.removeHandler(collector)
+    test_logger.addHandler(handler)
+    for record in collector.records:
+        test_logger.handle(record)
+    print(
+        "{0} worker records are {1} digest item(s)".format(
+            len(collector.records), len(handler.groups)
+        )
+    )
+
+    start = time.time()
+    for i in range(record_count):
+        test_logger.error("Bad stats object in log file %s, missing: %s", i, "times")
+        if i % 100 == 0:
+            # A different message each time, so 10 fill the digest and queue an email
+            test_logger.error("Unusual error number {0}; é".format(i))
+    seconds = time.time() - start
+    handler.close()
+    test_logger.removeHandler(handler)
+    server.shutdown()
+    server.server_close()
+
+    print("Logged {0} records in {1:.3f} sec".format(record_count, seconds))
+    print("Received {0} emails (max {1})".format(len(SMTPStandIn.messages), max_emails))
+    for text in SMTPStandIn.messages:
+        msg = message_from_string(text)
+        print("To: {0}; Subject: {1}".format(msg["To"], msg["Subject"]))
+        body = msg.get_payload(decode=True).decode("utf-8")
+        print(body)
+
+
 if __name__ == "__main__":
     # Testing on Mac
     # LOG_ROOT = 'data/Logs/old'
@@ -554,7 +1061,14 @@ if __name__ == "__main__":
     # DB = 'E:/XDrive/Logs/logs.db'
 
     # db_testing(':memory:')
+    # test_ingest_speed('test_logs.db')
+    # test_parser_speed(LOG_ROOT)
+    # test_error_name_line()
+    # test_follow()
     # test_queries(DB)
+    # test_compact_schema(DB)
+    # test_query_plans(DB)
+    # test_email_digest()
     test_file_structure(LOG_ROOT)
 
     # print(process_park(r"\\inpakrovmais\Xdrive\Logs\2018archive\2018-12-16_18-00-01-LACL-update-x-drive.log")) # checked: ok
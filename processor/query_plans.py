@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+Check the query plans of the server's SQL statements, and recommend indexes.
+
+Each GET request in the Config object is handled by the server's SyncHandler
+(without a socket), and the SQL statements that do_GET() executes are recorded.
+A statement whose EXPLAIN QUERY PLAN scans a whole table is reported, and the
+indexes that change the scans into searches are found by trying them on an
+empty copy of the database schema.  The recommended indexes are added to the
+log processor's schema (see process_robo_logs.db_upgrade()), so every database
+gets them when it is upgraded.
+
+Without a database, a synthetic one (see make_robo_logs.py) is written to a
+temporary folder.  The exit status is 1 if any request scans a table, so this
+can be run as a test after a change to the server's queries or the schema.
+
+Edit the Config object below as needed for each execution.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import contextlib
+import itertools
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import timeit
+
+from benchmark_robo_logs import quiet_logging
+import make_robo_logs
+import process_robo_logs
+import sqlite_handler
+
+# The server is in the server folder next to this folder.
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server")
+)
+import secure_server  # pylint: disable=wrong-import-position
+
+# pylint: disable=too-many-locals
+
+
+class Config(object):
+    """Namespace for configuration parameters."""
+
+    # pylint: disable=useless-object-inheritance,too-few-public-methods
+
+    # The GET requests that are checked; together they run every SQL statement
+    # in SyncHandler.do_GET(), with and without the optional parameters.
+    requests = [
+        "/summary",
+        "/summary?date=2018-05-01",
+        "/parks",
+        "/parks?date=2018-05-01",
+        "/error_summary?log=1",
+        "/error_details?log=1&code=32",
+        "/logfile?date=2018-05-01&park=DENA",
+        "/logexcerpt?log=1&line=20",
+        "/dates",
+        "/plot1",
+        "/plot1?date=2018-05-01",
+        "/scanavg",
+        "/scanavg?start=2018-01-01&end=2018-05-01",
+        "/copyavg",
+        "/copyavg?start=2018-01-01&end=2018-05-01",
+        "/speed",
+        "/speed?park=DENA",
+        "/speed?start=2018-01-01&end=2018-05-01",
+        "/speed?start=2018-01-01&end=2018-05-01&park=DENA",
+        "/runs",
+        "/runs?start=2018-01-01&end=2018-05-01",
+        "/runs?run=1",
+    ]
+
+    # The synthetic database: the number of nights (one log file per park per
+    # night), and the number of files listed, and the error rate in each log file.
+    nights = 3 * 365
+    listed_files = 100
+    error_rate = 0.02
+
+    # A recommended index gets up to this many more columns, if that lets a
+    # statement read the index without the table (a covering index).
+    covering_columns = 3
+
+    # Each statement is run this many times, and the fastest time is reported.
+    repeat = 3
+
+
+SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?")
+TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.I)
+KEYWORDS = ["CROSS", "GROUP", "INNER", "JOIN", "LEFT", "LIMIT", "ON", "ORDER"]
+KEYWORDS += ["WHERE"]
+
+
+class PlanHandler(secure_server.SyncHandler):
+    """A SyncHandler without a socket that records the SQL statements of a request.
+
+    The statements are not executed; each one returns no rows.
+    """
+
+    # pylint: disable=super-init-not-called,unused-argument
+
+    def __init__(self, path, db_name):
+        self.path = path
+        self.db_name = db_name
+        self.statements = []
+
+    def cached_response(self, path, params):
+        return False
+
+    @contextlib.contextmanager
+    def db_connection(self):
+        yield None
+
+    def db_get_rows(self, database, sql, params, header=True):
+        self.statements.append((sql, list(params)))
+        return []
+
+    def db_get_one(self, database, sql, params=None):
+        self.statements.append((sql, list(params or [])))
+        return {}
+
+    def std_response(self, obj):
+        pass
+
+    def file_response(self, filename, tail=None):
+        pass
+
+    def err_response(self, message):
+        pass
+
+
+def request_statements(db_name, request):
+    """Return a list of the (sql, params) that the server executes for request."""
+
+    handler = PlanHandler(request, db_name)
+    handler.do_GET()
+    return handler.statements
+
+
+def explain(database, sql, params):
+    """Return a list of the details in the EXPLAIN QUERY PLAN of sql."""
+
+    return [row[-1] for row in database.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def scanned(details):
+    """Return the tables (alias or name) that are scanned in the plan details."""
+
+    names = []
+    for detail in details:
+        match = SCAN_RE.match(detail)
+        if match and match.group(1) not in ("CONSTANT", "SUBQUERY"):
+            names.append(match.group(2) or match.group(1))
+    return names
+
+
+def plan_score(details):
+    """Return a score for the plan details; a better plan has a bigger score.
+
+    Fewer scans is better, then more equality constraints, then more range
+    constraints in the index searches.
+    """
+
+    text = " ".join(details)
+    ranges = text.count(">?") + text.count("<?")
+    return (-len(scanned(details)), text.count("=?"), ranges)
+
+
+def best_time(database, sql, params):
+    """Return the fewest seconds to run sql in Config.repeat tries."""
+
+    times = []
+    for _ in range(Config.repeat):
+        start = timeit.default_timer()
+        database.execute(sql, params).fetchall()
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def statement_tables(sql):
+    """Return a dict of the table names in sql by alias (or name if no alias)."""
+
+    tables = {}
+    for match in TABLE_RE.finditer(sql):
+        name, alias = match.groups()
+        if alias is None or alias.upper() in KEYWORDS:
+            alias = name
+        tables[alias] = name
+    return tables
+
+
+def index_columns(database, table):
+    """Return the columns in table that can be indexed (not the INTEGER PRIMARY KEY)."""
+
+    info = database.execute("PRAGMA table_info({0})".format(table)).fetchall()
+    keys = [row for row in info if row[5]]
+    columns = []
+    for row in info:
+        if len(keys) == 1 and row[5] and row[2].upper() == "INTEGER":
+            # The rowid; it is in every index
+            continue
+        columns.append(row[1])
+    return columns
+
+
+def referenced_columns(sql, alias, columns, other_columns):
+    """Return the columns of the table alias used in sql, in the order of use.
+
+    A column without an alias is used if no other table has a column by that name.
+    """
+
+    positions = []
+    for column in columns:
+        pattern = r"\b{0}\.{1}\b".format(re.escape(alias), re.escape(column))
+        if column.lower() not in other_columns:
+            pattern += r"|(?<![\w.]){0}\b".format(re.escape(column))
+        match = re.search(pattern, sql, re.I)
+        if match:
+            positions.append((match.start(), column))
+    return [column for _, column in sorted(positions)]
+
+
+def schema_copy(database):
+    """Return an in memory database with the tables and indexes of database."""
+
+    shadow = sqlite3.connect(":memory:", isolation_level=None)
+    rows = database.execute(
+        """
+        SELECT sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite%'
+        ORDER BY type = 'index';
+        """
+    ).fetchall()
+    for row in rows:
+        shadow.execute(row[0])
+    return shadow
+
+
+def try_index(shadow, table, columns, sql, params):
+    """Return the plan details of sql with an index on table(columns) in shadow."""
+
+    shadow.execute(
+        "CREATE INDEX query_plans_ix ON {0}({1})".format(table, ", ".join(columns))
+    )
+    try:
+        return explain(shadow, sql, params)
+    finally:
+        shadow.execute("DROP INDEX query_plans_ix")
+
+
+def advise_statement(shadow, sql, params):
+    """Return the (table, columns) of the best index for sql, or None.
+
+    Each single and pair of columns used in sql is tried as an index; the index
+    with the best plan_score() (then the fewest columns) is returned if it has
+    fewer scans.  More of the used columns are added if that makes it covering.
+    """
+
+    current = plan_score(explain(shadow, sql, params))
+    tables = statement_tables(sql)
+    columns = dict(
+        (alias, index_columns(shadow, name)) for alias, name in tables.items()
+    )
+    best = None
+    for alias, name in tables.items():
+        others = set()
+        for other, other_columns in columns.items():
+            if other != alias:
+                others.update(column.lower() for column in other_columns)
+        used = referenced_columns(sql, alias, columns[alias], others)
+        candidates = itertools.chain(
+            itertools.permutations(used, 1), itertools.permutations(used, 2)
+        )
+        for candidate in candidates:
+            score = plan_score(try_index(shadow, name, candidate, sql, params))
+            key = (score, -len(candidate))
+            if score[0] > current[0] and (best is None or key > best[0]):
+                extra = [column for column in used if column not in candidate]
+                best = (key, name, list(candidate), extra)
+    if best is None:
+        return None
+    (score, _), name, index, extra = best
+    if extra and len(extra) <= Config.covering_columns:
+        details = try_index(shadow, name, index + extra, sql, params)
+        covering = "COVERING INDEX query_plans_ix" in " ".join(details)
+        if covering and plan_score(details) >= score:
+            index = index + extra
+    return name, index
+
+
+def merge_indexes(indexes):
+    """Return a list of (table, columns) with one index for each table and first column.
+
+    The columns of the indexes with the same table and first column are combined.
+    """
+
+    merged = []
+    for table, columns in sorted(indexes, key=lambda index: -len(index[1])):
+        for other_table, other_columns in merged:
+            if other_table == table and other_columns[0] == columns[0]:
+                other_columns.extend(c for c in columns if c not in other_columns)
+                break
+        else:
+            merged.append((table, list(columns)))
+    return merged
+
+
+def index_sql(table, columns):
+    """Return the SQL to create an index on table(columns)."""
+
+    return "CREATE INDEX IF NOT EXISTS {0}_{1}_ix ON {0}({2});".format(
+        table, columns[0].lower(), ", ".join(columns)
+    )
+
+
+def check_plans(db_name, verbose=False):
+    """Print the time and scanned tables of each request, and the recommended indexes.
+
+    Returns the number of requests that scan a table.
+    """
+
+    database = sqlite3.connect(db_name)
+    shadow = schema_copy(database)
+    try:
+        print("{0:50} {1:>9}  {2}".format("request", "ms", "scans"))
+        scans = 0
+        recommended = []
+        plans = []
+        for request in Config.requests:
+            seconds = 0
+            tables = []
+            for sql, params in request_statements(db_name, request):
+                details = explain(database, sql, params)
+                seconds += best_time(database, sql, params)
+                tables += scanned(details)
+                plans.append((request, details))
+                if scanned(details):
+                    index = advise_statement(shadow, sql, params)
+                    if index:
+                        recommended.append(index)
+            if tables:
+                scans += 1
+            print(
+                "{0:50} {1:9.2f}  {2}".format(
+                    request, seconds * 1000, " ".join(tables)
+                )
+            )
+        if verbose:
+            for request, details in plans:
+                print(request)
+                for detail in details:
+                    print("    " + detail)
+        if recommended:
+            print("Recommended indexes:")
+            for table, columns in merge_indexes(recommended):
+                sql = index_sql(table, columns)
+                print("    " + sql)
+                shadow.execute(sql)
+            remaining = []
+            for request in Config.requests:
+                for sql, params in request_statements(db_name, request):
+                    if scanned(explain(shadow, sql, params)):
+                        remaining.append(request)
+            if remaining:
+                print("Requests that scan a table with these indexes:")
+                for request in sorted(set(remaining), key=remaining.index):
+                    print("    " + request)
+        elif scans:
+            print("No index removes the scans; the queries need to be changed.")
+        return scans
+    finally:
+        shadow.close()
+        database.close()
+
+
+def make_database(db_name, folder):
+    """Write a synthetic logs database (db_name) from log files written in folder."""
+
+    fixtures = make_robo_logs.make_logs(
+        folder,
+        nights=Config.nights,
+        listed_files=Config.listed_files,
+        error_rate=Config.error_rate,
+    )
+    process_robo_logs.clean_db(db_name)
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        # The tables written by the database log handler
+        sqlite_handler.create_tables(conn)
+        conn.execute("BEGIN")
+        for fixture in fixtures:
+            log = process_robo_logs.process_park(fixture["filename"])
+            process_robo_logs.write_park(conn, fixture["filename"], log)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    print("Wrote {0} log files to {1}".format(len(fixtures), db_name))
+
+
+if __name__ == "__main__":
+    ARG_PARSER = argparse.ArgumentParser(
+        description="Check the query plans of the server's SQL statements."
+    )
+    ARG_PARSER.add_argument(
+        "database",
+        nargs="?",
+        help="The logs database (default is a new synthetic database).",
+    )
+    ARG_PARSER.add_argument("--nights", type=int, default=Config.nights)
+    ARG_PARSER.add_argument("--files", type=int, default=Config.listed_files)
+    ARG_PARSER.add_argument(
+        "--keep", metavar="FOLDER", help="Write the synthetic database to FOLDER."
+    )
+    ARG_PARSER.add_argument(
+        "--verbose", action="store_true", help="Print the query plans."
+    )
+    ARGS = ARG_PARSER.parse_args()
+    quiet_logging()
+    if ARGS.database:
+        SCANS = check_plans(ARGS.database, ARGS.verbose)
+    else:
+        Config.nights = ARGS.nights
+        Config.listed_files = ARGS.files
+        FOLDER = ARGS.keep or tempfile.mkdtemp(prefix="robo-query-plans-")
+        if not os.path.exists(FOLDER):
+            os.makedirs(FOLDER)
+        try:
+            DB_NAME = os.path.join(FOLDER, "logs.db")
+            make_database(DB_NAME, os.path.join(FOLDER, "fixtures"))
+            SCANS = check_plans(DB_NAME, ARGS.verbose)
+        finally:
+            if not ARGS.keep:
+                shutil.rmtree(FOLDER, ignore_errors=True)
+    sys.exit(1 if SCANS else 0)
@@ -5,15 +5,29 @@ A minimal SQLite handler for the python logging module
 from: https://gist.github.com/giumas/994e48d3c1cff45fbe93
 with minor changes
 
+The records are queued, and written to the database in batches by a background
+thread, so logging does not wait for the database.
+
 Edit the Config object below as needed for each execution.
 """
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import atexit
 import logging
+import os
 import sqlite3
+import sys
+import threading
 import time
 
+try:
+    # Python 2
+    import Queue as queue
+except ImportError:
+    # Python 3
+    import queue
+
 
 class Config(object):
     """Namespace for configuration parameters. Edit as needed."""
@@ -37,6 +51,48 @@ class Config(object):
             ThreadName TEXT
         )
     """
+    # SQL command to index the log records by time (for deleting old records).
+    index_sql = "CREATE INDEX IF NOT EXISTS log_timestamp_ix ON log(TimeStamp)"
+
+    # SQL commands to create and fill the table with the number of log records on
+    # each date (YYYY-MM-DD).  The server's /summary uses it to flag the nights
+    # with parse errors (logged the next day) without reading the log table.
+    dates_sql = """
+        CREATE TABLE IF NOT EXISTS log_dates(
+            date TEXT PRIMARY KEY,
+            records INTEGER
+        )
+    """
+    fill_dates_sql = """
+        INSERT OR IGNORE INTO log_dates(date, records)
+            SELECT SUBSTR(TimeStamp, 1, 10), COUNT(*) FROM log
+            GROUP BY SUBSTR(TimeStamp, 1, 10)
+    """
+
+    # SQL command to add records to the count for a date (date, count, date).
+    date_count_sql = """
+        INSERT OR REPLACE INTO log_dates(date, records)
+        VALUES (?, ? + COALESCE((SELECT records FROM log_dates WHERE date = ?), 0))
+    """
+
+    # Log records older than this many days are deleted (the first time records
+    # are written by each process); None keeps all the records.  The counts in
+    # log_dates are kept.
+    retention_days = 365
+    retention_sql = "DELETE FROM log WHERE TimeStamp < ?"
+    # Seconds to wait for a lock on the database before trying again later.
+    # The log processor holds a lock on the database while it writes the log files.
+    lock_timeout = 0.1
+
+    # The queued records are written when there are batch_size records, or
+    # flush_interval seconds after the first queued record.
+    batch_size = 500
+    flush_interval = 2.0
+
+    # Seconds to wait for the database when the handler is flushed or closed
+    # (i.e. when the process exits).
+    close_timeout = 5.0
+
     # SQL Command to insert a log record.
     insertion_sql = """
         INSERT INTO log(
@@ -53,25 +109,32 @@ class Config(object):
             Thread,
             ThreadName
         )
-        VALUES (
-            '%(dbtime)s',
-            '%(name)s',
-            %(levelno)d,
-            '%(levelname)s',
-            '%(message)s',
-            '%(module)s',
-            '%(funcName)s',
-            %(lineno)d,
-            '%(exc_text)s',
-            %(process)d,
-            '%(thread)s',
-            '%(threadName)s'
-        );
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
     """
 
 
+def create_tables(conn):
+    """Create the log and log_dates tables (if needed) in the database conn."""
+
+    conn.execute(Config.initial_sql)
+    conn.execute(Config.index_sql)
+    sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'log_dates'"
+    if conn.execute(sql).fetchone() is None:
+        # Count the records that were written before log_dates was added
+        conn.execute(Config.dates_sql)
+        conn.execute(Config.fill_dates_sql)
+    conn.commit()
+
+
 class SQLiteHandler(logging.Handler):
-    """Thread-safe logging handler for SQLite."""
+    """Thread-safe logging handler for SQLite.
+
+    emit() puts the record in a queue, and a writer thread writes the queued
+    records in a single transaction (see batch_size and flush_interval in the
+    Config object).  If the database is locked, the records are kept and written
+    later.  flush() waits until the queued records are written, and the handler
+    is closed (and the queue written) when the process exits.
+    """
 
     # issues cannot be corrected without breaking the class contract.
     # pylint: disable=invalid-name,no-self-use,protected-access
@@ -79,9 +142,16 @@ class SQLiteHandler(logging.Handler):
     def __init__(self, db="app.db"):
         logging.Handler.__init__(self)
         self.db = db
+        self.queue = queue.Queue()
+        self.writer = None
+        # The writer thread only runs in this process (see emit())
+        self.pid = os.getpid()
+        # The process that last deleted the records older than retention_days
+        self.pruned_pid = None
         conn = sqlite3.connect(self.db)
-        conn.execute(Config.initial_sql)
-        conn.commit()
+        create_tables(conn)
+        conn.close()
+        atexit.register(self.close)
 
     def format_time(self, record):
         """Create a time stamp."""
@@ -90,25 +160,158 @@ class SQLiteHandler(logging.Handler):
             "%Y-%m-%d %H:%M:%S", time.localtime(record.created)
         )
 
-    def format_msg(self, record):
-        """Remove single quotes from message."""
-
-        record.message = record.message.replace("'", '"')
-
     def emit(self, record):
-        """Send a log record to the database."""
+        """Queue a log record for the database."""
 
         self.format(record)
         self.format_time(record)
-        self.format_msg(record)
         if record.exc_info:  # for exceptions
             record.exc_text = logging._defaultFormatter.formatException(record.exc_info)
-            record.exc_text = record.exc_text.replace("'", '"')
         else:
             record.exc_text = ""
+        params = (
+            record.dbtime,
+            record.name,
+            record.levelno,
+            record.levelname,
+            record.message,
+            record.module,
+            record.funcName,
+            record.lineno,
+            record.exc_text,
+            record.process,
+            "{0}".format(record.thread),
+            record.threadName,
+        )
+        if os.getpid() != self.pid:
+            # A forked (multiprocessing) process does not have the writer thread,
+            # and it may exit without closing the handler, so write the record now.
+            self.write_records([params], Config.close_timeout)
+            return
+        if self.writer is None or not self.writer.is_alive():
+            self.writer = threading.Thread(
+                target=self.write_queue, name="SQLiteHandler"
+            )
+            self.writer.daemon = True
+            self.writer.start()
+        self.queue.put(params)
 
-        # Insert the log record
-        sql = Config.insertion_sql % record.__dict__
-        conn = sqlite3.connect(self.db)
-        conn.execute(sql)
-        conn.commit()  # not efficient, but hopefully thread-safe
+    def write_queue(self):
+        """Write the queued records to the database (runs in the writer thread).
+
+        The queue has records (tuples), events (set when the records before it
+        are written; see flush()), and None (write the records and stop).
+        """
+
+        records = []
+        deadline = None  # when the records must be written
+        locked = False  # the database was locked on the last write
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.time())
+            write = stop = False
+            event = None
+            try:
+                item = self.queue.get(True, timeout)
+            except queue.Empty:
+                write = True
+            else:
+                if item is None:
+                    stop = True
+                elif isinstance(item, tuple):
+                    records.append(item)
+                    write = len(records) >= Config.batch_size and not locked
+                else:
+                    event = item
+            if records and (write or stop or event):
+                if stop or event:
+                    locked = not self.write_records(records, Config.close_timeout)
+                else:
+                    locked = not self.write_records(records, Config.lock_timeout)
+                deadline = None
+            if records and deadline is None:
+                deadline = time.time() + Config.flush_interval
+            if event is not None:
+                event.set()
+            if stop:
+                return
+
+    def write_records(self, records, timeout):
+        """Write the records in one transaction, and remove them from the list.
+
+        The counts in log_dates are updated in the same transaction, and the first
+        write in each process deletes the records older than Config.retention_days.
+        The records are kept if the database is locked (for more than timeout
+        seconds), so they can be written later; returns False if they were kept.
+        """
+
+        counts = {}
+        for record in records:
+            date = record[0][:10]
+            counts[date] = counts.get(date, 0) + 1
+        prune = Config.retention_days is not None and self.pruned_pid != os.getpid()
+        try:
+            conn = sqlite3.connect(self.db, timeout=timeout)
+            try:
+                with conn:
+                    conn.executemany(Config.insertion_sql, records)
+                    for date, count in counts.items():
+                        conn.execute(Config.date_count_sql, (date, count, date))
+                    if prune:
+                        cutoff = time.time() - Config.retention_days * 24 * 3600
+                        cutoff = time.strftime("%Y-%m-%d", time.localtime(cutoff))
+                        conn.execute(Config.retention_sql, (cutoff,))
+            finally:
+                conn.close()
+            if prune:
+                self.pruned_pid = os.getpid()
+        except sqlite3.OperationalError as ex:
+            if "locked" in "{0}".format(ex):
+                # Try again later
+                return False
+            self.report_error(records, ex)
+        except Exception as ex:
+            self.report_error(records, ex)
+        del records[:]
+        return True
+
+    def report_error(self, records, ex):
+        """Report the records that could not be written (if logging.raiseExceptions)."""
+
+        if logging.raiseExceptions:
+            sys.stderr.write(
+                "SQLiteHandler: Unable to write {0} log records to {1}; {2}\n".format(
+                    len(records), self.db, ex
+                )
+            )
+
+    def writing(self):
+        """Return True if the writer thread is running in this process."""
+
+        return (
+            os.getpid() == self.pid
+            and self.writer is not None
+            and self.writer.is_alive()
+        )
+
+    def flush(self):
+        """Wait (up to Config.close_timeout seconds) until the queue is written."""
+
+        if not self.writing():
+            return
+        event = threading.Event()
+        self.queue.put(event)
+        event.wait(Config.close_timeout + 1.0)
+
+    def close(self):
+        """Write the queued records, stop the writer thread, and close the handler."""
+
+        self.acquire()
+        try:
+            if self.writing():
+                self.queue.put(None)
+                self.writer.join(Config.close_timeout + 1.0)
+        finally:
+            self.release()
+        logging.Handler.close(self)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the throughput and latency of the server under concurrent load.
+
+Each client thread sends GET requests for the paths in the Config object in
+turn, until the number of requests is sent; with a new connection for each
+request, or (with --keep-alive, like a web browser) on one connection.  The
+requests per second, and the latency percentiles of all requests and of each
+path are printed.
+
+Edit the Config object below as needed for each execution.
+
+Works with Python 2.7 and Python 3.x
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import ssl
+import threading
+import timeit
+
+try:
+    # Python 2
+    from urllib2 import urlopen, HTTPError
+    import httplib as http_client
+    import urlparse
+except ImportError:
+    # Python 3
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+    import http.client as http_client
+    import urllib.parse as urlparse
+
+
+class Config(object):
+    """Namespace for configuration parameters. Edit as needed."""
+
+    # pylint: disable=useless-object-inheritance,too-few-public-methods
+
+    # The server (the certificate of an https server is not checked)
+    url = "https://localhost:8443"
+
+    # The requests of the web page
+    paths = ["/summary", "/parks", "/plot1", "/scanavg", "/copyavg", "/speed"]
+    paths += ["/dates"]
+
+    # The number of clients sending requests at the same time, and the total
+    # number of requests
+    clients = 8
+    requests = 400
+
+    # Seconds to wait for a response
+    timeout = 60
+
+
+def percentile(times, fraction):
+    """Return the time in the sorted list times that fraction of the times are under."""
+
+    if not times:
+        return 0.0
+    return times[min(len(times) - 1, int(fraction * len(times)))]
+
+
+def client(url, paths, count, results, context):
+    """Send count requests for paths (in turn); add (path, seconds, ok) to results."""
+
+    for index in range(count):
+        path = paths[index % len(paths)]
+        start = timeit.default_timer()
+        try:
+            response = urlopen(url + path, timeout=Config.timeout, context=context)
+            response.read()
+            response.close()
+            ok = True
+        except HTTPError as ex:
+            ex.read()
+            ok = False
+        except Exception:
+            ok = False
+        results.append((path, timeit.default_timer() - start, ok))
+
+
+def keep_alive_client(url, paths, count, results, context):
+    """Like client, but send the requests on one connection (reconnect if closed)."""
+
+    parts = urlparse.urlparse(url)
+    if parts.scheme == "https":
+        connection = http_client.HTTPSConnection(
+            parts.netloc, timeout=Config.timeout, context=context
+        )
+    else:
+        connection = http_client.HTTPConnection(parts.netloc, timeout=Config.timeout)
+    for index in range(count):
+        path = paths[index % len(paths)]
+        start = timeit.default_timer()
+        ok = False
+        # The server closes an idle connection when it is busy; try once more
+        for _ in range(2):
+            try:
+                connection.request("GET", parts.path + path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+                break
+            except Exception:
+                connection.close()
+        results.append((path, timeit.default_timer() - start, ok))
+    connection.close()
+
+
+def load_test(url, paths, clients, requests, keep_alive=False):
+    """Send requests to url from clients threads, and print the results."""
+
+    context = None
+    if url.startswith("https"):
+        context = ssl._create_unverified_context()  # pylint: disable=protected-access
+    results = []
+    threads = []
+    for index in range(clients):
+        # Spread the requests (and paths) evenly over the clients
+        count = requests // clients + (1 if index < requests % clients else 0)
+        first = index % len(paths)
+        rotated = paths[first:] + paths[:first]
+        thread = threading.Thread(
+            target=keep_alive_client if keep_alive else client,
+            args=(url, rotated, count, results, context),
+        )
+        threads.append(thread)
+    start = timeit.default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = timeit.default_timer() - start
+    errors = sum(1 for result in results if not result[2])
+    rate = len(results) / seconds
+    print(
+        "{0} requests from {1} clients in {2:.2f} seconds: "
+        "{3:.1f} requests/second, {4} errors".format(
+            len(results), clients, seconds, rate, errors
+        )
+    )
+    print(
+        "{0:12} {1:>6} {2:>8} {3:>8} {4:>8} {5:>8}".format(
+            "path", "count", "p50 ms", "p90 ms", "p99 ms", "max ms"
+        )
+    )
+    for path in ["all"] + paths:
+        times = sorted(result[1] for result in results if path in ("all", result[0]))
+        print(
+            "{0:12} {1:6d} {2:8.1f} {3:8.1f} {4:8.1f} {5:8.1f}".format(
+                path,
+                len(times),
+                percentile(times, 0.5) * 1000,
+                percentile(times, 0.9) * 1000,
+                percentile(times, 0.99) * 1000,
+                times[-1] * 1000 if times else 0.0,
+            )
+        )
+
+
+if __name__ == "__main__":
+    ARG_PARSER = argparse.ArgumentParser(
+        description="Measure the server's throughput and latency under load."
+    )
+    ARG_PARSER.add_argument("url", nargs="?", default=Config.url)
+    ARG_PARSER.add_argument("--clients", type=int, default=Config.clients)
+    ARG_PARSER.add_argument("--requests", type=int, default=Config.requests)
+    ARG_PARSER.add_argument(
+        "--paths", help="A comma separated list of paths, i.e. /summary,/speed"
+    )
+    ARG_PARSER.add_argument(
+        "--keep-alive",
+        action="store_true",
+        help="Send each client's requests on one connection",
+    )
+    ARGS = ARG_PARSER.parse_args()
+    load_test(
+        ARGS.url.rstrip("/"),
+        ARGS.paths.split(",") if ARGS.paths else Config.paths,
+        ARGS.clients,
+        ARGS.requests,
+        ARGS.keep_alive,
+    )
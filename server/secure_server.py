@@ -8,20 +8,37 @@ Works with Python 2.7 and Python 3.x
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import codecs
+import collections
+import contextlib
 import datetime
+import gzip
+import hashlib
+import io
 from io import open
 import json
 import os
+import select
+import signal
+import socket
 import sqlite3
 import ssl
+import sys
+import threading
+import time
+import zlib
 
 try:
     # Python 2
+    import Queue as queue
+    from urllib import pathname2url
     import urlparse
     from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 except ImportError:
     # Python 3
-    import urllib.urlparse as urlparse
+    import queue
+    from urllib.request import pathname2url
+    import urllib.parse as urlparse
     from http.server import BaseHTTPRequestHandler, HTTPServer
 
 
@@ -38,6 +55,56 @@ class Config(object):
     # a secure service requires `import ssl`
     secure = True
 
+    # Default and maximum number of lines before and after the requested line
+    # in a /logexcerpt response
+    excerpt_context = 10
+    max_excerpt_context = 500
+
+    # The number of threads that handle requests; each one uses a read-only
+    # database connection from a pool, which is kept open between requests.
+    threads = 8
+
+    # The number of accepted requests that can wait for a thread; when the queue
+    # is full, new connections wait in the socket's listen backlog.
+    queued_requests = 64
+
+    # The number of server processes (each with `threads` threads) that accept
+    # connections on the same socket; a process that exits is restarted.
+    # More than one process needs os.fork(), which Windows does not have.
+    processes = 1
+
+    # Seconds to wait before restarting a process that ran for less than this
+    restart_delay = 5.0
+
+    # Seconds a connection is kept open (HTTP/1.1 keep-alive) for the client's
+    # next request.  The connection holds its thread while it waits, so it is
+    # closed sooner when other connections are waiting for a thread.
+    keep_alive_timeout = 5.0
+
+    # Seconds a TLS handshake, or reading a request or sending a response, can
+    # stall before the connection is closed.
+    request_timeout = 30.0
+
+    # The bytes of JSON responses kept in each server process's cache, which is
+    # cleared when the database changes (0 for no cache).
+    cache_size = 32 * 1024 * 1024
+
+    # Seconds between checks for a change to the database.  When a change is
+    # followed by a quiet check (i.e. the log processor is done), the responses
+    # for warm_paths are cached, ready for the morning's first requests.
+    cache_poll_seconds = 2.0
+    warm_paths = ["/summary", "/parks", "/plot1"]
+
+    # Requests check for a change to the database at most this often (seconds),
+    # so a cached response can be this much older than the database.
+    cache_check_seconds = 0.5
+
+    # Responses (and log files) of at least compress_min_size bytes are sent
+    # compressed (gzip or deflate) to a client that accepts it (Accept-Encoding).
+    # The zlib compress_level is 1 (fastest) to 9 (smallest).
+    compress_min_size = 1024
+    compress_level = 6
+
 
 # pylint: disable=broad-except
 # If an unexpected exception occurs, I want to send the error to the user, and continue
@@ -50,51 +117,118 @@ class Config(object):
 class SyncHandler(BaseHTTPRequestHandler):
     """A simple HTTP server."""
 
+    # Keep connections open for the page's requests (every response has a
+    # Content-Length or is chunked), and send small responses without delay.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    timeout = Config.request_timeout
+
     db_name = Config.log_database
     name = "XDrive RoboCopy Log Details"
+    # The responses that depend only on the database (not the log files) are cached
+    cached_paths = ["/summary", "/parks", "/plot1", "/dates"]
+    cached_paths += ["/scanavg", "/copyavg", "/speed", "/runs"]
+    # The day number (days since 1970-01-01, used in the logs and log_daily tables)
+    # of a YYYY-MM-DD date parameter; the date of a day is DATE(2440587.5 + day).
+    day_sql = "CAST(JULIANDAY(?) - 2440587.5 AS INTEGER)"
     usage = """
         Usage:
             GET with /summary or summary?date=YYYY-MM-DD to get the log summary
             GET with /parks or parks?date=YYYY-MM-DD to get the log details for all parks
             GET with /plot1 or plot1?date=YYYY-MM-DD to get data for a speed comparison of all parks
             GET with /dates to get the min and max date of the logs in the database
+            GET with /logexcerpt?log=ID&line=N&context=C to get lines N-C to N+C of a log file
+            GET with /logfile?date=YYYY-MM-DD&park=PARK to get a log file (Range requests work)
+            GET with /logfile?date=YYYY-MM-DD&park=PARK&tail=N to get the last N lines of a log file
+            GET with /runs or runs?start=YYYY-MM-DD&end=YYYY-MM-DD to get the times of the log processor runs
+            GET with /runs?run=ID to get the times for each log file in a log processor run
             GET with /help for this message
     """
 
+    def handle(self):
+        """Handle the requests on the connection until either side closes it."""
+
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.wait_for_request():
+            self.handle_one_request()
+
+    def wait_for_request(self):
+        """Return True when the next request on a kept alive connection arrives.
+
+        Return False (close the connection) after Config.keep_alive_timeout
+        seconds, or as soon as other connections are waiting for a thread.
+        """
+
+        if self.read_ahead():
+            return True
+        deadline = time.time() + Config.keep_alive_timeout
+        while time.time() < deadline:
+            if select.select([self.connection], [], [], 0.05)[0]:
+                return True
+            if self.server.busy():
+                return False
+        return False
+
+    def read_ahead(self):
+        """Return True if the next (pipelined) request has been read from the socket.
+
+        Data in the rfile buffer, or decrypted by TLS, is not seen by select().
+        """
+
+        # pylint: disable=protected-access
+        if hasattr(self.rfile, "peek"):
+            # Python 3: peek() only reads from the socket if the buffer is empty
+            self.connection.settimeout(0.0)
+            try:
+                return bool(self.rfile.peek(1))
+            except socket.error:
+                return False
+            finally:
+                self.connection.settimeout(self.timeout)
+        # Python 2
+        if self.rfile._rbuf.tell() > 0:
+            return True
+        pending = getattr(self.connection, "pending", None)
+        return bool(pending and pending())
+
     def do_GET(self):
         """Handle a GET request."""
         path_parts = urlparse.urlparse(self.path)
         params = urlparse.parse_qs(path_parts.query)
+        if self.cached_response(path_parts.path, params):
+            return
         sql_params = []
         if path_parts.path == "/summary":
+            # log_daily is maintained by the log processor, and log_dates (the
+            # number of log records on each date) by its database log handler.
+            # The parse errors for a night's logs are logged the next day.
             sql = """
-                SELECT l.date AS summary_date,
-                COUNT(*) AS count_start,
-                COUNT(l1.park) AS count_unfinished,
-                COUNT(e1.log_id) AS count_with_errors,
-                CASE WHEN c.date IS NULL THEN 0 ELSE 1 END AS has_changes,
-                CASE WHEN e2.date IS NULL THEN 0 ELSE 1 END AS has_parse_errors
-                FROM logs AS l
-                LEFT JOIN logs AS l1 ON l.log_id = l1.log_id and (l1.finished = 0 OR l1.finished IS NULL)
-                LEFT JOIN (SELECT log_id FROM errors WHERE failed GROUP BY log_id) AS e1 ON l.log_id = e1.log_id
-                LEFT JOIN changes AS c on l.date = c.date
-                LEFT JOIN (SELECT SUBSTR(DATETIME(TimeStamp, '-1 day'), 0 ,11) as date from log group by date) as e2 ON l.date = e2.date
-                WHERE l.date = (SELECT MAX(date) FROM logs)
-                GROUP BY l.date;
+                SELECT DATE(2440587.5 + d.day) AS summary_date,
+                d.count_start, d.count_unfinished, d.count_with_errors,
+                EXISTS (
+                    SELECT 1 FROM changes AS c WHERE c.date = DATE(2440587.5 + d.day)
+                ) AS has_changes,
+                EXISTS (
+                    SELECT 1 FROM log_dates AS e
+                    WHERE e.date = DATE(2440587.5 + d.day, '+1 day')
+                ) AS has_parse_errors
+                FROM log_daily AS d
+                WHERE d.day = (SELECT MAX(day) FROM log_daily);
             """
             if "date" in params and len(params["date"]) == 1:
                 date = params["date"][0]
                 date = self.sanitize_date(date)
                 if date:
                     sql = sql.replace(
-                        "WHERE l.date = (SELECT MAX(date) FROM logs)",
-                        "WHERE l.date = ?",
+                        "WHERE d.day = (SELECT MAX(day) FROM log_daily)",
+                        "WHERE d.day = " + self.day_sql,
                     )
                     sql_params = [date]
                 else:
                     self.err_response("Bad date request")
                     return
-            with sqlite3.connect(self.db_name) as database:
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_one(database, sql, sql_params)
                     self.std_response(resp)
@@ -103,31 +237,31 @@ class SyncHandler(BaseHTTPRequestHandler):
 
         elif path_parts.path == "/parks":
             sql = """
-                SELECT l.park, l.date, l.finished,
-                COALESCE(e.count_errors, 0) AS count_errors,
-                sf.copied AS files_copied, sf.extra AS files_removed, sf.total AS files_scanned,
-                st.copied AS time_copying, st.extra AS time_scanning, sb.copied AS bytes_copied
+                SELECT p.park, DATE(2440587.5 + l.day) AS date, l.finished,
+                l.count_errors,
+                s.files_copied, s.files_extra AS files_removed,
+                s.files_total AS files_scanned,
+                s.times_copied AS time_copying, s.times_extra AS time_scanning,
+                s.bytes_copied
                 FROM logs AS l
-                LEFT JOIN stats AS sf ON l.log_id = sf.log_id and sf.stat = 'files'
-                LEFT JOIN stats AS st ON l.log_id = st.log_id and st.stat = 'times'
-                LEFT JOIN stats AS sb ON l.log_id = sb.log_id and sb.stat = 'bytes'
-                LEFT JOIN (select log_id, COUNT(*) AS count_errors FROM errors where failed group by log_id) AS e ON l.log_id = e.log_id
-                WHERE l.date = (SELECT MAX(date) FROM logs)
-                ORDER BY l.park;
+                JOIN parks AS p ON l.park_id = p.park_id
+                LEFT JOIN stats AS s ON l.log_id = s.log_id
+                WHERE l.day = (SELECT MAX(day) FROM log_daily)
+                ORDER BY p.park;
             """
             if "date" in params and len(params["date"]) == 1:
                 date = params["date"][0]
                 date = self.sanitize_date(date)
                 if date:
                     sql = sql.replace(
-                        "WHERE l.date = (SELECT MAX(date) FROM logs)",
-                        "WHERE l.date = ?",
+                        "WHERE l.day = (SELECT MAX(day) FROM log_daily)",
+                        "WHERE l.day = " + self.day_sql,
                     )
                     sql_params = [date]
                 else:
                     self.err_response("Bad date request")
                     return
-            with sqlite3.connect(self.db_name) as database:
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_rows(database, sql, sql_params)
                     self.std_response(resp)
@@ -151,7 +285,7 @@ class SyncHandler(BaseHTTPRequestHandler):
                 except ValueError:
                     pass
             sql_params = [log_id]
-            with sqlite3.connect(self.db_name) as database:
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_rows(database, sql, sql_params)
                     self.std_response(resp)
@@ -160,9 +294,11 @@ class SyncHandler(BaseHTTPRequestHandler):
 
         elif path_parts.path == "/error_details":
             sql = """
-                SELECT REPLACE(message,'E:\\XDrive\\RemoteServers\\XDrive-','') AS message
-                FROM errors
-                WHERE log_id = ? AND error_code = ? ORDER BY error_id;
+                SELECT m.action, r.root_name AS root, m.path
+                FROM errors AS e JOIN messages AS m
+                ON e.message_id = m.message_id
+                LEFT JOIN roots AS r ON m.root_id = r.root_id
+                WHERE e.log_id = ? AND e.error_code = ? ORDER BY e.error_id;
             """
             # Return nothing (log_id = 0), instead of an error when given bad input
             log_id = 0
@@ -180,7 +316,7 @@ class SyncHandler(BaseHTTPRequestHandler):
                 except ValueError:
                     pass
             sql_params = [log_id, code]
-            with sqlite3.connect(self.db_name) as database:
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_rows(database, sql, sql_params)
                     self.std_response(resp)
@@ -188,7 +324,11 @@ class SyncHandler(BaseHTTPRequestHandler):
                     self.err_response("{0}".format(ex))
 
         elif path_parts.path == "/logfile":
-            sql = "SELECT filename FROM logs WHERE date = ? AND park = ?"
+            sql = """
+                SELECT l.filename FROM logs AS l
+                JOIN parks AS p ON l.park_id = p.park_id
+                WHERE l.day = {day} AND p.park = ?
+            """.format(day=self.day_sql)
             date = None
             if "date" in params and len(params["date"]) == 1:
                 date = params["date"][0]
@@ -196,10 +336,19 @@ class SyncHandler(BaseHTTPRequestHandler):
             park = None
             if "park" in params and len(params["park"]) == 1:
                 park = params["park"][0]
+            tail = None
+            if "tail" in params:
+                try:
+                    tail = int(params["tail"][0])
+                except ValueError:
+                    tail = 0
+                if len(params["tail"]) != 1 or tail < 1:
+                    self.err_response("Bad tail parameter")
+                    return
             filename = None
             if park and date:
                 sql_params = [date, park]
-                with sqlite3.connect(self.db_name) as database:
+                with self.db_connection() as database:
                     try:
                         resp = self.db_get_one(database, sql, sql_params)
                         if resp and "filename" in resp:
@@ -208,12 +357,9 @@ class SyncHandler(BaseHTTPRequestHandler):
                         self.err_response("{0}".format(ex))
                         return
             if filename:
-                filename = os.path.basename(filename)
-                folder = os.path.dirname(Config.log_database)
-                archive = date[:4] + "archive"
-                filename = os.path.join(folder, archive, filename)
-                if os.path.exists(filename):
-                    self.file_response(filename)
+                path = self.find_log_file(filename, date)
+                if path:
+                    self.file_response(path, tail)
                 else:
                     msg = "log file {0} not found".format(filename)
                     self.err_response(msg)
@@ -221,19 +367,65 @@ class SyncHandler(BaseHTTPRequestHandler):
                 folder = os.path.dirname(Config.log_database)
                 filename = os.path.join(folder, "LogProcessor.log")
                 if os.path.exists(filename):
-                    self.file_response(filename)
+                    self.file_response(filename, tail)
                 else:
                     msg = "log file {0} not found".format(filename)
                     self.err_response(msg)
 
+        elif path_parts.path == "/logexcerpt":
+            sql = """
+                SELECT filename, DATE(2440587.5 + day) AS date
+                FROM logs WHERE log_id = ?
+            """
+            # Return nothing (log_id = 0), instead of an error when given bad input
+            log_id = 0
+            line = 0
+            context = Config.excerpt_context
+            if "log" in params and len(params["log"]) == 1:
+                try:
+                    log_id = int(params["log"][0])
+                except ValueError:
+                    pass
+            if "line" in params and len(params["line"]) == 1:
+                try:
+                    line = int(params["line"][0])
+                except ValueError:
+                    pass
+            if "context" in params and len(params["context"]) == 1:
+                try:
+                    context = int(params["context"][0])
+                except ValueError:
+                    pass
+            context = max(0, min(context, Config.max_excerpt_context))
+            with self.db_connection() as database:
+                try:
+                    resp = self.db_get_one(database, sql, [log_id])
+                except Exception as ex:
+                    self.err_response("{0}".format(ex))
+                    return
+            header = [["line_num", "text"]]
+            if not resp or line < 1:
+                self.std_response(header)
+                return
+            path = self.find_log_file(resp["filename"], resp["date"])
+            if not path:
+                msg = "log file {0} not found".format(resp["filename"])
+                self.err_response(msg)
+                return
+            try:
+                first = max(1, line - context)
+                lines = self.read_log_lines(path, first, line + context)
+                self.std_response(header + lines)
+            except Exception as ex:
+                self.err_response("{0}".format(ex))
+
         elif path_parts.path == "/dates":
             sql = """
                 SELECT
-                MIN(date) as first_date,
-                MAX(date) as last_date
-                FROM logs;
+                DATE(2440587.5 + (SELECT MIN(day) FROM log_daily)) as first_date,
+                DATE(2440587.5 + (SELECT MAX(day) FROM log_daily)) as last_date;
             """
-            with sqlite3.connect(self.db_name) as database:
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_one(database, sql)
                     self.std_response(resp)
@@ -242,29 +434,28 @@ class SyncHandler(BaseHTTPRequestHandler):
 
         elif path_parts.path == "/plot1":
             sql = """
-                SELECT l.park,
-                COALESCE(round(1.0*sf.total/st.extra, 1), 0) AS scan_speed,
-                COALESCE(round(sb.copied/st.copied/1000.0, 1), 0) AS copy_speed
+                SELECT p.park,
+                COALESCE(round(1.0*s.files_total/s.times_extra, 1), 0) AS scan_speed,
+                COALESCE(round(s.bytes_copied/s.times_copied/1000.0, 1), 0) AS copy_speed
                 FROM logs AS l
-                LEFT JOIN stats AS sf ON l.log_id = sf.log_id and sf.stat = 'files'
-                LEFT JOIN stats AS st ON l.log_id = st.log_id and st.stat = 'times'
-                LEFT JOIN stats AS sb ON l.log_id = sb.log_id and sb.stat = 'bytes'
-                WHERE l.date = (SELECT MAX(date) FROM logs)
-                ORDER BY l.park;
+                JOIN parks AS p ON l.park_id = p.park_id
+                LEFT JOIN stats AS s ON l.log_id = s.log_id
+                WHERE l.day = (SELECT MAX(day) FROM log_daily)
+                ORDER BY p.park;
             """
             if "date" in params and len(params["date"]) == 1:
                 date = params["date"][0]
                 date = self.sanitize_date(date)
                 if date:
                     sql = sql.replace(
-                        "WHERE l.date = (SELECT MAX(date) FROM logs)",
-                        "WHERE l.date = ?",
+                        "WHERE l.day = (SELECT MAX(day) FROM log_daily)",
+                        "WHERE l.day = " + self.day_sql,
                     )
                     sql_params = [date]
                 else:
                     self.err_response("Bad date request")
                     return
-            with sqlite3.connect(self.db_name) as database:
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_rows(database, sql, sql_params, False)
                     self.std_response(resp)
@@ -273,20 +464,19 @@ class SyncHandler(BaseHTTPRequestHandler):
 
         elif path_parts.path == "/scanavg":
             sql = """
-                SELECT l.park,
-                ROUND(AVG(1.0*sf.total/st.extra), 1) AS avg_scan_speed,
+                SELECT p.park,
+                ROUND(AVG(1.0*s.files_total/s.times_extra), 1) AS avg_scan_speed,
                 COUNT(*) AS CNT
                 FROM logs AS l
-                LEFT JOIN stats AS sf ON l.log_id = sf.log_id and sf.stat = 'files'
-                LEFT JOIN stats AS st ON l.log_id = st.log_id and st.stat = 'times'
-                LEFT JOIN errors AS e ON l.log_id = e.log_id
-                WHERE e.log_id IS NULL
-                AND st.extra > 0 AND sf.total > 0
-                AND l.date > ?
-                AND l.date < ?
-                GROUP BY l.park
-                ORDER BY l.park;
-            """
+                JOIN parks AS p ON l.park_id = p.park_id
+                JOIN stats AS s ON l.log_id = s.log_id
+                WHERE l.has_errors = 0
+                AND s.times_extra > 0 AND s.files_total > 0
+                AND l.day > {day}
+                AND l.day < {day}
+                GROUP BY p.park
+                ORDER BY p.park;
+            """.format(day=self.day_sql)
             if "start" in params and len(params["start"]) == 1:
                 date = params["start"][0]
                 date = self.sanitize_date(date)
@@ -296,7 +486,7 @@ class SyncHandler(BaseHTTPRequestHandler):
                     self.err_response("Bad start date parameter")
                     return
             else:
-                sql = sql.replace("AND l.date > ?", "")
+                sql = sql.replace("AND l.day > " + self.day_sql, "")
             if "end" in params and len(params["end"]) == 1:
                 date = params["end"][0]
                 date = self.sanitize_date(date)
@@ -306,8 +496,8 @@ class SyncHandler(BaseHTTPRequestHandler):
                     self.err_response("Bad end date parameter")
                     return
             else:
-                sql = sql.replace("AND l.date < ?", "")
-            with sqlite3.connect(self.db_name) as database:
+                sql = sql.replace("AND l.day < " + self.day_sql, "")
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_rows(database, sql, sql_params, False)
                     self.std_response(resp)
@@ -316,20 +506,19 @@ class SyncHandler(BaseHTTPRequestHandler):
 
         elif path_parts.path == "/copyavg":
             sql = """
-                SELECT l.park,
-                ROUND(AVG(1.0*sb.copied/st.copied/1000.0), 1) AS avg_copy_speed,
+                SELECT p.park,
+                ROUND(AVG(1.0*s.bytes_copied/s.times_copied/1000.0), 1) AS avg_copy_speed,
                 COUNT(*) AS CNT
                 FROM logs AS l
-                LEFT JOIN stats AS st ON l.log_id = st.log_id and st.stat = 'times'
-                LEFT JOIN stats AS sb ON l.log_id = sb.log_id and sb.stat = 'bytes'
-                LEFT JOIN errors AS e ON l.log_id = e.log_id
-                WHERE e.log_id IS NULL
-                AND st.copied > 0 AND sb.copied > 0
-                AND l.date > ?
-                AND l.date < ?
-                GROUP BY l.park
-                ORDER BY l.park;
-            """
+                JOIN parks AS p ON l.park_id = p.park_id
+                JOIN stats AS s ON l.log_id = s.log_id
+                WHERE l.has_errors = 0
+                AND s.times_copied > 0 AND s.bytes_copied > 0
+                AND l.day > {day}
+                AND l.day < {day}
+                GROUP BY p.park
+                ORDER BY p.park;
+            """.format(day=self.day_sql)
             if "start" in params and len(params["start"]) == 1:
                 date = params["start"][0]
                 date = self.sanitize_date(date)
@@ -339,7 +528,7 @@ class SyncHandler(BaseHTTPRequestHandler):
                     self.err_response("Bad start date parameter")
                     return
             else:
-                sql = sql.replace("AND l.date > ?", "")
+                sql = sql.replace("AND l.day > " + self.day_sql, "")
             if "end" in params and len(params["end"]) == 1:
                 date = params["end"][0]
                 date = self.sanitize_date(date)
@@ -349,8 +538,8 @@ class SyncHandler(BaseHTTPRequestHandler):
                     self.err_response("Bad end date parameter")
                     return
             else:
-                sql = sql.replace("AND l.date < ?", "")
-            with sqlite3.connect(self.db_name) as database:
+                sql = sql.replace("AND l.day < " + self.day_sql, "")
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_rows(database, sql, sql_params, False)
                     self.std_response(resp)
@@ -359,23 +548,21 @@ class SyncHandler(BaseHTTPRequestHandler):
 
         elif path_parts.path == "/speed":
             sql = """
-                SELECT l.park, l.date,
-                ROUND(1.0*sf.total/st.extra, 1) AS scan_speed,
-                ROUND(1.0*sb.copied/st.copied/1000.0, 1) AS copy_speed,
-                ROUND(1.0*sb.copied/sf.copied/1000.0, 1) AS avg_size_kb,
-                sf.copied as files,
-                ROUND(sb.copied/1000.0/1000.0, 2) as MBytes
+                SELECT p.park, DATE(2440587.5 + l.day) AS date,
+                ROUND(1.0*s.files_total/s.times_extra, 1) AS scan_speed,
+                ROUND(1.0*s.bytes_copied/s.times_copied/1000.0, 1) AS copy_speed,
+                ROUND(1.0*s.bytes_copied/s.files_copied/1000.0, 1) AS avg_size_kb,
+                s.files_copied as files,
+                ROUND(s.bytes_copied/1000.0/1000.0, 2) as MBytes
                 FROM logs AS l
-                LEFT JOIN stats AS sf ON l.log_id = sf.log_id and sf.stat = 'files'
-                LEFT JOIN stats AS st ON l.log_id = st.log_id and st.stat = 'times'
-                LEFT JOIN stats AS sb ON l.log_id = sb.log_id and sb.stat = 'bytes'
-                LEFT JOIN errors AS e ON l.log_id = e.log_id
-                WHERE e.log_id IS NULL
-                AND l.date > ?
-                AND l.date < ?
-                AND l.park = ?
-                ORDER BY l.park, l.date;
-            """
+                JOIN parks AS p ON l.park_id = p.park_id
+                LEFT JOIN stats AS s ON l.log_id = s.log_id
+                WHERE l.has_errors = 0
+                AND l.day > {day}
+                AND l.day < {day}
+                AND p.park = ?
+                ORDER BY p.park, l.day;
+            """.format(day=self.day_sql)
             if "start" in params and len(params["start"]) == 1:
                 date = params["start"][0]
                 date = self.sanitize_date(date)
@@ -385,7 +572,7 @@ class SyncHandler(BaseHTTPRequestHandler):
                     self.err_response("Bad start date parameter")
                     return
             else:
-                sql = sql.replace("AND l.date > ?", "")
+                sql = sql.replace("AND l.day > " + self.day_sql, "")
             if "end" in params and len(params["end"]) == 1:
                 date = params["end"][0]
                 date = self.sanitize_date(date)
@@ -395,7 +582,7 @@ class SyncHandler(BaseHTTPRequestHandler):
                     self.err_response("Bad end date parameter")
                     return
             else:
-                sql = sql.replace("AND l.date < ?", "")
+                sql = sql.replace("AND l.day < " + self.day_sql, "")
             if "park" in params and len(params["park"]) == 1:
                 park = params["park"][0]
                 park = self.sanitize_park(park)
@@ -405,14 +592,61 @@ class SyncHandler(BaseHTTPRequestHandler):
                     self.err_response("Bad park parameter")
                     return
             else:
-                sql = sql.replace("AND l.park = ?", "")
-            with sqlite3.connect(self.db_name) as database:
+                sql = sql.replace("AND p.park = ?", "")
+            with self.db_connection() as database:
                 try:
                     resp = self.db_get_rows(database, sql, sql_params, False)
                     self.std_response(resp)
                 except Exception as ex:
                     self.err_response("{0}".format(ex))
 
+        elif path_parts.path == "/runs":
+            # started is the text YYYY-MM-DD HH:MM:SS; it is compared as text, so
+            # the runs_started_ix index can be used.
+            sql = """
+                SELECT r.*,
+                ROUND(r.lines / r.parse_seconds) AS lines_per_second,
+                ROUND(r.bytes / r.parse_seconds) AS bytes_per_second
+                FROM runs AS r
+                WHERE r.started >= ?
+                AND r.started <= ? || ' 99:99:99'
+                ORDER BY r.run_id DESC;
+            """
+            if "run" in params and len(params["run"]) == 1:
+                # The log files in a run, slowest first
+                sql = """
+                    SELECT f.basename, f.log_id, f.lines, f.bytes,
+                    f.parse_seconds, f.parse_cpu_seconds, f.write_seconds,
+                    ROUND(f.lines / f.parse_seconds) AS lines_per_second,
+                    ROUND(f.bytes / f.parse_seconds) AS bytes_per_second
+                    FROM run_files AS f
+                    WHERE f.run_id = ?
+                    ORDER BY f.parse_seconds DESC;
+                """
+                try:
+                    sql_params.append(int(params["run"][0]))
+                except ValueError:
+                    self.err_response("Bad run parameter")
+                    return
+            else:
+                # All runs if there is no start or end date
+                for name, default in [("start", "0001-01-01"), ("end", "9999-12-31")]:
+                    if name in params and len(params[name]) == 1:
+                        date = self.sanitize_date(params[name][0])
+                        if date:
+                            sql_params.append(date)
+                        else:
+                            self.err_response("Bad {0} date parameter".format(name))
+                            return
+                    else:
+                        sql_params.append(default)
+            with self.db_connection() as database:
+                try:
+                    resp = self.db_get_rows(database, sql, sql_params)
+                    self.std_response(resp)
+                except Exception as ex:
+                    self.err_response("{0}".format(ex))
+
         elif path_parts.path == "/help":
             self.std_response({"help": self.usage})
         else:
@@ -428,24 +662,410 @@ class SyncHandler(BaseHTTPRequestHandler):
             data = data.encode("utf8")
         except AttributeError:
             pass
-        self.send_response(200)
-        self.send_header("Content-type", "json")
-        self.send_header("Content-length", len(data))
+        etag = hashlib.sha1(data).hexdigest()
+        encoding = self.accepted_encoding(len(data))
+        if encoding:
+            compressor = make_compressor(encoding)
+            data = compressor.compress(data) + compressor.flush()
+            etag += "-" + encoding
+        etag = '"{0}"'.format(etag)
+        if self.cache_key is not None:
+            entry = (data, etag, encoding)
+            self.server.cache.put(self.cache_key, self.cache_version, entry)
+        self.send_json(data, etag, encoding)
+
+    def cached_response(self, path, params):
+        """Respond from the cache and return True, or get ready to cache the response.
+
+        The key of a response is the path, the (sorted) parameters, and the
+        compression the client accepts (so the compressed and plain copies of
+        a response are cached separately).
+        """
+
+        self.cache_key = None
+        cache = getattr(self.server, "cache", None)
+        if cache is None or path not in self.cached_paths:
+            return False
+        params = tuple(sorted((k, tuple(v)) for k, v in params.items()))
+        self.cache_key = (path, params, self.accepted_encoding())
+        self.cache_version = cache.check()
+        entry = cache.get(self.cache_key)
+        if entry is None:
+            return False
+        self.send_json(*entry)
+        return True
+
+    def send_json(self, data, etag, encoding=None):
+        """Send the JSON data, or Not Modified if the client has the etag version.
+
+        The data is compressed with encoding (see accepted_encoding), if not None.
+        """
+
+        match = self.headers.get("If-None-Match") or ""
+        modified = etag not in [
+            tag.strip().replace("W/", "", 1) for tag in match.split(",")
+        ]
+        if not modified:
+            self.send_response(304)
+        else:
+            self.send_response(200)
+            self.send_header("Content-type", "json")
+            self.send_header("Content-length", len(data))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("ETag", etag)
+        # The browser can keep a copy, but must check that it is the latest
+        self.send_header("Cache-Control", "no-cache")
         self.end_headers()
-        self.wfile.write(data)
+        if modified:
+            self.wfile.write(data)
+
+    def accepted_encoding(self, size=None):
+        """Return the compression (gzip or deflate) for a response, or None.
 
-    def file_response(self, filename):
-        """Respond with the contents of filename."""
+        The compression is one that the client accepts (Accept-Encoding), and
+        a response smaller than Config.compress_min_size is not compressed.
+        """
+
+        if size is not None and size < Config.compress_min_size:
+            return None
+        quality = {}
+        for item in (self.headers.get("Accept-Encoding") or "").split(","):
+            name, _, param = item.partition(";")
+            param = param.strip()
+            value = 1.0
+            if param.startswith("q="):
+                try:
+                    value = float(param[2:])
+                except ValueError:
+                    value = 0.0
+            quality[name.strip().lower()] = value
+        for encoding in ("gzip", "deflate"):
+            if quality.get(encoding, quality.get("*", 0.0)) > 0:
+                return encoding
+        return None
+
+    def file_response(self, filename, tail=None):
+        """Respond with the contents of filename, or with its last tail lines.
+
+        A compressed (*.gz) file is decompressed as it is sent.  A Range request
+        for an uncompressed file gets the requested bytes (i.e. to resume a
+        download).  Other responses are compressed (see accepted_encoding) as
+        they are sent.  If the size of a response is unknown, it is sent in
+        chunks (or to the end of the connection for an HTTP/1.0 client).
+        """
 
         try:
             in_file = open(filename, "rb")
-            self.send_response(200)
-            self.send_header("Content-type", "text")
-            self.end_headers()
-            self.wfile.write(in_file.read())
-            in_file.close()
         except IOError:
             self.send_error(404, "File Not Found: {0}".format(filename))
+            return
+        try:
+            status = 200
+            headers = []
+            size = None
+            if filename.endswith(".gz"):
+                if tail is None:
+                    gzip_file = gzip.GzipFile(fileobj=in_file, mode="rb")
+                    blocks = self.read_blocks(gzip_file)
+                else:
+                    blocks = self.gzip_tail(in_file, filename, tail)
+            else:
+                stat = os.fstat(in_file.fileno())
+                start, stop = 0, stat.st_size
+                if tail is not None:
+                    start = self.tail_offset(in_file, stat.st_size, tail)
+                else:
+                    modified = self.date_time_string(stat.st_mtime)
+                    headers = [("Accept-Ranges", "bytes"), ("Last-Modified", modified)]
+                    status, start, stop = self.requested_range(stat.st_size, modified)
+                    if status == 416:
+                        self.send_response(416)
+                        self.send_header("Content-Range", "bytes */{0}".format(stop))
+                        self.send_header("Content-length", 0)
+                        self.end_headers()
+                        return
+                    if status == 206:
+                        content_range = "bytes {0}-{1}/{2}".format(
+                            start, stop - 1, stat.st_size
+                        )
+                        headers.append(("Content-Range", content_range))
+                in_file.seek(start)
+                size = stop - start
+                blocks = self.read_blocks(in_file)
+            # A range is a part of the uncompressed file
+            encoding = self.accepted_encoding(size) if status == 200 else None
+            self.send_response(status)
+            self.send_header("Content-type", "text")
+            self.send_header("Vary", "Accept-Encoding")
+            for name, value in headers:
+                self.send_header(name, value)
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+                blocks = self.compress_blocks(blocks, encoding)
+            if size is not None and not encoding:
+                self.send_header("Content-length", size)
+                self.end_headers()
+                self.copy_file(in_file, size)
+            elif self.request_version == "HTTP/1.0":
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for block in blocks:
+                    self.wfile.write(block)
+            else:
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self.copy_chunked(blocks)
+        finally:
+            in_file.close()
+
+    def requested_range(self, size, modified):
+        """Return (status, start, stop) for the Range header of a file of size bytes.
+
+        The status is 206 for a single byte range, 416 (with stop = size) for a
+        range after the end of the file, or 200 for the whole file; also if the
+        file was modified since If-Range, or for a list of ranges.
+        """
+
+        whole = (200, 0, size)
+        text = (self.headers.get("Range") or "").replace(" ", "")
+        if not text.startswith("bytes=") or "," in text:
+            return whole
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range.strip() != modified:
+            return whole
+        first, _, last = text[len("bytes=") :].partition("-")
+        try:
+            if first:
+                start = int(first)
+                stop = min(int(last) + 1, size) if last else size
+                if last and int(last) < start:
+                    return whole
+            else:
+                # The last bytes of the file
+                start, stop = max(0, size - int(last)), size
+                if int(last) == 0:
+                    return (416, 0, size)
+        except ValueError:
+            return whole
+        if start >= size:
+            return (416, 0, size)
+        return (206, start, stop)
+
+    def tail_offset(self, in_file, size, lines, block_size=64 * 1024):
+        """Return the offset of the last lines lines of in_file (of size bytes).
+
+        The file is read backwards from the end, a block at a time.
+        """
+
+        newline = self.newline(in_file.read(block_size))
+        end = size
+        in_file.seek(max(0, size - len(newline)))
+        if in_file.read(len(newline)) == newline:
+            # The newline at the end of the file does not start another line
+            end -= len(newline)
+        while end > 0:
+            # The blocks start at even offsets (for a two byte newline)
+            start = max(0, end - block_size)
+            in_file.seek(start)
+            block = in_file.read(end - start)
+            for pos in reversed(newline_positions(block, newline)):
+                lines -= 1
+                if lines == 0:
+                    return start + pos + len(newline)
+            end = start
+        return 0
+
+    def gzip_tail(self, raw_file, filename, lines, block_size=64 * 1024):
+        """Yield the blocks of the last lines lines of a compressed log file.
+
+        The lines after the start of the file, or (with the processor's line
+        index) the last blocks of the index, are decompressed twice: to count
+        the lines, and to send the last lines.
+        """
+
+        offset = 0
+        newline = None
+        index = self.read_log_index(filename)
+        if index and index["offsets"]:
+            count = lines // index["lines_per_block"] + 2
+            offset = index["offsets"][max(0, len(index["offsets"]) - count)]
+            newline = self.newline(b"", index["encoding"])
+        raw_file.seek(offset)
+        count = 0
+        last = b""
+        for block in self.read_blocks(gzip.GzipFile(fileobj=raw_file, mode="rb")):
+            if newline is None:
+                newline = self.newline(block)
+            count += len(newline_positions(block, newline))
+            last = block
+        if last and not last.endswith(newline):
+            count += 1
+        # The number of newlines before the first line to send
+        skip = max(0, count - lines)
+        raw_file.seek(offset)
+        for block in self.read_blocks(gzip.GzipFile(fileobj=raw_file, mode="rb")):
+            if skip:
+                positions = newline_positions(block, newline)
+                if len(positions) < skip:
+                    skip -= len(positions)
+                    continue
+                block = block[positions[skip - 1] + len(newline) :]
+                skip = 0
+            yield block
+
+    def newline(self, head, encoding=None):
+        """Return the bytes of a newline in a log file that starts with head."""
+
+        if encoding is None:
+            encoding = self.guess_encoding(head)
+        if encoding == "utf-16":
+            # The byte order is in the BOM
+            if head.startswith(codecs.BOM_UTF16_LE):
+                encoding = "utf-16-le"
+            else:
+                encoding = "utf-16-be"
+        if encoding.startswith("utf-16"):
+            return "\n".encode(encoding)
+        return b"\n"
+
+    def copy_file(self, in_file, size, block_size=64 * 1024):
+        """Copy size bytes of in_file (a log may still be growing) to the response.
+
+        The copy starts at the current position of in_file.  Without TLS, the
+        operating system sends the file (sendfile), where it can.
+        """
+
+        tls = isinstance(self.connection, ssl.SSLSocket)
+        if size and hasattr(os, "sendfile") and not tls:
+            sent = self.connection.sendfile(in_file, in_file.tell(), size)
+            if sent < size:
+                # The file was truncated; the client can only tell if we close
+                self.close_connection = True
+            return
+        while size > 0:
+            data = in_file.read(min(size, block_size))
+            if not data:
+                self.close_connection = True
+                return
+            self.wfile.write(data)
+            size -= len(data)
+
+    def read_blocks(self, in_file, block_size=64 * 1024):
+        """Yield the blocks of in_file (from its current position)."""
+
+        while True:
+            data = in_file.read(block_size)
+            if not data:
+                break
+            yield data
+
+    def compress_blocks(self, blocks, encoding):
+        """Yield the blocks compressed with encoding (gzip or deflate)."""
+
+        compressor = make_compressor(encoding)
+        for data in blocks:
+            yield compressor.compress(data)
+        yield compressor.flush()
+
+    def copy_chunked(self, blocks):
+        """Copy the blocks to the response with the chunked transfer encoding."""
+
+        for data in blocks:
+            # An empty chunk ends the response
+            if data:
+                chunk_size = "{0:x}\r\n".format(len(data)).encode("ascii")
+                self.wfile.write(chunk_size + data + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def find_log_file(self, filename, date):
+        """Return the path to the log file filename (from the logs table) or None.
+
+        The log file is in the archive folder for the year of date (compressed
+        or not), or still in the log folder.
+        """
+
+        filename = os.path.basename(filename)
+        folder = os.path.dirname(Config.log_database)
+        archive = date[:4] + "archive"
+        path = os.path.join(folder, archive, filename)
+        for name in [path, path + ".gz", os.path.join(folder, filename)]:
+            if os.path.exists(name):
+                return name
+        return None
+
+    def read_log_lines(self, filename, first, last):
+        """Return a list of [line number, text] for lines first to last of filename.
+
+        If the processor wrote a line index (filename.idx), start reading at the
+        block with the first line, otherwise read from the start of the file.
+        A compressed (*.gz) file is decompressed as it is read.
+        """
+
+        index = self.read_log_index(filename)
+        offset = 0
+        line_num = 1
+        encoding = None
+        if index and index["offsets"]:
+            block = max(0, (first - 1) // index["lines_per_block"])
+            block = min(block, len(index["offsets"]) - 1)
+            offset = index["offsets"][block]
+            line_num = block * index["lines_per_block"] + 1
+            encoding = index["encoding"]
+        lines = []
+        with open(filename, "rb") as raw_file:
+            raw_file.seek(offset)
+            binary_file = raw_file
+            if filename.endswith(".gz"):
+                # BufferedReader adds the read1() that TextIOWrapper needs in Python 2
+                binary_file = io.BufferedReader(
+                    gzip.GzipFile(fileobj=raw_file, mode="rb")
+                )
+            if encoding is None:
+                encoding = self.guess_encoding(binary_file.peek(64 * 1024))
+            # Split lines on \n only, like the processor; some lines end with \r\r\n
+            text_file = io.TextIOWrapper(
+                binary_file, encoding=encoding, errors="replace", newline="\n"
+            )
+            for text in text_file:
+                if line_num > last:
+                    break
+                if line_num >= first:
+                    if line_num == 1:
+                        text = text.lstrip("\ufeff")
+                    lines.append([line_num, text.rstrip("\r\n")])
+                line_num += 1
+        return lines
+
+    def read_log_index(self, filename):
+        """Return the processor's line index (a dict) for the log filename, or None."""
+
+        index_name = filename[:-3] if filename.endswith(".gz") else filename
+        try:
+            with open(index_name + ".idx", "rb") as index_file:
+                return json.loads(index_file.read().decode("utf-8"))
+        except (IOError, ValueError):
+            return None
+
+    def guess_encoding(self, head):
+        """Return the encoding of a log file that starts with the bytes in head."""
+
+        if head.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return "utf-16"
+        if head.count(b"\x00") > len(head) // 4:
+            # UTF-16 without a BOM; the high byte of ASCII characters is zero
+            if head[1::2].count(b"\x00") > head[::2].count(b"\x00"):
+                return "utf-16-le"
+            return "utf-16-be"
+        try:
+            # An incremental decoder allows a partial character at the end of head
+            codecs.getincrementaldecoder("utf-8")().decode(head)
+        except UnicodeDecodeError:
+            return "cp1252"
+        return "utf-8"
 
     def err_response(self, message):
         """Respond with an error message."""
@@ -460,8 +1080,14 @@ class SyncHandler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Handle a POST request."""
 
+        # Read the body, so the connection is ready for the next request
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > 0:
+            self.rfile.read(length)
         if self.path == "/sync":
             self.err_response("not implemented")
+        else:
+            self.err_response(self.usage)
 
     def end_headers(self):
         """Send the end of a header."""
@@ -469,6 +1095,11 @@ class SyncHandler(BaseHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Origin", "*")
         BaseHTTPRequestHandler.end_headers(self)
 
+    def db_connection(self):
+        """Return a context manager with a read-only connection to the database."""
+
+        return self.server.pool.connection()
+
     def db_get_rows(self, database, sql, params, header=True):
         """Execute sql on the database and return the resulting rows."""
 
@@ -529,13 +1160,371 @@ class SyncHandler(BaseHTTPRequestHandler):
         return park
 
 
-if Config.secure:
-    # For more info on https see: https://gist.github.com/dergachev/7028596
-    server = HTTPServer(("", 8443), SyncHandler)
-    server.socket = ssl.wrap_socket(
-        server.socket, keyfile="key.pem", certfile="cert.pem", server_side=True
-    )
-else:
-    server = HTTPServer(("", 8080), SyncHandler)
+def connect_read_only(db_name):
+    """Return a read-only connection to db_name that any thread can use.
+
+    Python 2 does not open URI file names (mode=ro), so the connection is made
+    read-only with the query_only pragma.
+    """
+
+    try:
+        uri = "file:{0}?mode=ro".format(pathname2url(os.path.abspath(db_name)))
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+    except TypeError:
+        conn = sqlite3.connect(db_name, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+
+class ConnectionPool(object):
+    """A pool of read-only connections to a database, shared by the server threads.
+
+    A connection is opened when a thread needs one and none are idle; no more
+    than size connections are open.
+    """
+
+    # pylint: disable=useless-object-inheritance,too-few-public-methods
+
+    def __init__(self, db_name, size):
+        self.db_name = db_name
+        self.idle = queue.LifoQueue()
+        self.available = threading.BoundedSemaphore(size)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Return a context manager with a connection from the pool."""
+
+        self.available.acquire()
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = connect_read_only(self.db_name)
+            try:
+                yield conn
+            finally:
+                self.idle.put(conn)
+        finally:
+            self.available.release()
+
+
+def newline_positions(block, newline):
+    """Return the positions of newline in block.
+
+    A two byte (UTF-16) newline must start at an even position.
+    """
+
+    positions = []
+    pos = block.find(newline)
+    while pos != -1:
+        if pos % len(newline) == 0:
+            positions.append(pos)
+        pos = block.find(newline, pos + 1)
+    return positions
+
+
+def make_compressor(encoding):
+    """Return a zlib compressor for the gzip or deflate (zlib) content encoding."""
+
+    wbits = zlib.MAX_WBITS + 16 if encoding == "gzip" else zlib.MAX_WBITS
+    return zlib.compressobj(Config.compress_level, zlib.DEFLATED, wbits)
+
+
+class ResponseCache(object):
+    """A least recently used cache of encoded responses, with a maximum size in bytes.
+
+    The cache is cleared when PRAGMA data_version (on the cache's own connection)
+    changes, i.e. another connection has committed a change to the database.
+    This is checked at most every Config.cache_check_seconds.  A response made
+    from the database before a change is not cached after the change is seen.
+    """
+
+    # pylint: disable=useless-object-inheritance
+
+    def __init__(self, db_name, size):
+        self.db_name = db_name
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        # Held by the one thread that is checking the database (see check())
+        self.check_lock = threading.Lock()
+        self.checked = 0.0
+        # Opened when first used, which is after the server processes are forked
+        self.database = None
+        self.data_version = None
+        self.version = 0
+
+    def check(self):
+        """Clear the cache if the database has changed; return the cache version.
+
+        Only one thread runs the query, at most every Config.cache_check_seconds;
+        the others return the current version without waiting for it.
+        """
+
+        if time.time() - self.checked < Config.cache_check_seconds:
+            return self.version
+        if not self.check_lock.acquire(False):
+            return self.version
+        try:
+            if self.database is None:
+                self.database = connect_read_only(self.db_name)
+            row = self.database.execute("PRAGMA data_version").fetchone()
+            self.checked = time.time()
+            if row[0] != self.data_version:
+                with self.lock:
+                    self.data_version = row[0]
+                    self.version += 1
+                    self.entries.clear()
+                    self.bytes = 0
+        finally:
+            self.check_lock.release()
+        return self.version
+
+    def get(self, key):
+        """Return the entry for key, or None."""
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                # Now the most recently used
+                self.entries[key] = entry
+            return entry
+
+    def put(self, key, version, entry):
+        """Add entry (data, etag) for key, if it was made with this version."""
+
+        size = len(entry[0])
+        with self.lock:
+            if version != self.version or size > self.size:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[0])
+            self.entries[key] = entry
+            self.bytes += size
+            while self.bytes > self.size:
+                _, old = self.entries.popitem(last=False)
+                self.bytes -= len(old[0])
+
+
+class WarmHandler(SyncHandler):
+    """A SyncHandler without a socket, that caches the response to a GET request.
+
+    The response is cached for a web browser (that accepts gzip compression).
+    """
+
+    # pylint: disable=super-init-not-called,unused-argument
+
+    def __init__(self, path, server):
+        self.path = path
+        self.server = server
+        self.headers = {"Accept-Encoding": "gzip, deflate"}
+
+    def send_json(self, data, etag, encoding=None):
+        pass
+
+    def err_response(self, message):
+        pass
+
+
+class PoolHTTPServer(HTTPServer):
+    """An HTTP server that handles the requests in a fixed number of threads.
+
+    The main thread accepts the connections and queues them for the worker
+    threads (see threads and queued_requests in the Config object), which are
+    started by serve_forever().  The workers share a pool of read-only
+    connections to db_name (default is the handler's db_name), and a cache of
+    responses, which is pre-warmed after the database changes.
+    """
+
+    request_queue_size = Config.queued_requests
+
+    def __init__(self, server_address, RequestHandlerClass, threads=None, db_name=None):
+        HTTPServer.__init__(self, server_address, RequestHandlerClass)
+        if threads is None:
+            threads = Config.threads
+        if db_name is None:
+            db_name = RequestHandlerClass.db_name
+        self.threads = threads
+        self.pool = ConnectionPool(db_name, threads)
+        self.cache = None
+        if Config.cache_size > 0:
+            self.cache = ResponseCache(db_name, Config.cache_size)
+        self.requests = queue.Queue(Config.queued_requests)
+        self.workers = []
+
+    def serve_forever(self, poll_interval=0.5):
+        """Start the worker threads (in this process) and handle requests."""
+
+        # Threads do not survive a fork, so each process starts its own.
+        if not any(worker.is_alive() for worker in self.workers):
+            self.workers = []
+            for index in range(self.threads):
+                worker = threading.Thread(
+                    target=self.handle_requests, name="worker-{0}".format(index)
+                )
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+            if self.cache is not None:
+                worker = threading.Thread(target=self.warm_cache, name="warm-cache")
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+        HTTPServer.serve_forever(self, poll_interval)
+
+    def warm_cache(self):
+        """Cache the responses for Config.warm_paths after a database change."""
+
+        warmed = None
+        last = None
+        while True:
+            try:
+                version = self.cache.check()
+                if version == last and version != warmed:
+                    for path in Config.warm_paths:
+                        WarmHandler(path, self).do_GET()
+                    warmed = version
+                last = version
+            except Exception as ex:
+                sys.stderr.write("Cache not warmed: {0}\n".format(ex))
+            time.sleep(Config.cache_poll_seconds)
+
+    def process_request(self, request, client_address):
+        """Queue the request for a worker thread."""
+
+        self.requests.put((request, client_address))
+
+    def busy(self):
+        """Return True if accepted connections are waiting for a worker thread."""
+
+        return not self.requests.empty()
+
+    def finish_request(self, request, client_address):
+        """Do the TLS handshake (in the worker thread), and handle the requests."""
+
+        request.settimeout(Config.request_timeout)
+        if isinstance(request, ssl.SSLSocket):
+            try:
+                request.do_handshake()
+            except socket.error:
+                # A client that does not trust the certificate, or a port scan
+                return
+        HTTPServer.finish_request(self, request, client_address)
+
+    def handle_requests(self):
+        """Handle the queued requests (runs in each worker thread)."""
+
+        while True:
+            request, client_address = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+def make_server(address=None, secure=None, threads=None, db_name=None):
+    """Return a server for SyncHandler, ready for serve_forever() or serve().
+
+    The defaults are from the Config object; the default address is port 8443
+    for a secure (https) server, and port 8080 for an http server.
+    """
+
+    if secure is None:
+        secure = Config.secure
+    if address is None:
+        address = ("", 8443 if secure else 8080)
+    server = PoolHTTPServer(address, SyncHandler, threads, db_name)
+    if secure:
+        # For more info on https see: https://gist.github.com/dergachev/7028596
+        # The handshake is done by the worker thread, so a slow client does not
+        # delay accepting the other connections.
+        server.socket = make_ssl_context().wrap_socket(
+            server.socket, server_side=True, do_handshake_on_connect=False
+        )
+    return server
+
+
+def make_ssl_context(certfile="cert.pem", keyfile="key.pem"):
+    """Return the TLS context for all of the server's connections.
+
+    The context holds the session cache and the session ticket key, so a client
+    can resume its TLS session on a new connection without a full handshake.
+    The key is made before the server processes are forked, so they share it.
+    """
+
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    # Session tickets are on by default; make sure (Python 2 has no OP_NO_TICKET)
+    context.options &= ~getattr(ssl, "OP_NO_TICKET", 0)
+    return context
+
+
+def serve(server, processes=None):
+    """Handle the server's requests in processes processes until interrupted.
+
+    The child processes are forked after the server's socket is listening, and
+    accept connections on the same socket.  The parent process restarts a child
+    that exits, and stops the children when it is stopped (SIGTERM or Ctrl-C).
+    Without os.fork() (i.e. on Windows), the requests are handled in this process.
+    """
+
+    if processes is None:
+        processes = Config.processes
+    if processes < 2 or not hasattr(os, "fork"):
+        server.serve_forever()
+        return
+    children = {}
+
+    def start_child():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                # Never return to the parent's code
+                os._exit(1)  # pylint: disable=protected-access
+        children[pid] = time.time()
+
+    def stop(signum, frame):  # pylint: disable=unused-argument
+        raise SystemExit(0)
+
+    try:
+        for _ in range(processes):
+            start_child()
+        signal.signal(signal.SIGTERM, stop)
+        while True:
+            try:
+                pid, status = os.wait()
+            except OSError:
+                # Interrupted by a signal
+                continue
+            started = children.pop(pid, None)
+            if started is None:
+                continue
+            sys.stderr.write(
+                "Server process {0} exited (status {1}); restarting\n".format(
+                    pid, status
+                )
+            )
+            if time.time() - started < Config.restart_delay:
+                time.sleep(Config.restart_delay)
+            start_child()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        server.server_close()
+
 
-server.serve_forever()
+if __name__ == "__main__":
+    serve(make_server())